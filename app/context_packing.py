@@ -0,0 +1,214 @@
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app import settings
+from app.tokenizer import count_offloaded, counts_exactly, get_tokenizer, match_model_family, token_index
+
+logger = logging.getLogger(__name__)
+
+# Context windows (tokens) of known model families, matched by
+# match_model_family. A more specific family comes before its parent.
+KNOWN_CONTEXT_WINDOWS = (
+    ("gpt-4.1", 1047576),
+    ("gpt-4.5", 128000),
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo-instruct", 4096),
+    ("gpt-3.5-turbo", 16385),
+    ("o1-mini", 128000),
+    ("o1-preview", 128000),
+    ("o1", 200000),
+    ("o3", 200000),
+    ("o4-mini", 200000),
+    ("claude", 200000),
+    ("gemini-pro", 32760),
+    ("gemini-1.0", 32760),
+    ("gemini", 1048576),
+)
+
+
+@dataclass
+class FileCandidate:
+    path: str
+    score: float
+
+
+@dataclass
+class PackedFile:
+    path: str
+    tokens: int
+    score: float
+    summarized: bool = False
+
+
+def file_header(path: str) -> str:
+    return f"\n--- {path} ---\n"
+
+
+def context_window(model: Optional[str]) -> int:
+    if settings.MODEL_CONTEXT_TOKENS:
+        return settings.MODEL_CONTEXT_TOKENS
+    return match_model_family(model, KNOWN_CONTEXT_WINDOWS) or settings.DEFAULT_CONTEXT_TOKENS
+
+
+def reserved_output_tokens(model: Optional[str]) -> int:
+    # Small context windows never give more than a quarter to the answer
+    return min(settings.RESERVED_OUTPUT_TOKENS, context_window(model) // 4)
+
+
+def context_budget(model: Optional[str], used_tokens: int) -> int:
+    """
+    Tokens left for file context after the prompt and the reserved output allowance.
+
+    The whole prompt is also held to PACKING_MAX_CONTEXT_TOKENS, so a model
+    with a million-token window does not get a million-token prompt. For
+    models whose tokens are only estimated, TOKEN_ESTIMATE_MARGIN of the
+    window is kept free in case the estimate runs low.
+    """
+    window = context_window(model)
+    if settings.PACKING_MAX_CONTEXT_TOKENS:
+        window = min(window, settings.PACKING_MAX_CONTEXT_TOKENS)
+    if not counts_exactly(model):
+        window -= int(window * settings.TOKEN_ESTIMATE_MARGIN)
+    return max(0, window - reserved_output_tokens(model) - used_tokens)
+
+
+def rank_file_candidates(responses: list, ignore_files: List[str], max_candidates: int) -> List[FileCandidate]:
+    """
+    Merge infer-file results into one relevance ranked candidate list.
+
+    Scores are normalized per path type so each type sums to its weight:
+    commit paths by similarity, file and localization paths by rank. A path
+    that several types agree on adds up their scores. Commit and
+    localization paths weigh 1.0; "file" paths weigh
+    PACKING_FILE_PATH_WEIGHT, 0 by default, which leaves them out as the
+    fixed per-strength file counts always did.
+    """
+    weights = {"commit": 1.0, "localization": 1.0, "file": settings.PACKING_FILE_PATH_WEIGHT}
+    type_scores: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    type_ranks: Dict[str, int] = defaultdict(int)
+
+    for response in responses:
+        if not weights.get(response.path_type):
+            continue
+        for entry in response.file_paths:
+            if response.path_type == "commit":
+                type_scores["commit"][entry.path] += response.similarity
+            else:
+                scores = type_scores[response.path_type]
+                if entry.path not in scores:
+                    type_ranks[response.path_type] += 1
+                    scores[entry.path] = 1.0 / type_ranks[response.path_type]
+
+    combined: Dict[str, float] = defaultdict(float)
+    for path_type, scores in type_scores.items():
+        total = sum(scores.values())
+        if not total:
+            continue
+        for path, score in scores.items():
+            combined[path] += weights[path_type] * score / total
+
+    ignored = set(ignore_files or [])
+    ranked = sorted(
+        (FileCandidate(path=path, score=score) for path, score in combined.items() if path not in ignored),
+        key=lambda candidate: candidate.score,
+        reverse=True,
+    )
+    return ranked[:max_candidates]
+
+
+class PromptBuilder:
+    """
+    Assembles the prompt in a single join while enforcing the token budget.
+
+    Files are added in any order with their rank and joined in rank order
+    by ``build``, so the full prompt is materialized exactly once instead
+    of being re-copied by repeated string concatenation.
+    """
+
+    def __init__(self, head: str, budget: int):
+        self.head = head
+        self.budget = budget
+        self.used_tokens = 0
+        self._entries: Dict[int, tuple] = {}
+
+    @property
+    def remaining(self) -> int:
+        return self.budget - self.used_tokens
+
+    def try_add(self, rank: int, path: str, text: str, tokens: int) -> bool:
+        if tokens > self.remaining:
+            return False
+        self._entries[rank] = (file_header(path), text)
+        self.used_tokens += tokens
+        return True
+
+    def build(self) -> str:
+        parts = [self.head]
+        for rank in sorted(self._entries):
+            header, text = self._entries[rank]
+            parts.append(header)
+            parts.append(text)
+            parts.append("\n")
+        # Drop references to file texts once they live in the joined prompt
+        self._entries.clear()
+        return "".join(parts)
+
+
+async def pack_context(
+    project: str,
+    model: Optional[str],
+    candidates: List[FileCandidate],
+    contents: Dict[str, str],
+    builder: PromptBuilder,
+    fetch_summaries: Optional[Callable[[List[str]], Awaitable[Dict[str, str]]]] = None,
+) -> List[PackedFile]:
+    """
+    Choose file contents for the prompt under the builder's token budget.
+
+    Candidates are taken greedily in descending relevance. A file whose full
+    content would overflow the budget is skipped so smaller files further
+    down can still use the space; skipped files are then offered as their
+    summary if ``fetch_summaries`` is given. The result is in relevance order.
+    """
+    tokenizer = get_tokenizer(model)
+    packed: Dict[str, PackedFile] = {}
+    overflowed: List[tuple] = []
+
+    for rank, candidate in enumerate(candidates):
+        content = contents.get(candidate.path)
+        if content is None:
+            continue
+        tokens = (
+            tokenizer.count(file_header(candidate.path))
+            + await token_index.count(tokenizer, project, candidate.path, content)
+        )
+        if builder.try_add(rank, candidate.path, content, tokens):
+            packed[candidate.path] = PackedFile(candidate.path, tokens, candidate.score)
+        else:
+            overflowed.append((rank, candidate))
+
+    if overflowed and fetch_summaries is not None and builder.remaining > 0:
+        try:
+            summaries = await fetch_summaries([candidate.path for _, candidate in overflowed])
+        except Exception as e:
+            logger.warning("Could not fetch file summaries for packing: %s", e)
+            summaries = {}
+        for rank, candidate in overflowed:
+            summary = summaries.get(candidate.path)
+            if not summary:
+                continue
+            tokens = tokenizer.count(file_header(candidate.path)) + await count_offloaded(tokenizer, summary)
+            if builder.try_add(rank, candidate.path, summary, tokens):
+                packed[candidate.path] = PackedFile(candidate.path, tokens, candidate.score, summarized=True)
+
+    logger.info(
+        "Packed %d of %d candidate files into %d of %d budget tokens (%d summarized)",
+        len(packed), len(candidates), builder.used_tokens, builder.budget,
+        sum(1 for entry in packed.values() if entry.summarized),
+    )
+    return [packed[candidate.path] for candidate in candidates if candidate.path in packed]
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict
+
+from app.metrics import LLM_HEDGE_WINS
+from app.utils import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+ALTERNATE = "alternate"
+
+
+async def hedged_stream(
+    open_primary: Callable[[], AsyncIterator[str]],
+    open_alternate: Callable[[], AsyncIterator[str]],
+    delay: float,
+    providers: Dict[str, str],
+) -> AsyncIterator[str]:
+    """
+    Stream from the primary provider, hedging with the alternate one.
+
+    If the primary has not produced its first token within ``delay``
+    seconds, or fails before doing so, the same request is started on the
+    alternate provider. Whichever stream yields a first token wins; the
+    other is cancelled and the winner is streamed to the end.
+    """
+    started = time.monotonic()
+    streams = {PRIMARY: open_primary()}
+    pending = {asyncio.ensure_future(streams[PRIMARY].__anext__()): PRIMARY}
+    errors: Dict[str, BaseException] = {}
+
+    def start_alternate() -> None:
+        logger.info("Hedging LLM request on %s", providers[ALTERNATE])
+        streams[ALTERNATE] = open_alternate()
+        pending[asyncio.ensure_future(streams[ALTERNATE].__anext__())] = ALTERNATE
+
+    try:
+        winner = None
+        first_token = None
+        timeout = delay
+        while winner is None:
+            if not pending:
+                # Both sides failed before their first token
+                raise errors.get(PRIMARY) or errors[ALTERNATE]
+            done, _ = await asyncio.wait(set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                timeout = None
+                start_alternate()
+                continue
+            for task in done:
+                role = pending.pop(task)
+                try:
+                    first_token = task.result()
+                except StopAsyncIteration:
+                    first_token = None
+                except Exception as e:
+                    logger.warning("LLM stream from %s failed before its first token: %s", providers[role], e)
+                    errors[role] = e
+                    if ALTERNATE not in streams:
+                        timeout = None
+                        start_alternate()
+                    continue
+                winner = role
+                break
+
+        loser_tasks = list(pending)
+        pending.clear()
+        await cancel_tasks(*loser_tasks)
+        for role, stream in list(streams.items()):
+            if role != winner:
+                await stream.aclose()
+                del streams[role]
+
+        LLM_HEDGE_WINS.inc(provider=providers[winner], role=winner)
+        logger.info(
+            "Hedged LLM stream won by %s (%s) after %.3fs",
+            winner, providers[winner], time.monotonic() - started,
+        )
+
+        if first_token is None:
+            return
+        yield first_token
+        async for token in streams[winner]:
+            yield token
+    finally:
+        await cancel_tasks(*pending)
+        for stream in streams.values():
+            await stream.aclose()
@@ -0,0 +1,126 @@
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app import settings
+from app.metrics import UPSTREAM_BYTES, UPSTREAM_DURATION, UPSTREAM_REQUESTS
+from app.tracing import TRACE_HEADER, current_trace_id, record_span, wall_time_since
+
+logger = logging.getLogger(__name__)
+
+# One pooled client for the whole process, opened and closed by the app lifespan.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Upstream endpoints get their own metric labels; anything else is "other"
+UPSTREAM_ENDPOINTS = frozenset((
+    "/test-pull-access/",
+    "/infer-file/",
+    "/retrieve-file-contents/",
+    "/get-file-summary/",
+    "/file-edit/",
+    "/new-files/",
+))
+
+
+def upstream_endpoint(url: httpx.URL) -> str:
+    return url.path if url.path in UPSTREAM_ENDPOINTS else "other"
+
+
+async def _record_request(request: httpx.Request) -> None:
+    request.extensions["machtiani_started"] = time.monotonic()
+    trace_id = current_trace_id.get()
+    if trace_id is not None:
+        request.headers[TRACE_HEADER] = trace_id
+
+
+async def _record_response(response: httpx.Response) -> None:
+    request = response.request
+    endpoint = upstream_endpoint(request.url)
+    started = request.extensions.get("machtiani_started")
+    if started is not None:
+        duration = time.monotonic() - started
+        UPSTREAM_DURATION.observe(duration, endpoint=endpoint)
+        record_span(
+            request.headers.get(TRACE_HEADER), request.url.path, "upstream",
+            wall_time_since(started), duration, status=response.status_code,
+        )
+    UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    UPSTREAM_BYTES.inc(int(request.headers.get("content-length", 0)), endpoint=endpoint, direction="out")
+    UPSTREAM_BYTES.inc(int(response.headers.get("content-length", 0)), endpoint=endpoint, direction="in")
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """Create the pooled client from the configured limits and timeouts."""
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+    if http2 and not settings.COMMIT_FILE_RETRIEVAL_URL.startswith("https://"):
+        logger.warning(
+            "HTTP2_ENABLED has no effect on %s: httpx only negotiates HTTP/2 over TLS",
+            settings.COMMIT_FILE_RETRIEVAL_URL,
+        )
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        read=settings.HTTP_READ_TIMEOUT,
+        write=settings.HTTP_WRITE_TIMEOUT,
+        pool=settings.HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=timeout,
+        # Responses are timed when their headers arrive; commit-file-retrieval
+        # only sends them once the work is done
+        event_hooks={"request": [_record_request], "response": [_record_response]},
+    )
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = build_http_client()
+        logger.info("Shared HTTP client started")
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Shared HTTP client closed")
+    _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it if the lifespan has not run."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = build_http_client()
+    return _client
+
+
+def stage_timeout(stage: str) -> httpx.Timeout:
+    """Timeout for one upstream stage, overriding only the read timeout."""
+    return httpx.Timeout(
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        read=settings.HTTP_STAGE_READ_TIMEOUTS.get(stage, settings.HTTP_READ_TIMEOUT),
+        write=settings.HTTP_WRITE_TIMEOUT,
+        pool=settings.HTTP_POOL_TIMEOUT,
+    )
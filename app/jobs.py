@@ -0,0 +1,373 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app import settings
+from app.metrics import Counter
+from app.streaming import event_line
+from app.utils import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# The gateway stopped while the job was queued or running
+INTERRUPTED = "interrupted"
+
+JOBS = Counter(
+    "machtiani_jobs_total",
+    "Asynchronous jobs by final status.",
+    ("status",),
+)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """
+    Jobs and their events in a local sqlite3 database.
+
+    Each job records ``owner``, a digest of the credential that submitted
+    it, and lookups only match jobs with the same owner. A job expires
+    ``ttl`` seconds after its last status change, so a finished job is
+    kept for the full ``ttl`` however long it queued or ran.
+
+    Methods are blocking and serialized by a lock; the job manager calls
+    them through worker threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL,"
+            " error TEXT, event_count INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL,"
+            " owner TEXT NOT NULL DEFAULT '')"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            # Jobs from before owners were recorded match no caller and expire as usual
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)")
+        self._conn = conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def create(self, job_id: str, owner: str, request: dict, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, owner, status, request, created_at, updated_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, QUEUED, json.dumps(request), now, now, now + ttl),
+            )
+
+    def set_status(self, job_id: str, status: str, ttl: float, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, expires_at = ? WHERE id = ?",
+                (status, error, now, now + ttl, job_id),
+            )
+
+    def append_events(self, job_id: str, first_seq: int, lines: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                [(job_id, first_seq + index, line) for index, line in enumerate(lines)],
+            )
+            self._conn.execute(
+                "UPDATE jobs SET event_count = ?, updated_at = ? WHERE id = ?",
+                (first_seq + len(lines) - 1, time.time(), job_id),
+            )
+
+    def get(self, job_id: str, owner: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, error, event_count, created_at, updated_at, expires_at"
+                " FROM jobs WHERE id = ? AND owner = ? AND expires_at > ?",
+                (job_id, owner, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "status", "error", "event_count", "created_at", "updated_at", "expires_at")
+        return dict(zip(keys, row))
+
+    def events(self, job_id: str, after: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+
+    def request(self, job_id: str, owner: str) -> Optional[dict]:
+        """The stored, credential-free request of an unexpired job."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT request FROM jobs WHERE id = ? AND owner = ? AND expires_at > ?",
+                (job_id, owner, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def requeue_interrupted(self, job_id: str, ttl: float) -> bool:
+        """Queue an interrupted job again from the start, dropping its partial events."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, event_count = 0, updated_at = ?, expires_at = ?"
+                " WHERE id = ? AND status = ? AND expires_at > ?",
+                (QUEUED, now, now + ttl, job_id, INTERRUPTED, now),
+            ).rowcount
+            if updated:
+                self._conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            return bool(updated)
+
+    def interrupt_unfinished(self, ttl: float) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, expires_at = ? WHERE status IN (?, ?)",
+                (INTERRUPTED, "The gateway restarted before the job finished.", now, now + ttl, QUEUED, RUNNING),
+            )
+            return cursor.rowcount
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            now = time.time()
+            self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE expires_at <= ?)", (now,)
+            )
+            return self._conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,)).rowcount
+
+
+class _LiveJob:
+    """A queued or running job: its events so far, for attached readers."""
+
+    def __init__(self, run: Callable[[], AsyncIterator[Any]]):
+        self.run = run
+        self.events: List[str] = []
+        self.changed = asyncio.Condition()
+        self.done = False
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+
+class JobManager:
+    """
+    Runs submitted generate-response jobs on a pool of workers.
+
+    Events are appended to the store in batches, so a job's output survives
+    the connection that submitted it and can be polled or attached to until
+    it expires. Callers name the job's ``owner``, a digest of their
+    credential; a job is only visible to the owner that submitted it.
+    Credentials are only held in memory: a job that is queued or
+    running when the gateway stops is marked interrupted on the next start,
+    and runs again from the start once ``resume`` supplies them again.
+
+    Jobs are optional: if the store cannot be opened the manager stays
+    unavailable and the rest of the gateway starts as usual.
+    """
+
+    def __init__(self, store: JobStore, workers: int, queue_size: int, ttl: float, flush_events: int):
+        self.store = store
+        self.workers = workers
+        self.ttl = ttl
+        self.flush_events = max(1, flush_events)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._live: Dict[str, _LiveJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.available = False
+
+    async def start(self) -> None:
+        try:
+            await asyncio.to_thread(self.store.open)
+        except (OSError, sqlite3.Error) as e:
+            logger.error("Jobs are disabled, could not open the job store at %s: %s", self.store.path, e)
+            return
+        self.available = True
+        interrupted = await asyncio.to_thread(self.store.interrupt_unfinished, self.ttl)
+        purged = await asyncio.to_thread(self.store.purge_expired)
+        if interrupted or purged:
+            logger.info("Job store: %d jobs interrupted by a restart, %d expired jobs purged", interrupted, purged)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_periodically()))
+
+    async def stop(self) -> None:
+        await cancel_tasks(*self._tasks, *(live.task for live in self._live.values()))
+        self._tasks = []
+        if self.available:
+            await asyncio.to_thread(self.store.close)
+            self.available = False
+
+    async def submit(self, owner: str, request: dict, run: Callable[[], AsyncIterator[Any]]) -> str:
+        """Queue ``run`` as a job; ``request`` is its credential-free description."""
+        if self._queue.full():
+            raise JobQueueFull()
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, owner, request, self.ttl)
+        await self._enqueue(job_id, run)
+        return job_id
+
+    async def request(self, job_id: str, owner: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.request, job_id, owner)
+
+    async def resume(self, job_id: str, run: Callable[[], AsyncIterator[Any]]) -> bool:
+        """Run an interrupted job again with ``run``; False if it is not interrupted."""
+        if self._queue.full():
+            raise JobQueueFull()
+        if not await asyncio.to_thread(self.store.requeue_interrupted, job_id, self.ttl):
+            return False
+        await self._enqueue(job_id, run)
+        return True
+
+    async def _enqueue(self, job_id: str, run: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            await asyncio.to_thread(self.store.set_status, job_id, FAILED, self.ttl, "The job queue was full.")
+            raise JobQueueFull()
+        self._live[job_id] = _LiveJob(run)
+
+    async def status(self, job_id: str, owner: str) -> Optional[dict]:
+        job = await asyncio.to_thread(self.store.get, job_id, owner)
+        live = self._live.get(job_id)
+        if job is not None and live is not None:
+            # Events not flushed yet are already visible to readers
+            job["event_count"] = len(live.events)
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        live = self._live.get(job_id)
+        if live is None:
+            return False
+        live.cancelled = True
+        if live.task is not None:
+            live.task.cancel()
+        else:
+            await self._finish(job_id, live, CANCELLED, "Cancelled before it started.", 0)
+        return True
+
+    async def events(self, job_id: str, after: int = 0, follow: bool = False) -> AsyncIterator[Tuple[int, str]]:
+        """Yield ``(event_id, line)`` after ``after``, waiting for new ones if ``follow``."""
+        live = self._live.get(job_id)
+        if live is None:
+            for seq, line in await asyncio.to_thread(self.store.events, job_id, after):
+                yield seq, line
+            return
+
+        seq = after
+        while True:
+            async with live.changed:
+                while follow and len(live.events) <= seq and not live.done:
+                    await live.changed.wait()
+                lines = live.events[seq:]
+                done = live.done
+            for line in lines:
+                seq += 1
+                yield seq, line
+            if not follow or (done and seq >= len(live.events)):
+                return
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            live = self._live.get(job_id)
+            if live is None or live.cancelled:
+                continue
+            live.task = asyncio.create_task(self._run(job_id, live))
+            try:
+                # Unlike awaiting the task, this does not raise when the job is cancelled
+                await asyncio.wait({live.task})
+            except asyncio.CancelledError:
+                # The worker itself is stopping
+                await cancel_tasks(live.task)
+                raise
+
+    async def _run(self, job_id: str, live: _LiveJob) -> None:
+        await asyncio.to_thread(self.store.set_status, job_id, RUNNING, self.ttl)
+        status, error, flushed = SUCCEEDED, None, 0
+        responses = live.run()
+        try:
+            async for event in responses:
+                if isinstance(event, dict) and "error" in event:
+                    status, error = FAILED, str(event["error"])
+                async with live.changed:
+                    live.events.append(event_line(event))
+                    live.changed.notify_all()
+                if len(live.events) - flushed >= self.flush_events:
+                    flushed = await self._flush(job_id, live, flushed)
+        except asyncio.CancelledError:
+            if live.cancelled:
+                status, error = CANCELLED, "Cancelled while running."
+            else:
+                status, error = INTERRUPTED, "The gateway stopped before the job finished."
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            status, error = FAILED, f"An unexpected error occurred: {e}"
+        finally:
+            await responses.aclose()
+        await self._finish(job_id, live, status, error, flushed)
+
+    async def _flush(self, job_id: str, live: _LiveJob, flushed: int) -> int:
+        lines = live.events[flushed:]
+        if lines:
+            await asyncio.to_thread(self.store.append_events, job_id, flushed + 1, lines)
+        return flushed + len(lines)
+
+    async def _finish(self, job_id: str, live: _LiveJob, status: str, error: Optional[str], flushed: int) -> None:
+        await self._flush(job_id, live, flushed)
+        await asyncio.to_thread(self.store.set_status, job_id, status, self.ttl, error)
+        JOBS.inc(status=status)
+        async with live.changed:
+            live.done = True
+            live.changed.notify_all()
+        self._live.pop(job_id, None)
+
+    async def _purge_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.ttl, 3600.0))
+            try:
+                await asyncio.to_thread(self.store.purge_expired)
+            except sqlite3.Error as e:
+                logger.warning("Could not purge expired jobs: %s", e)
+
+
+job_manager = JobManager(
+    JobStore(settings.JOB_DB_PATH),
+    workers=settings.JOB_WORKERS,
+    queue_size=settings.JOB_QUEUE_SIZE,
+    ttl=settings.JOB_RESULT_TTL,
+    flush_events=settings.JOB_FLUSH_EVENTS,
+)
@@ -0,0 +1,98 @@
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Tuple
+
+from app import settings
+from app.cache import hash_secret
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+LLM_CLIENT_REQUESTS = Counter(
+    "machtiani_llm_client_requests_total",
+    "LLM client lookups by result; hit means a warm client and its connection pool were reused.",
+    ("result",),
+)
+
+
+class LlmClientCache:
+    """
+    Bounded cache of LLM clients keyed by (base_url, model, sha256(api_key)).
+
+    Reusing a client keeps its HTTP connection pool and TLS sessions warm
+    across requests. Clients are leased for the duration of a call; clients
+    idle for longer than ``idle_ttl`` seconds, or pushed out by ``maxsize``,
+    are dropped once no call is using them.
+
+    Nothing is closed explicitly: LlmModel has no close method, so a dropped
+    client and its connection pool are released by the garbage collector.
+    """
+
+    def __init__(self, factory: Callable[..., Any], maxsize: int, idle_ttl: float):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        # key -> [client, last_used, leases]
+        self._clients: "OrderedDict[Tuple[str, str, str], list]" = OrderedDict()
+
+    @asynccontextmanager
+    async def lease(self, model: str, api_key: str, base_url: str) -> AsyncIterator[Any]:
+        self.evict_idle()
+        key = (str(base_url), model, hash_secret(api_key))
+        entry = self._clients.get(key)
+        if entry is not None:
+            self._clients.move_to_end(key)
+            entry[2] += 1
+            LLM_CLIENT_REQUESTS.inc(result="hit")
+        else:
+            LLM_CLIENT_REQUESTS.inc(result="miss")
+            entry = [self.factory(model=model, api_key=api_key, base_url=str(base_url)), 0.0, 1]
+            if self.maxsize > 0:
+                self._clients[key] = entry
+                self._evict_overflow()
+
+        try:
+            yield entry[0]
+        finally:
+            entry[2] -= 1
+            entry[1] = time.monotonic()
+            self._evict_overflow()
+
+    def _evict_overflow(self) -> None:
+        overflow = len(self._clients) - self.maxsize
+        if overflow <= 0:
+            return
+        # Oldest clients that no call is using; in-use ones are kept for now
+        victims = [key for key, (_, _, leases) in self._clients.items() if leases == 0][:overflow]
+        for key in victims:
+            del self._clients[key]
+
+    def evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [
+            key for key, (_, last_used, leases) in self._clients.items()
+            if leases == 0 and last_used < cutoff
+        ]
+        for key in idle:
+            del self._clients[key]
+
+    def clear(self) -> None:
+        self._clients.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+def _create_llm_model(**kwargs: Any) -> Any:
+    from app.utils import LlmModel
+
+    return LlmModel(**kwargs)
+
+
+llm_clients = LlmClientCache(
+    _create_llm_model,
+    maxsize=settings.LLM_CLIENT_CACHE_SIZE,
+    idle_ttl=settings.LLM_CLIENT_IDLE_TTL,
+)
@@ -0,0 +1,57 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from app import settings
+
+
+class Summary:
+    """
+    A log argument that renders a size-capped view of ``value``.
+
+    Nothing is formatted unless the record is actually emitted, so passing
+    a whole prompt or file at a disabled level costs one small object.
+    Text over the cap is cut and labelled with its length and a short hash,
+    which is enough to tell two payloads apart without dumping them.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = settings.LOG_PAYLOAD_MAX_CHARS if limit is None else limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        digest = hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()[:12]
+        return f"{text[:self.limit]}... [{len(text)} chars, sha256 {digest}]"
+
+
+def summarize(value: Any, limit: Optional[int] = None) -> Summary:
+    return Summary(value, limit)
+
+
+def redact(secret: Any) -> Optional[str]:
+    """Whether a credential was given, never its value."""
+    return "<redacted>" if secret else None
+
+
+class Fields:
+    """A log argument that renders keyword fields as one capped JSON object."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return json.dumps({
+            name: value if value is None or isinstance(value, (bool, int, float)) else str(summarize(value))
+            for name, value in self.fields.items()
+        })
+
+
+def log_fields(**fields: Any) -> Fields:
+    return Fields(fields)
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app import settings
+from app.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG = Histogram(
+    "machtiani_event_loop_lag_seconds",
+    "How late the event loop woke a periodic sampler.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf")),
+)
+EVENT_LOOP_STALLS = Counter(
+    "machtiani_event_loop_stalls_total",
+    "Samples where the event loop was late by more than LOOP_STALL_THRESHOLD_MS.",
+)
+
+
+def start_blocking_pool(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Bound the threads blocking work runs on.
+
+    ``asyncio.to_thread`` and ``run_in_executor(None, ...)`` use the loop's
+    default executor, so every offloaded call in the gateway shares this pool.
+    """
+    loop.set_default_executor(
+        ThreadPoolExecutor(max_workers=settings.BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+    )
+
+
+class LoopMonitor:
+    """
+    Samples event-loop lag and reports stalls.
+
+    A task sleeps for ``interval`` and measures how late it wakes up. In
+    debug mode a watchdog thread also notices a stall while it is happening
+    and logs the task and stack that hold the loop.
+    """
+
+    def __init__(self, interval: float, threshold: float, debug: bool):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._culprit: Optional[str] = None
+
+    def start(self) -> None:
+        if self._task is not None or self.interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        self._stopped.clear()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._sample(loop))
+        if self.debug:
+            self._watchdog = threading.Thread(
+                target=self._watch, args=(loop, threading.get_ident()), name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _sample(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._heartbeat = time.monotonic()
+            EVENT_LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                EVENT_LOOP_STALLS.inc()
+                culprit, self._culprit = self._culprit, None
+                if culprit:
+                    logger.warning("Event loop stalled for %.0f ms in %s", lag * 1000, culprit)
+                else:
+                    logger.warning("Event loop stalled for %.0f ms", lag * 1000)
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            if heartbeat == reported or time.monotonic() - heartbeat < self.interval + self.threshold:
+                continue
+            # The loop is stuck right now: see what it is running
+            reported = heartbeat
+            task = asyncio.current_task(loop)
+            coro = task.get_coro() if task is not None else None
+            self._culprit = (
+                f"task {task.get_name()} ({getattr(coro, '__qualname__', coro)})" if task is not None else "a callback"
+            )
+            frame = sys._current_frames().get(loop_thread)
+            stack = "".join(traceback.format_stack(frame, limit=settings.LOOP_STALL_STACK_DEPTH)) if frame else ""
+            logger.warning("Event loop blocked for over %.0f ms by %s:\n%s", self.threshold * 1000, self._culprit, stack)
+
+
+loop_monitor = LoopMonitor(
+    settings.LOOP_MONITOR_INTERVAL,
+    settings.LOOP_STALL_THRESHOLD_MS / 1000.0,
+    settings.LOOP_MONITOR_DEBUG,
+)
@@ -1,9 +1,21 @@
+import asyncio
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from .http_client import init_http_client, close_http_client
+from .jobs import job_manager
+from .llm_clients import llm_clients
+from .loop_monitor import loop_monitor, start_blocking_pool
+from .middleware import MetricsMiddleware
+from .resumable import resumable_streams
+from .tokenizer import preload_tokenizers
+from .tracing import start_tracing, stop_tracing
 from .routes.generate_filename import router as generate_filename
 from .routes.generate_response import router as generate_response
 from .routes.get_install_info import router as get_install_info
+from .routes.jobs import router as jobs
+from .routes.metrics import router as metrics
 
 # Get log level from environment variable, default to INFO
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -16,7 +28,28 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP client shared by every route for the life of the process
+    start_tracing()
+    start_blocking_pool(asyncio.get_running_loop())
+    loop_monitor.start()
+    # Tokenizers may download or read from disk; never on a request's first call
+    await preload_tokenizers()
+    await init_http_client()
+    await job_manager.start()
+    try:
+        yield
+    finally:
+        await job_manager.stop()
+        await resumable_streams.close()
+        llm_clients.clear()
+        await close_http_client()
+        await loop_monitor.stop()
+        stop_tracing()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 logger.critical("Application is starting up...")
 
@@ -24,3 +57,5 @@ logger.critical("Application is starting up...")
 app.include_router(generate_filename)
 app.include_router(generate_response)
 app.include_router(get_install_info)
+app.include_router(jobs)
+app.include_router(metrics)
@@ -0,0 +1,194 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# In-process metrics. Recording is a dict update, cheap enough for hot paths.
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._values[tuple(str(labels.get(name, "")) for name in self.labelnames)] += amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        REGISTRY.append(self)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[tuple(str(labels.get(name, "")) for name in self.labelnames)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._values[tuple(str(labels.get(name, "")) for name in self.labelnames)] += amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+
+# Latency buckets in seconds, from sub-millisecond cache hits up to long LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, float("inf"))
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # The last bucket is always +Inf so every observation has a bucket
+        self.buckets = tuple(buckets) if buckets[-1] == float("inf") else (*buckets, float("inf"))
+        # label values -> [per-bucket counts, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+
+REGISTRY: List[object] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(registry: Optional[List[object]] = None) -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY if registry is None else registry:
+        kind = "histogram" if isinstance(metric, Histogram) else "gauge" if isinstance(metric, Gauge) else "counter"
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {kind}")
+        for key, value in sorted(metric._values.items()):
+            if kind != "histogram":
+                lines.append(f"{metric.name}{_labels(metric.labelnames, key)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{metric.name}_bucket{_labels(metric.labelnames, key, le)} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labelnames, key)} {_number(total)}")
+            lines.append(f"{metric.name}_count{_labels(metric.labelnames, key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+CANCELLED_WORK = Counter(
+    "machtiani_cancelled_work_total",
+    "Stages abandoned because the client went away, counted once per request and stage.",
+    ("stage",),
+)
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "machtiani_llm_time_to_first_token_seconds",
+    "Time from opening an LLM stream to its first token, by provider.",
+    ("provider",),
+)
+
+LLM_HEDGE_WINS = Counter(
+    "machtiani_llm_hedge_wins_total",
+    "Hedged LLM streams won, by provider and role (primary or alternate).",
+    ("provider", "role"),
+)
+
+HTTP_REQUESTS = Counter(
+    "machtiani_http_requests_total",
+    "Gateway requests by route, method and status code.",
+    ("route", "method", "status"),
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "machtiani_http_request_duration_seconds",
+    "Gateway request duration by route, until the last body byte is sent.",
+    ("route",),
+)
+
+HTTP_IN_FLIGHT = Gauge(
+    "machtiani_http_requests_in_flight",
+    "Gateway requests currently being served, by route.",
+    ("route",),
+)
+
+HTTP_BYTES = Counter(
+    "machtiani_http_bytes_total",
+    "Gateway request and response body bytes by route and direction (in or out).",
+    ("route", "direction"),
+)
+
+UPSTREAM_REQUESTS = Counter(
+    "machtiani_upstream_requests_total",
+    "Calls to commit-file-retrieval by endpoint and status code.",
+    ("endpoint", "status"),
+)
+
+UPSTREAM_DURATION = Histogram(
+    "machtiani_upstream_request_duration_seconds",
+    "Time to a response from commit-file-retrieval, by endpoint.",
+    ("endpoint",),
+)
+
+UPSTREAM_BYTES = Counter(
+    "machtiani_upstream_bytes_total",
+    "Bytes sent to and received from commit-file-retrieval, by endpoint and direction (out or in).",
+    ("endpoint", "direction"),
+)
+
+LLM_STREAM_DURATION = Histogram(
+    "machtiani_llm_stream_duration_seconds",
+    "Duration of LLM token streams, by provider.",
+    ("provider",),
+)
+
+LLM_OUTPUT_TOKENS = Counter(
+    "machtiani_llm_output_tokens_total",
+    "Streamed LLM token chunks, by provider.",
+    ("provider",),
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    "machtiani_llm_tokens_per_second",
+    "Streamed token chunks per second after the first token, by provider.",
+    ("provider",),
+    buckets=(1.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, float("inf")),
+)
@@ -0,0 +1,62 @@
+import time
+from typing import Callable
+
+from starlette.routing import Match
+
+from app.metrics import HTTP_BYTES, HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, HTTP_REQUESTS
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route request metrics.
+
+    It counts body bytes per message rather than wrapping the response, so
+    a streamed token frame costs one ``len`` and one addition. Routes are
+    labelled by their path template, never by the raw path.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    @staticmethod
+    def _route(scope: dict) -> str:
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        route = self._route(scope)
+        status = 500
+        bytes_in = 0
+        bytes_out = 0
+
+        async def counting_receive() -> dict:
+            nonlocal bytes_in
+            message = await receive()
+            bytes_in += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: dict) -> None:
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            else:
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(route=route)
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec(route=route)
+            HTTP_REQUESTS.inc(route=route, method=scope["method"], status=status)
+            HTTP_REQUEST_DURATION.observe(time.monotonic() - started, route=route)
+            HTTP_BYTES.inc(bytes_in, route=route, direction="in")
+            HTTP_BYTES.inc(bytes_out, route=route, direction="out")
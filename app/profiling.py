@@ -0,0 +1,92 @@
+import cProfile
+import logging
+import os
+from typing import Any, Awaitable, Generator, List, Optional
+
+from app import settings
+
+logger = logging.getLogger(__name__)
+
+# Ask for a profile of one /generate-response call, when PROFILING_ENABLED
+PROFILE_HEADER = "X-Machtiani-Profile"
+
+
+def profiling_requested(header: Optional[str], flag: bool) -> bool:
+    if not settings.PROFILING_ENABLED:
+        return False
+    return flag or (header or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _Profiled:
+    """
+    Drive an awaitable with the profiler on only while its own code runs.
+
+    The profiler is switched off each time the awaitable suspends, so other
+    requests sharing the event loop while it waits are not attributed to it.
+    """
+
+    __slots__ = ("awaitable", "profiler")
+
+    def __init__(self, awaitable: Awaitable, profiler: cProfile.Profile):
+        self.awaitable = awaitable
+        self.profiler = profiler
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        iterator = self.awaitable.__await__()
+        value, error = None, None
+        while True:
+            self.profiler.enable()
+            try:
+                yielded = iterator.send(value) if error is None else iterator.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profiler.disable()
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class RequestProfiler:
+    """
+    cProfile of one request's steps on the event loop.
+
+    Work the request hands to other tasks or threads is not included; its
+    wall time is already broken down by the timings event.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.profiler = cProfile.Profile()
+
+    def run(self, awaitable: Awaitable) -> _Profiled:
+        return _Profiled(awaitable, self.profiler)
+
+    def dump(self) -> str:
+        """Write the profile as a pstats file and return its path."""
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILE_DIR, f"{self.request_id}.prof")
+        self.profiler.dump_stats(path)
+        return path
+
+    def top_functions(self, limit: int) -> List[dict]:
+        """The functions with the most cumulative time; call after ``dump``."""
+        stats = getattr(self.profiler, "stats", None) or {}
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [
+            {
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+            for (filename, line, name), (_, calls, total, cumulative, _) in ranked
+        ]
+
+    def as_event(self) -> dict:
+        """Write the profile and describe it as a stream event."""
+        path = self.dump()
+        top = self.top_functions(settings.PROFILE_TOP_FUNCTIONS)
+        logger.info("Profile of request %s written to %s", self.request_id, path)
+        return {"event": "profile", "trace_id": self.request_id, "path": path, "top_functions": top}
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, List, Optional, Tuple
+
+from app import settings
+from app.cache import ByteLRUCache
+from app.metrics import Counter
+from app.streaming import event_line, stored_event
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "machtiani_response_cache_requests_total",
+    "Full-response cache lookups by result: memory, disk or miss.",
+    ("result",),
+)
+
+
+def response_cache_key(
+    prompt: str,
+    project: str,
+    head_commit_hash: str,
+    model: str,
+    mode: str,
+    match_strength: str,
+    ignore_files: List[str],
+) -> str:
+    material = json.dumps(
+        [prompt, project, head_commit_hash, model, mode, match_strength, sorted(ignore_files or [])]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def events_size(events: List[Any]) -> int:
+    """Encoded size of a recorded stream in bytes."""
+    return sum(len(event_line(event)) for event in events)
+
+
+class ResponseCache:
+    """
+    Two-tier cache of complete /generate-response event streams.
+
+    The memory tier is an LRU of event lists bounded by their encoded size,
+    since an entry holds every event, edited file contents included. The
+    optional disk tier keeps one NDJSON file per key under ``directory``.
+    Both tiers expire entries ``ttl`` seconds after they were written; a
+    disk hit promoted to memory keeps the time it has left. Token frames
+    are stored exactly as they were streamed, so a replay re-sends the
+    same frames.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str], ttl: float):
+        self.memory = ByteLRUCache(max_bytes, sizeof=events_size, ttl=ttl)
+        self.directory = directory
+        self.ttl = ttl
+        # Created on first write rather than at import, so an unwritable
+        # directory only disables the disk tier
+        self._directory_ready = False
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ndjson")
+
+    async def get(self, key: str) -> Optional[List[Any]]:
+        events = self.memory.get(key)
+        if events is not None:
+            RESPONSE_CACHE_REQUESTS.inc(result="memory")
+            return events
+        if self.directory:
+            entry = await asyncio.to_thread(self._read, key)
+            if entry is not None:
+                events, remaining = entry
+                RESPONSE_CACHE_REQUESTS.inc(result="disk")
+                self.memory.set(key, events, ttl=remaining)
+                return events
+        RESPONSE_CACHE_REQUESTS.inc(result="miss")
+        return None
+
+    async def set(self, key: str, events: List[Any]) -> None:
+        self.memory.set(key, events)
+        if self.directory and await asyncio.to_thread(self._ensure_directory):
+            try:
+                await asyncio.to_thread(self._write, key, events)
+            except OSError as e:
+                logger.warning("Could not write response cache entry %s: %s", key, e)
+
+    def _ensure_directory(self) -> bool:
+        if not self._directory_ready:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError as e:
+                logger.warning("Response cache directory %s is unusable, disabling the disk tier: %s", self.directory, e)
+                self.directory = None
+                return False
+            self._directory_ready = True
+        return True
+
+    def _read(self, key: str) -> Optional[Tuple[List[Any], float]]:
+        """Return the stored events and the seconds they have left to live."""
+        path = self._path(key)
+        try:
+            remaining = self.ttl - (time.time() - os.path.getmtime(path))
+            if remaining <= 0:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                events = [stored_event(line.rstrip("\n")) for line in f if line.strip()]
+            return events, remaining
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read response cache entry %s: %s", key, e)
+            return None
+
+    def _write(self, key: str, events: List[Any]) -> None:
+        # A temporary file of its own per writer, so concurrent misses on
+        # the same key never write into each other's file
+        with tempfile.NamedTemporaryFile("wb", dir=self.directory, prefix=f"{key}.", suffix=".tmp", delete=False) as f:
+            try:
+                for event in events:
+                    f.write(event_line(event).encode("utf-8") + b"\n")
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, self._path(key))
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    directory=settings.RESPONSE_CACHE_DIR or None,
+    ttl=settings.RESPONSE_CACHE_TTL,
+)
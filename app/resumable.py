@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app import settings
+from app.metrics import Counter, Gauge
+from app.streaming import EncodedEvent, dumps, prefix_fields
+from app.utils import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+RESUME_BUFFER_EVICTIONS = Counter(
+    "machtiani_resume_buffer_evictions_total",
+    "Events dropped from resumable stream buffers, by reason: stream_cap, memory_cap or expired.",
+    ("reason",),
+)
+
+RESUME_BUFFER_BYTES = Gauge(
+    "machtiani_resume_buffer_bytes",
+    "Bytes held in resumable stream buffers.",
+)
+
+STREAM_RESUMES = Counter(
+    "machtiani_stream_resumes_total",
+    "Reconnects to resumable streams, by result: complete, gap or unknown.",
+    ("result",),
+)
+
+
+def tag_event_id(event: Any, event_id: int) -> Any:
+    """Number an event, splicing the id into pre-encoded frames."""
+    if isinstance(event, EncodedEvent):
+        return EncodedEvent(prefix_fields(f'"event_id":{event_id}', event))
+    return {"event_id": event_id, **event}
+
+
+class ResumableStream:
+    """
+    One response stream, produced in the background into a bounded buffer.
+
+    Events are numbered from 1. Readers attach after a given event id and
+    get the buffered events from there, then the live tail. When the last
+    reader goes away the stream is kept for the grace period; if nobody
+    reattaches by then, the producer is cancelled and the buffer dropped.
+    """
+
+    def __init__(self, registry: "ResumableStreams", stream_id: str):
+        self.registry = registry
+        self.id = stream_id
+        # (tagged event, size in bytes), oldest first
+        self.events: deque = deque()
+        self.first_id = 1
+        self.next_id = 1
+        self.bytes = 0
+        self.done = False
+        self.readers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._expiry: Optional[asyncio.TimerHandle] = None
+
+    def append(self, event: Any) -> None:
+        tagged = tag_event_id(event, self.next_id)
+        size = len(tagged) if isinstance(tagged, EncodedEvent) else len(dumps(tagged))
+        self.events.append((tagged, size))
+        self.next_id += 1
+        self.bytes += size
+        self.registry.bytes += size
+        while self.bytes > self.registry.stream_bytes and len(self.events) > 1:
+            self.evict_oldest("stream_cap")
+        self.registry.enforce_memory_cap()
+        self._notify()
+
+    def evict_oldest(self, reason: str) -> None:
+        _, size = self.events.popleft()
+        self.first_id += 1
+        self.bytes -= size
+        self.registry.bytes -= size
+        RESUME_BUFFER_EVICTIONS.inc(reason=reason)
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def produce(self, responses: AsyncIterator[Any]) -> None:
+        try:
+            async for event in responses:
+                self.append(event)
+        except Exception as e:
+            logger.exception("Resumable stream %s failed", self.id)
+            self.append({"error": f"An unexpected error occurred: {e}"})
+        finally:
+            await responses.aclose()
+            self.done = True
+            self._notify()
+
+    async def attach(self, after: int = 0) -> AsyncIterator[Any]:
+        """Yield events with ids greater than ``after``, then follow the live tail."""
+        self.readers += 1
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        try:
+            cursor = after + 1
+            while True:
+                if cursor < self.first_id:
+                    # The buffer no longer holds everything the reader missed
+                    yield {"event": "resume_gap", "stream_id": self.id, "missing_from": cursor, "missing_to": self.first_id - 1}
+                    cursor = self.first_id
+                if cursor < self.next_id:
+                    pending = [event for event, _ in islice(self.events, cursor - self.first_id, None)]
+                    cursor += len(pending)
+                    for event in pending:
+                        yield event
+                    continue
+                if self.done:
+                    return
+                await self._wakeup.wait()
+        finally:
+            self.readers -= 1
+            if self.readers == 0:
+                self._expiry = asyncio.get_running_loop().call_later(
+                    self.registry.grace, self.registry.expire, self
+                )
+
+
+class ResumableStreams:
+    """Registry of resumable streams sharing one memory cap."""
+
+    def __init__(self, max_bytes: int, stream_bytes: int, grace: float):
+        self.max_bytes = max_bytes
+        self.stream_bytes = stream_bytes
+        self.grace = grace
+        self.bytes = 0
+        self._streams: Dict[str, ResumableStream] = {}
+
+    def start(self, responses: AsyncIterator[Any]) -> ResumableStream:
+        stream = ResumableStream(self, uuid.uuid4().hex)
+        self._streams[stream.id] = stream
+        stream.task = asyncio.create_task(stream.produce(responses))
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        return self._streams.get(stream_id)
+
+    def enforce_memory_cap(self) -> None:
+        # Trim the oldest streams first; each keeps at least its newest event
+        for stream in list(self._streams.values()):
+            while self.bytes > self.max_bytes and len(stream.events) > 1:
+                stream.evict_oldest("memory_cap")
+            if self.bytes <= self.max_bytes:
+                break
+        RESUME_BUFFER_BYTES.set(self.bytes)
+
+    def expire(self, stream: ResumableStream) -> None:
+        stream._expiry = None
+        if stream.readers or self._streams.get(stream.id) is not stream:
+            return
+        if stream.task is not None and not stream.task.done():
+            logger.info("Resumable stream %s was not resumed within %.0fs, cancelling it", stream.id, self.grace)
+            stream.task.cancel()
+        del self._streams[stream.id]
+        RESUME_BUFFER_EVICTIONS.inc(len(stream.events), reason="expired")
+        self.bytes -= stream.bytes
+        stream.events.clear()
+        stream.bytes = 0
+        RESUME_BUFFER_BYTES.set(self.bytes)
+
+    async def close(self) -> None:
+        tasks = [stream.task for stream in self._streams.values() if stream.task is not None]
+        self._streams.clear()
+        self.bytes = 0
+        await cancel_tasks(*tasks)
+
+
+resumable_streams = ResumableStreams(
+    max_bytes=settings.RESUME_BUFFER_MAX_BYTES,
+    stream_bytes=settings.RESUME_BUFFER_STREAM_BYTES,
+    grace=settings.RESUME_GRACE_SECONDS,
+)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse
-import json
-from pydantic import SecretStr, HttpUrl
+import asyncio
+from pydantic import BaseModel, SecretStr, HttpUrl
 from typing import List, Optional
-from app.services.generate_response_service import generate_response
+from app import settings
+from app.log_format import log_fields, redact, summarize
+from app.profiling import PROFILE_HEADER, profiling_requested
+from app.resumable import STREAM_RESUMES, ResumableStream, resumable_streams
+from app.services.batch_response_service import generate_response_batch
+from app.services.generate_response_service import cached_generate_response, generate_response
+from app.streaming import ndjson_frames
 
 router = APIRouter()
 
@@ -11,6 +17,24 @@ router = APIRouter()
 import logging
 logger = logging.getLogger(__name__)
 
+
+async def resumable_event_stream(stream: ResumableStream, after: int, coalesce_ms: int, coalesce_bytes: int):
+    # Disconnecting only detaches the reader; the stream keeps running for
+    # the resume grace period.
+    frames = ndjson_frames(stream.attach(after), coalesce_ms, coalesce_bytes)
+    try:
+        yield (b'{"event":"stream_start","stream_id":"%s","last_event_id":%d}\n' % (stream.id.encode(), after))
+        async for frame in frames:
+            yield frame
+    finally:
+        await frames.aclose()
+
+
+class BatchPrompt(BaseModel):
+    id: Optional[str] = None
+    prompt: str
+
+
 @router.post("/generate-response")
 async def generate_response_route(
     prompt: str = Body(..., description="The prompt to search for"),
@@ -27,26 +51,145 @@ async def generate_response_route(
     head_commit_hash: str = Body(..., description="The head of the git repository"),
     llm_model_base_url_other: Optional[str] = Body(None, description="Optional other LLM base url"),
     llm_model_api_key_other: Optional[str] = Body(None, description="Optional other LLM api key"),
+    stream_coalesce_ms: int = Body(0, description="Coalesce streamed tokens into frames spanning up to this many milliseconds"),
+    stream_coalesce_bytes: int = Body(0, description="Coalesce streamed tokens into frames of up to this many bytes"),
+    hedge: bool = Body(False, description="Hedge the LLM request on the other LLM base url if the first token is slow"),
+    use_cache: Optional[bool] = Body(None, description="Serve and record this response through the response cache; defaults to RESPONSE_CACHE_ENABLED"),
+    resumable: bool = Body(False, description="Number events and keep them so a dropped stream can be resumed"),
+    profile: bool = Body(False, description="Profile this request and report the artifact; needs PROFILING_ENABLED"),
+    profile_header: Optional[str] = Header(None, alias=PROFILE_HEADER),
+):
+
+    logger.debug("Received /generate-response call: %s", log_fields(
+        prompt=prompt,
+        project=project,
+        mode=mode,
+        model=model,
+        match_strength=match_strength,
+        llm_model_api_key=redact(llm_model_api_key),
+        llm_model_base_url=llm_model_base_url,
+        codehost_api_key=redact(codehost_api_key),
+        codehost_url=codehost_url,
+        ignore_files=ignore_files,
+        llm_model_base_url_other=llm_model_base_url_other,
+        llm_model_api_key_other=redact(llm_model_api_key_other),
+        head_commit_hash=head_commit_hash,
+    ))
+    if use_cache is None:
+        use_cache = settings.RESPONSE_CACHE_ENABLED
+    profile = profiling_requested(profile_header, profile)
+    if profile:
+        # A profile of a cache replay would say nothing about the slow path
+        use_cache = False
+
+    request_args = (
+        prompt,
+        project,
+        mode,
+        model,
+        match_strength,
+        llm_model_api_key,
+        llm_model_base_url,
+        codehost_api_key,
+        codehost_url,
+        ignore_files,
+        head_commit_hash,
+        llm_model_base_url_other,
+        llm_model_api_key_other,
+        hedge,
+    )
+
+    def open_responses():
+        if not use_cache:
+            return generate_response(*request_args, profile=profile)
+        return cached_generate_response(*request_args)
+
+    if resumable:
+        stream = resumable_streams.start(open_responses())
+        return StreamingResponse(
+            resumable_event_stream(stream, 0, stream_coalesce_ms, stream_coalesce_bytes),
+            media_type="application/json",
+        )
+
+    async def event_stream():
+        responses = open_responses()
+        # Starlette cancels this stream when the client disconnects. Closing
+        # the service generator explicitly makes it cancel the token stream
+        # and any retrieval or file-edit work still in flight.
+        frames = ndjson_frames(responses, stream_coalesce_ms, stream_coalesce_bytes)
+        # Checked once per stream, not once per frame
+        log_frames = logger.isEnabledFor(logging.DEBUG)
+        try:
+            async for frame in frames:
+                if log_frames:
+                    logger.debug("Streaming response frame: %s", summarize(frame))
+                yield frame
+        except asyncio.CancelledError:
+            logger.info("Client disconnected from /generate-response, cancelling upstream work")
+            raise
+        finally:
+            await frames.aclose()
+            await responses.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/json")
+
+
+@router.get("/generate-response/streams/{stream_id}")
+async def resume_generate_response_route(
+    stream_id: str,
+    last_event_id: Optional[int] = Query(None, description="The last event_id the client received"),
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+    stream_coalesce_ms: int = Query(0, description="Coalesce streamed tokens into frames spanning up to this many milliseconds"),
+    stream_coalesce_bytes: int = Query(0, description="Coalesce streamed tokens into frames of up to this many bytes"),
+):
+    stream = resumable_streams.get(stream_id)
+    if stream is None:
+        STREAM_RESUMES.inc(result="unknown")
+        raise HTTPException(status_code=404, detail="Stream not found or expired.")
+    after = last_event_id if last_event_id is not None else (last_event_id_header or 0)
+    STREAM_RESUMES.inc(result="gap" if after + 1 < stream.first_id else "complete")
+    logger.info("Resuming stream %s after event %d", stream_id, after)
+    return StreamingResponse(
+        resumable_event_stream(stream, after, stream_coalesce_ms, stream_coalesce_bytes),
+        media_type="application/json",
+    )
+
+
+@router.post("/generate-response/batch")
+async def generate_response_batch_route(
+    prompts: List[BatchPrompt] = Body(..., description="Prompts to answer, each with an optional id to tag its events"),
+    project: str = Body(..., description="The project to search"),
+    mode: str = Body(..., description="Search mode: chat, pure-chat, answer-only, or default"),
+    model: str = Body(..., description="The model used for inference"),
+    match_strength: str = Body(..., description="The strength of the match"),
+    llm_model_api_key: str = Body(..., description="API key for OpenAI model"),
+    llm_model_base_url: HttpUrl = Body(..., description="LLM base url"),
+    codehost_api_key: Optional[SecretStr] = Body(..., description="Code host API key for authentication"),
+    codehost_url: HttpUrl = Body(..., description="Code host URL for the repository"),
+    ignore_files: List[str] = Body(..., description="List of file paths to ignore"),
+    head_commit_hash: str = Body(..., description="The head of the git repository"),
+    llm_model_base_url_other: Optional[str] = Body(None, description="Optional other LLM base url"),
+    llm_model_api_key_other: Optional[str] = Body(None, description="Optional other LLM api key"),
+    stream_coalesce_ms: int = Body(0, description="Coalesce streamed tokens into frames spanning up to this many milliseconds"),
+    stream_coalesce_bytes: int = Body(0, description="Coalesce streamed tokens into frames of up to this many bytes"),
+    hedge: bool = Body(False, description="Hedge the LLM request on the other LLM base url if the first token is slow"),
+    use_cache: Optional[bool] = Body(None, description="Serve and record responses through the response cache; defaults to RESPONSE_CACHE_ENABLED"),
 ):
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required.")
+    if len(prompts) > settings.BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {settings.BATCH_MAX_PROMPTS} prompts.")
+    tagged = [(item.id or str(index), item.prompt) for index, item in enumerate(prompts)]
+    if len({prompt_id for prompt_id, _ in tagged}) != len(tagged):
+        raise HTTPException(status_code=400, detail="Prompt ids must be unique within a batch.")
+    if use_cache is None:
+        use_cache = settings.RESPONSE_CACHE_ENABLED
+
+    logger.info("Received /generate-response/batch call with %d prompts for project %s", len(tagged), project)
 
-    # Log the received payload values and their types for debugging.
-    logger.debug("Received /generate-response call with:")
-    logger.debug(f"  prompt: {prompt} (type: {type(prompt)})")
-    logger.debug(f"  project: {project} (type: {type(project)})")
-    logger.debug(f"  mode: {mode} (type: {type(mode)})")
-    logger.debug(f"  model: {model} (type: {type(model)})")
-    logger.debug(f"  match_strength: {match_strength} (type: {type(match_strength)})")
-    logger.debug(f"  llm_model_api_key: {llm_model_api_key} (type: {type(llm_model_api_key)})")
-    logger.debug(f"  llm_model_base_url: {llm_model_base_url} (type: {type(llm_model_base_url)})")
-    logger.debug(f"  codehost_api_key: {codehost_api_key} (type: {type(codehost_api_key)})")
-    logger.debug(f"  codehost_url: {codehost_url} (type: {type(codehost_url)})")
-    logger.debug(f"  ignore_files: {ignore_files} (type: {type(ignore_files)})")
-    logger.debug(f"  llm_model_base_url_other: {llm_model_base_url_other} (type: {type(llm_model_base_url_other)})")
-    logger.debug(f"  llm_model_api_key_other: {llm_model_api_key_other} (type: {type(llm_model_api_key_other)})")
-    logger.debug(f"  head_commit_hash: {head_commit_hash} (type: {type(head_commit_hash)})")
     async def event_stream():
-        async for response in generate_response(
-            prompt,
+        responses = generate_response_batch(
+            tagged,
             project,
             mode,
             model,
@@ -59,8 +202,18 @@ async def generate_response_route(
             head_commit_hash,
             llm_model_base_url_other,
             llm_model_api_key_other,
-        ):
-            logger.debug(f"Streaming response chunk: {response}")
-            yield json.dumps(response) + '\n'
+            hedge,
+            use_cache,
+        )
+        frames = ndjson_frames(responses, stream_coalesce_ms, stream_coalesce_bytes)
+        try:
+            async for frame in frames:
+                yield frame
+        except asyncio.CancelledError:
+            logger.info("Client disconnected from /generate-response/batch, cancelling upstream work")
+            raise
+        finally:
+            await frames.aclose()
+            await responses.aclose()
 
     return StreamingResponse(event_stream(), media_type="application/json")
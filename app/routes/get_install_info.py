@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 import git
 
@@ -16,13 +18,21 @@ message = (
 )
 
 
+def read_head_oid() -> str:
+    # Open the current repository
+    repo = git.Repo(search_parent_directories=True)
+    try:
+        # Get the HEAD commit's OID
+        return repo.head.commit.hexsha
+    finally:
+        repo.close()
+
+
 @router.get("/get-head-oid")
 async def get_head_oid():
     try:
-        # Open the current repository
-        repo = git.Repo(search_parent_directories=True)
-        # Get the HEAD commit's OID
-        head_oid = repo.head.commit.hexsha
+        # GitPython reads the repository and may spawn git; keep it off the event loop
+        head_oid = await asyncio.to_thread(read_head_oid)
         return {
                 "head_oid": head_oid,
                 "message": message
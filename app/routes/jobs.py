@@ -0,0 +1,170 @@
+from fastapi import APIRouter, Body, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import SecretStr, HttpUrl
+from typing import Any, AsyncIterator, Callable, List, Optional
+from app import settings
+from app.cache import hash_secret
+from app.jobs import JobQueueFull, job_manager
+from app.streaming import prefix_fields
+from app.services.generate_response_service import cached_generate_response, generate_response
+
+router = APIRouter()
+
+# Reads and cancellation carry the llm_model_api_key the job was submitted
+# with; only its digest is stored, as the job's owner
+JOB_KEY_HEADER = "X-Machtiani-Job-Key"
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def require_jobs() -> None:
+    if not job_manager.available:
+        raise HTTPException(status_code=503, detail="Jobs are unavailable: the job store could not be opened.")
+
+
+def job_runner(
+    request: dict,
+    llm_model_api_key: str,
+    codehost_api_key: Optional[SecretStr],
+    llm_model_api_key_other: Optional[str],
+) -> Callable[[], AsyncIterator[Any]]:
+    """Start a job's stream from its stored request and the caller's credentials."""
+    run = cached_generate_response if request["use_cache"] else generate_response
+
+    def start():
+        return run(
+            request["prompt"],
+            request["project"],
+            request["mode"],
+            request["model"],
+            request["match_strength"],
+            llm_model_api_key,
+            request["llm_model_base_url"],
+            codehost_api_key,
+            request["codehost_url"],
+            request["ignore_files"],
+            request["head_commit_hash"],
+            request["llm_model_base_url_other"],
+            llm_model_api_key_other,
+            request["hedge"],
+        )
+
+    return start
+
+
+@router.post("/jobs/generate-response")
+async def submit_generate_response_job(
+    prompt: str = Body(..., description="The prompt to search for"),
+    project: str = Body(..., description="The project to search"),
+    mode: str = Body(..., description="Search mode: chat, pure-chat, answer-only, or default"),
+    model: str = Body(..., description="The model used for inference"),
+    match_strength: str = Body(..., description="The strength of the match"),
+    llm_model_api_key: str = Body(..., description="API key for OpenAI model"),
+    llm_model_base_url: HttpUrl = Body(..., description="LLM base url"),
+    codehost_api_key: Optional[SecretStr] = Body(..., description="Code host API key for authentication"),
+    codehost_url: HttpUrl = Body(..., description="Code host URL for the repository"),
+    ignore_files: List[str] = Body(..., description="List of file paths to ignore"),
+    head_commit_hash: str = Body(..., description="The head of the git repository"),
+    llm_model_base_url_other: Optional[str] = Body(None, description="Optional other LLM base url"),
+    llm_model_api_key_other: Optional[str] = Body(None, description="Optional other LLM api key"),
+    hedge: bool = Body(False, description="Hedge the LLM request on the other LLM base url if the first token is slow"),
+    use_cache: Optional[bool] = Body(None, description="Serve and record this response through the response cache; defaults to RESPONSE_CACHE_ENABLED"),
+):
+    require_jobs()
+    if use_cache is None:
+        use_cache = settings.RESPONSE_CACHE_ENABLED
+
+    # Persisted with the job; credentials stay in memory only
+    request = {
+        "prompt": prompt,
+        "project": project,
+        "mode": mode,
+        "model": model,
+        "match_strength": match_strength,
+        "llm_model_base_url": str(llm_model_base_url),
+        "codehost_url": str(codehost_url),
+        "ignore_files": ignore_files,
+        "head_commit_hash": head_commit_hash,
+        "llm_model_base_url_other": llm_model_base_url_other,
+        "hedge": hedge,
+        "use_cache": use_cache,
+    }
+    start = job_runner(request, llm_model_api_key, codehost_api_key, llm_model_api_key_other)
+    try:
+        job_id = await job_manager.submit(hash_secret(llm_model_api_key), request, start)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again later.")
+    logger.info("Queued job %s for project %s", job_id, project)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_key: str = Header(..., alias=JOB_KEY_HEADER)):
+    require_jobs()
+    job = await job_manager.status(job_id, hash_secret(job_key))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    after: int = Query(0, description="Only return events with an event_id greater than this"),
+    follow: bool = Query(False, description="Keep the stream open and attach to the job until it finishes"),
+    job_key: str = Header(..., alias=JOB_KEY_HEADER),
+):
+    require_jobs()
+    if await job_manager.status(job_id, hash_secret(job_key)) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def event_stream():
+        events = job_manager.events(job_id, after, follow)
+        try:
+            async for event_id, line in events:
+                # Tag each stored line with its id so a client can resume with ?after=
+                yield (prefix_fields(f'"event_id":{event_id}', line) + "\n").encode("utf-8")
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/json")
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, job_key: str = Header(..., alias=JOB_KEY_HEADER)):
+    require_jobs()
+    if await job_manager.status(job_id, hash_secret(job_key)) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if not await job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished.")
+    return {"job_id": job_id, "status": "cancelled"}
+
+
+@router.post("/jobs/{job_id}/resume")
+async def resume_job(
+    job_id: str,
+    llm_model_api_key: str = Body(..., description="API key for OpenAI model"),
+    codehost_api_key: Optional[SecretStr] = Body(..., description="Code host API key for authentication"),
+    llm_model_api_key_other: Optional[str] = Body(None, description="Optional other LLM api key"),
+):
+    """
+    Run a job interrupted by a gateway restart again, from the start.
+
+    Credentials are never stored with a job, so they are supplied again
+    here, with the same llm_model_api_key as the original submission; the
+    interrupted run's partial events are discarded.
+    """
+    require_jobs()
+    request = await job_manager.request(job_id, hash_secret(llm_model_api_key))
+    if request is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    start = job_runner(request, llm_model_api_key, codehost_api_key, llm_model_api_key_other)
+    try:
+        resumed = await job_manager.resume(job_id, start)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again later.")
+    if not resumed:
+        raise HTTPException(status_code=409, detail="Only interrupted jobs can be resumed.")
+    logger.info("Resumed job %s for project %s", job_id, request["project"])
+    return {"job_id": job_id, "status": "queued"}
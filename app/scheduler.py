@@ -0,0 +1,255 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at ``rate`` per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        # A single request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class ProviderLimiter:
+    """Request and token rate limits of one LLM provider, plus any Retry-After pause."""
+
+    def __init__(self, name: str, requests_per_second: float, tokens_per_minute: float):
+        self.name = name
+        self.requests = TokenBucket(requests_per_second, max(requests_per_second, 1.0))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int) -> None:
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.requests.acquire(1)
+        if tokens:
+            await self.tokens.acquire(tokens)
+
+
+class FairLimiter:
+    """
+    Concurrency ceiling shared by many owners (one owner per prompt).
+
+    Free slots are handed out round-robin across owners with queued work,
+    so one prompt with many calls cannot starve the others.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    async def acquire(self, owner: Hashable) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(owner, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before cancellation
+                self.release()
+            else:
+                self._discard(owner, future)
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake_next()
+
+    def _discard(self, owner: Hashable, future: asyncio.Future) -> None:
+        queue = self._waiters.get(owner)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[owner]
+
+    def _wake_next(self) -> None:
+        while self.active < self.limit and self._waiters:
+            owner, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(owner)
+            else:
+                del self._waiters[owner]
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(None)
+
+
+def provider_name(base_url: str) -> str:
+    return urlsplit(str(base_url)).netloc or str(base_url)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class LlmScheduler:
+    """
+    Shared scheduler for outbound LLM-backed work.
+
+    Every call passes its provider's request and token buckets and then
+    holds a fair concurrency slot. Retryable responses are retried with
+    jittered exponential backoff, honoring Retry-After, which also pauses
+    the provider for every other caller.
+
+    Only calls made through ``request`` are retried, because only there is
+    the status code visible: the /file-edit/ and /new-files/ calls, whose
+    statuses come from commit-file-retrieval. The main token stream and
+    filename generation go through ``LlmModel``, which hides the provider's
+    status codes, so they only take a ``slot``; provider 429s and
+    Retry-After on those are left to the LLM client library's own retries.
+    The main stream holds its slot until the first token only.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        default_rps: float,
+        default_tpm: float,
+        provider_limits: Dict[str, dict],
+    ):
+        self.slots = FairLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_rps = default_rps
+        self.default_tpm = default_tpm
+        self.provider_limits = provider_limits
+        self._providers: Dict[str, ProviderLimiter] = {}
+
+    def provider(self, base_url: str) -> ProviderLimiter:
+        name = provider_name(base_url)
+        limiter = self._providers.get(name)
+        if limiter is None:
+            limits = self.provider_limits.get(name, {})
+            limiter = ProviderLimiter(
+                name,
+                float(limits.get("rps", self.default_rps)),
+                float(limits.get("tpm", self.default_tpm)),
+            )
+            self._providers[name] = limiter
+        return limiter
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    @asynccontextmanager
+    async def slot(self, owner: Hashable, base_url: str, tokens: int = 0):
+        """
+        Hold a concurrency slot for ``owner`` after passing the provider's rate limits.
+
+        The rate limits come first so a throttled or paused provider waits
+        without holding slots that calls to other providers could use.
+        """
+        await self.provider(base_url).acquire(tokens)
+        await self.slots.acquire(owner)
+        try:
+            yield
+        finally:
+            self.slots.release()
+
+    async def request(
+        self,
+        owner: Hashable,
+        base_url: str,
+        tokens: int,
+        send: Callable[[], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        """Run ``send`` under the scheduler, retrying retryable responses."""
+        provider = self.provider(base_url)
+        attempt = 0
+        while True:
+            async with self.slot(owner, base_url, tokens):
+                response = await send()
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                return response
+
+            retry_after = retry_after_seconds(response)
+            delay = self.backoff(attempt, retry_after)
+            if retry_after is not None:
+                provider.pause(retry_after)
+            logger.warning(
+                "Provider %s returned %s, retrying in %.1fs (attempt %d of %d)",
+                provider.name, response.status_code, delay, attempt + 1, self.max_retries,
+            )
+            # Back off without holding a slot so other prompts can proceed
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+llm_scheduler = LlmScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_base=settings.LLM_BACKOFF_BASE,
+    backoff_max=settings.LLM_BACKOFF_MAX,
+    default_rps=settings.LLM_RATE_LIMIT_RPS,
+    default_tpm=settings.LLM_RATE_LIMIT_TPM,
+    provider_limits=settings.LLM_PROVIDER_RATE_LIMITS,
+)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+import httpx
+from pydantic import SecretStr, HttpUrl
+
+from app import settings
+from app.context_packing import rank_file_candidates
+from app.http_client import get_http_client
+from app.services.file_content_service import retrieve_file_contents
+from app.services.generate_response_service import (
+    build_infer_params,
+    cached_generate_response,
+    generate_response,
+)
+from app.services.infer_file_service import infer_files
+from app.services.pull_access_service import check_pull_access
+from app.streaming import EncodedEvent, dumps, prefix_fields
+from app.utils import SearchMode, cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of one prompt's events on the shared queue
+_DONE = object()
+
+
+def tag_event(event, prompt_id: str):
+    """Add ``prompt_id`` to an event, splicing it into pre-encoded frames."""
+    if isinstance(event, EncodedEvent):
+        return EncodedEvent(prefix_fields('"prompt_id":' + dumps(prompt_id).decode("utf-8"), event))
+    return {"prompt_id": prompt_id, **event}
+
+
+async def prefetch_batch_context(
+    prompts: List[Tuple[str, str]],
+    project: str,
+    mode: str,
+    model: str,
+    match_strength: str,
+    llm_model_api_key: str,
+    llm_model_base_url: str,
+    ignore_files: List[str],
+    head_commit_hash: str,
+) -> None:
+    """
+    Warm the infer-file and file content caches for every prompt in a batch.
+
+    Each prompt's candidates are ranked the same way generate_response ranks
+    them; the union of their paths is then fetched in one deduplicated
+    /retrieve-file-contents/ call, so the per-prompt runs find their files
+    cached instead of fetching overlapping sets.
+    """
+    client = get_http_client()
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_PARALLEL)
+
+    async def candidate_paths(prompt: str) -> List[str]:
+        infer_params = build_infer_params(
+            prompt, project, mode, model, match_strength,
+            llm_model_api_key, llm_model_base_url, ignore_files, head_commit_hash,
+        )
+        async with semaphore:
+            responses = await infer_files(client, infer_params)
+        candidates = rank_file_candidates(responses, ignore_files, settings.PACKING_MAX_CANDIDATES[match_strength])
+        return [candidate.path for candidate in candidates]
+
+    results = await asyncio.gather(*(candidate_paths(prompt) for _, prompt in prompts), return_exceptions=True)
+    paths = sorted({path for result in results if isinstance(result, list) for path in result})
+    if paths:
+        logger.info("Prefetching %d distinct files for a batch of %d prompts", len(paths), len(prompts))
+        await retrieve_file_contents(client, project, head_commit_hash, paths, ignore_files)
+
+
+async def generate_response_batch(
+    prompts: List[Tuple[str, str]],
+    project: str,
+    mode: str,
+    model: str,
+    match_strength: str,
+    llm_model_api_key: str,
+    llm_model_base_url: HttpUrl,
+    codehost_api_key: Optional[SecretStr],
+    codehost_url: HttpUrl,
+    ignore_files: List[str],
+    head_commit_hash: str,
+    llm_model_base_url_other: Optional[str] = None,
+    llm_model_api_key_other: Optional[str] = None,
+    hedge: bool = False,
+    use_cache: bool = False,
+):
+    """
+    Answer ``(prompt_id, prompt)`` pairs for one project and head commit.
+
+    Pull access is checked once and retrieval is shared across the batch.
+    Up to BATCH_MAX_PARALLEL prompts then run through generate_response at
+    a time; their events are multiplexed into one stream, each tagged with
+    its ``prompt_id``, and every prompt ends with a ``prompt_complete`` event.
+    Errors, pull access denial included, are reported per prompt.
+    """
+    client = get_http_client()
+    try:
+        has_pull_access = await check_pull_access(client, project, codehost_url, codehost_api_key)
+    except httpx.HTTPError as e:
+        # Each prompt checks access again below and reports its own error
+        logger.warning("Batch pull access check failed, continuing per prompt: %s", e)
+        has_pull_access = None
+    if has_pull_access is False:
+        for prompt_id, _ in prompts:
+            yield {"prompt_id": prompt_id, "error": "Pull access denied."}
+            yield {"event": "prompt_complete", "prompt_id": prompt_id, "failed": True}
+        yield {"event": "batch_complete", "prompt_count": len(prompts), "failed": len(prompts)}
+        return
+
+    if has_pull_access and mode != SearchMode.pure_chat:
+        try:
+            await prefetch_batch_context(
+                prompts, project, mode, model, match_strength,
+                llm_model_api_key_other or llm_model_api_key,
+                llm_model_base_url_other or llm_model_base_url,
+                ignore_files, head_commit_hash,
+            )
+        except Exception as e:
+            # Each prompt still retrieves its own context below
+            logger.warning("Batch prefetch failed, continuing per prompt: %s", e)
+
+    run = cached_generate_response if use_cache else generate_response
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_PARALLEL)
+    # Bounded so a slow reader holds back the generations instead of buffering them
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.BATCH_QUEUE_SIZE)
+
+    async def answer(prompt_id: str, prompt: str) -> None:
+        failed = False
+        async with semaphore:
+            responses = run(
+                prompt,
+                project,
+                mode,
+                model,
+                match_strength,
+                llm_model_api_key,
+                llm_model_base_url,
+                codehost_api_key,
+                codehost_url,
+                ignore_files,
+                head_commit_hash,
+                llm_model_base_url_other,
+                llm_model_api_key_other,
+                hedge,
+            )
+            try:
+                async for event in responses:
+                    if isinstance(event, dict) and "error" in event:
+                        failed = True
+                    await queue.put(tag_event(event, prompt_id))
+            except Exception as e:
+                logger.exception("Batch prompt %s failed", prompt_id)
+                failed = True
+                await queue.put({"prompt_id": prompt_id, "error": f"An unexpected error occurred: {e}"})
+            finally:
+                await responses.aclose()
+        await queue.put({"event": "prompt_complete", "prompt_id": prompt_id, "failed": failed})
+        await queue.put(_DONE)
+
+    tasks = [asyncio.create_task(answer(prompt_id, prompt)) for prompt_id, prompt in prompts]
+    failed = 0
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(event, dict) and event.get("event") == "prompt_complete" and event["failed"]:
+                failed += 1
+            yield event
+        yield {"event": "batch_complete", "prompt_count": len(prompts), "failed": failed}
+    finally:
+        await cancel_tasks(*tasks)
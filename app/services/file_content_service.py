@@ -0,0 +1,112 @@
+import logging
+from typing import Dict, List
+
+import httpx
+
+from app import settings
+from app.cache import ByteLRUCache
+from app.http_client import stage_timeout
+from app.metrics import Counter, Gauge
+from app.single_flight import SingleFlight
+from app.streaming import loads_offloaded
+from app.utils import FileContentResponse, FilePathEntry
+
+logger = logging.getLogger(__name__)
+
+FILE_CONTENT_CACHE_REQUESTS = Counter(
+    "machtiani_file_content_cache_requests_total",
+    "File content cache lookups per path, by result (hit or miss).",
+    ("result",),
+)
+
+FILE_CONTENT_CACHE_BYTES = Gauge(
+    "machtiani_file_content_cache_bytes",
+    "Resident size of the cached file contents in bytes.",
+)
+
+# File bodies keyed by (project, head_commit_hash, path). The head is the
+# client's, but /retrieve-file-contents/ reads the server's current checkout:
+# a prompt sent before a sync would store old contents under the new head.
+# Entries therefore expire, so such contents are served for at most the TTL.
+_file_content_cache = ByteLRUCache(
+    max_bytes=settings.FILE_CONTENT_CACHE_MAX_BYTES,
+    ttl=settings.FILE_CONTENT_CACHE_TTL,
+)
+
+# Concurrent fetches of the same missing paths share one upstream call
+_file_content_flights = SingleFlight("retrieve_file_contents")
+
+
+def file_content_cache_stats() -> dict:
+    lookups = _file_content_cache.hits + _file_content_cache.misses
+    return {
+        "entries": len(_file_content_cache),
+        "bytes": _file_content_cache.bytes,
+        "max_bytes": _file_content_cache.max_bytes,
+        "hit_ratio": _file_content_cache.hits / lookups if lookups else 0.0,
+    }
+
+
+async def retrieve_file_contents(
+    client: httpx.AsyncClient,
+    project: str,
+    head_commit_hash: str,
+    file_paths: List[str],
+    ignore_files: List[str],
+) -> Dict[str, str]:
+    """
+    Return ``path -> content`` for ``file_paths``, asking commit-file-retrieval
+    only for the paths that are not already cached at this head commit.
+    """
+    contents: Dict[str, str] = {}
+    missing: List[str] = []
+    for path in file_paths:
+        content = _file_content_cache.get((project, head_commit_hash, path))
+        if content is None:
+            missing.append(path)
+        else:
+            contents[path] = content
+
+    hits = len(file_paths) - len(missing)
+    FILE_CONTENT_CACHE_REQUESTS.inc(hits, result="hit")
+    FILE_CONTENT_CACHE_REQUESTS.inc(len(missing), result="miss")
+
+    if missing:
+        key = (project, head_commit_hash, tuple(sorted(missing)), tuple(sorted(ignore_files or [])))
+        fetched = await _file_content_flights.do(
+            key, lambda: _fetch_file_contents(client, project, head_commit_hash, missing, ignore_files)
+        )
+        contents.update(fetched)
+        FILE_CONTENT_CACHE_BYTES.set(_file_content_cache.bytes)
+
+    stats = file_content_cache_stats()
+    logger.info(
+        "File content cache: %d hits, %d misses for project %s; %d bytes resident, hit ratio %.2f",
+        hits, len(missing), project, stats["bytes"], stats["hit_ratio"],
+    )
+    return contents
+
+
+async def _fetch_file_contents(
+    client: httpx.AsyncClient,
+    project: str,
+    head_commit_hash: str,
+    file_paths: List[str],
+    ignore_files: List[str],
+) -> Dict[str, str]:
+    response = await client.post(
+        f"{settings.COMMIT_FILE_RETRIEVAL_URL}/retrieve-file-contents/",
+        json={
+            "project_name": project,
+            "file_paths": [FilePathEntry(path=path).dict() for path in file_paths],
+            "ignore_files": ignore_files,
+        },
+        timeout=stage_timeout("retrieve_file_contents"),
+    )
+    response.raise_for_status()
+    fetched = FileContentResponse(**await loads_offloaded(response.content)).contents
+    del response
+
+    for path, content in fetched.items():
+        _file_content_cache.set((project, head_commit_hash, path), content)
+    return fetched
@@ -2,26 +2,15 @@ import re
 import os
 import json
 import logging
+import uuid
 from pydantic import HttpUrl
 from typing import Optional
 from fastapi import HTTPException
-from app.utils import add_sys_path
+from app.llm_clients import llm_clients
+from app.scheduler import llm_scheduler
+from app.tokenizer import count_offloaded, get_tokenizer
 
-# Update the path to correctly point to machtiani-commit-file-retrieval/lib
-path_to_add = os.path.abspath('/app/machtiani-commit-file-retrieval')
 logger = logging.getLogger(__name__)
-logger.info("Adding to sys.path: %s", path_to_add)
-
-# Use the context manager to handle imports
-try:
-    with add_sys_path(path_to_add):
-        from lib.ai.llm_model import (
-            LlmModel,
-        )
-    logger.info("Imports successful.")
-except ModuleNotFoundError as e:
-    logger.error(f"ModuleNotFoundError: {e}")
-    logger.error("Failed to import the module. Please check the paths and directory structure.")
 
 async def generate_filename(context: str, llm_model: str, llm_model_api_key: str, llm_model_base_url: HttpUrl, llm_model_base_url_other: Optional[str] = None, llm_model_api_key_other: Optional[str] = None) -> str:
     logger.info("Generating filename for context (length: %d chars)", len(context))
@@ -44,19 +33,23 @@ async def generate_filename(context: str, llm_model: str, llm_model_api_key: str
 
     llm_model_api_key_to_use = llm_model_api_key_other if llm_model_api_key_other is not None else llm_model_api_key
 
-    logger.info(f"Using LLM model to create file: {llm_model_base_url_to_use} and API key: {llm_model_api_key_to_use}")
+    logger.info("Using LLM model to create file: %s", llm_model_base_url_to_use)
 
-    try:
-        # Instantiate LlmModel
-        llm_model = LlmModel(model=llm_model, api_key=llm_model_api_key_to_use, base_url=str(llm_model_base_url_to_use))
+    base_url = str(llm_model_base_url_to_use)
+    prompt_tokens = await count_offloaded(get_tokenizer(llm_model), filename_prompt)
 
-        logger.debug("Sending prompt to LLM model")
-        async for token_json in llm_model.send_prompt_streaming(filename_prompt):
-            # Parse the JSON string to extract the token
-            token_data = json.loads(token_json)
-            token = token_data.get("token", "")
-            response_tokens.append(token)
-            logger.debug("Received token: %s", token)
+    try:
+        # Pass the provider's rate limits and hold a scheduler slot like every
+        # other LLM call, reusing a warm LlmModel for this provider, model and key
+        async with llm_scheduler.slot(uuid.uuid4().hex, base_url, prompt_tokens), \
+                llm_clients.lease(llm_model, llm_model_api_key_to_use, base_url) as llm_client:
+            logger.debug("Sending prompt to LLM model")
+            async for token_json in llm_client.send_prompt_streaming(filename_prompt):
+                # Parse the JSON string to extract the token
+                token_data = json.loads(token_json)
+                token = token_data.get("token", "")
+                response_tokens.append(token)
+                logger.debug("Received token: %s", token)
 
 
         # Concatenate all tokens to form the complete response string
@@ -1,32 +1,223 @@
 import httpx
 import json
-import re
-import os
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import SecretStr, HttpUrl
 from fastapi import HTTPException
 import asyncio
+import time
+import uuid
 from app.utils import (
-    aggregate_file_paths,
-    remove_duplicate_file_paths,
-    separate_file_paths_by_type,
-    FileContentResponse,
-    FilePathEntry,
-    FileSearchResponse,
     SearchMode,
     count_tokens,
-    add_sys_path,
-    check_token_limit,
-    adjusted_file_scores,
-    top_n_files,
+    cancel_tasks,
 )
-from lib.ai.llm_model import LlmModel
+from app.context_packing import (
+    context_budget,
+    context_window,
+    pack_context,
+    PromptBuilder,
+    rank_file_candidates,
+    reserved_output_tokens,
+)
+from app import settings
+from app.http_client import get_http_client, stage_timeout
+from app.log_format import log_fields, summarize
+from app.services.pull_access_service import check_pull_access
+from app.services.file_content_service import retrieve_file_contents
+from app.services.infer_file_service import infer_files
+from app.scheduler import llm_scheduler, provider_name
+from app.hedging import hedged_stream, PRIMARY, ALTERNATE
+from app.llm_clients import llm_clients
+from app.metrics import (
+    CANCELLED_WORK,
+    LLM_OUTPUT_TOKENS,
+    LLM_STREAM_DURATION,
+    LLM_TIME_TO_FIRST_TOKEN,
+    LLM_TOKENS_PER_SECOND,
+)
+from app.streaming import EncodedEvent, loads, loads_offloaded
+from app.profiling import RequestProfiler
+from app.timings import RequestTimings
+from app.tracing import current_trace_id, record_span, wall_time_since
+from app.response_cache import response_cache, response_cache_key
 
 logger = logging.getLogger(__name__)
 
-# Define token limits for different models
-MAX_TOKENS = 128000
+
+async def fetch_file_summaries(
+    client: httpx.AsyncClient,
+    get_file_summary_url: str,
+    project: str,
+    file_paths: List[str],
+) -> Dict[str, str]:
+    """Fetch file summaries from commit-file-retrieval as a ``path -> summary`` dict."""
+    response = await client.get(
+        get_file_summary_url,
+        params={"project_name": project, "file_paths": file_paths},
+        timeout=stage_timeout("retrieve_file_contents"),
+    )
+    response.raise_for_status()
+    data = await loads_offloaded(response.content)
+
+    # Accept either a mapping of path to summary or a list of summary records
+    summaries: Dict[str, str] = {}
+    if isinstance(data, dict):
+        for path, summary in data.items():
+            if isinstance(summary, dict):
+                summary = summary.get("summary")
+            if isinstance(summary, str):
+                summaries[path] = summary
+    elif isinstance(data, list):
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            path = item.get("file_path") or item.get("path")
+            summary = item.get("summary")
+            if path and isinstance(summary, str):
+                summaries[path] = summary
+    return summaries
+
+
+def upstream_error_event(exc: httpx.HTTPError) -> dict:
+    """The error event for a failed call to commit-file-retrieval."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        logger.error("Request error: %s", exc)
+        return {"error": f"Error connecting to commit-file-retrieval service: {exc}"}
+    logger.error("HTTP status error: %s", summarize(exc.response.text))
+    try:
+        detail = exc.response.json()
+    except ValueError:
+        # A proxy or server error page rather than a JSON error body
+        detail = exc.response.text
+    return {"error": f"Error response from commit-file-retrieval service: {detail}"}
+
+
+def build_infer_params(
+    prompt: str,
+    project: str,
+    mode: str,
+    model: str,
+    match_strength: str,
+    llm_model_api_key: str,
+    llm_model_base_url: str,
+    ignore_files: List[str],
+    head_commit_hash: str,
+) -> dict:
+    return {
+        "prompt": prompt,
+        "project": project,
+        "mode": mode,
+        # model will be used for file localization inference, as infer uses a local hosted embedding model.
+        "model": model,
+        "match_strength": match_strength,
+        "llm_model_api_key": llm_model_api_key,
+        "llm_model_base_url": str(llm_model_base_url),
+        "embeddings_model_api_key": llm_model_api_key, # We will change it to refer to embedding_model_api_key
+        "embeddings_model": "all-MiniLM-L6-v2",
+        "ignore_files": ignore_files,
+        "head": head_commit_hash,
+    }
+
+
+async def file_edit_result(file_path: str, task: asyncio.Task) -> Optional[dict]:
+    """Turn a finished /file-edit/ task into an update entry, or None to skip the file."""
+    try:
+        resp = task.result()
+        resp.raise_for_status()
+        # Edited files come back whole; large ones are parsed off the event loop
+        resp_json = await loads_offloaded(resp.content)
+    except Exception as e:
+        logger.error("[file-edit] Error editing %s: %s", file_path, e)
+        return {
+            "updated_content": f"[Error updating file: {e}]",
+            "errors": [str(e)],
+        }
+
+    errors = resp_json.get("errors", [])
+    if errors:
+        logger.warning("[file-edit] Skipping update for %s due to errors: %s", file_path, summarize(errors))
+        return None
+    return {
+        "updated_content": resp_json.get("updated_content", ""),
+        "errors": errors,
+    }
+
+
+async def new_files_result(task: asyncio.Task) -> Optional[dict]:
+    """Return the /new-files/ response if it suggests valid new files, else None."""
+    try:
+        resp = task.result()
+        resp.raise_for_status()
+        resp_json = await loads_offloaded(resp.content)
+    except Exception:
+        logger.exception("[new-files] Unexpected error calling endpoint")
+        # Just log error; don't yield to client
+        return None
+
+    logger.info("[new-files] Response status: %d", resp.status_code)
+    if not resp_json or not isinstance(resp_json, dict):
+        logger.warning("[new-files] Empty response from new-files endpoint")
+        return None
+
+    errors = resp_json.get("errors", [])
+    if errors:
+        logger.warning("[new-files] Errors in response: %s", summarize(errors))
+    new_content = resp_json.get("new_content", {})
+    logger.info("[new-files] Received %d new file suggestions", len(new_content))
+    if new_content and not any(errors):
+        logger.debug("[new-files] New file paths: %s", summarize(list(new_content)))
+        return resp_json
+    logger.info("[new-files] No valid new files to suggest or errors present")
+    return None
+
+
+async def stream_llm_tokens(
+    request_id: str,
+    model: str,
+    api_key: str,
+    base_url: str,
+    prompt: str,
+    token_count: int,
+):
+    """
+    Stream encoded token frames from one provider under the shared scheduler.
+
+    A scheduler slot is held only until the first token: opening the
+    request is what competes for the provider, while the rest of the stream
+    goes at the reader's pace, and a slow or detached reader must not keep
+    a slot from other prompts' file edits. The stream is not retried by the
+    scheduler: ``LlmModel`` does not expose the provider's status codes.
+    """
+    provider = provider_name(base_url)
+    started = time.monotonic()
+    first_token_at = None
+    chunks = 0
+    async with llm_clients.lease(model, api_key, base_url) as llm_model:
+        tokens = llm_model.send_prompt_streaming(prompt)
+        try:
+            async with llm_scheduler.slot(request_id, base_url, token_count):
+                try:
+                    token_json = await tokens.__anext__()
+                except StopAsyncIteration:
+                    return
+            first_token_at = time.monotonic()
+            LLM_TIME_TO_FIRST_TOKEN.observe(first_token_at - started, provider=provider)
+            chunks = 1
+            yield token_json
+            async for token_json in tokens:
+                # Per-token cost is one addition; the rest is recorded once per stream
+                chunks += 1
+                yield token_json
+        finally:
+            aclose = getattr(tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            finished = time.monotonic()
+            LLM_STREAM_DURATION.observe(finished - started, provider=provider)
+            LLM_OUTPUT_TOKENS.inc(chunks, provider=provider)
+            if chunks > 1 and finished > first_token_at:
+                LLM_TOKENS_PER_SECOND.observe((chunks - 1) / (finished - first_token_at), provider=provider)
 
 
 async def generate_response(
@@ -43,315 +234,462 @@ async def generate_response(
     head_commit_hash: str,
     llm_model_base_url_other: Optional[str] = None,
     llm_model_api_key_other: Optional[str] = None,
+    hedge: bool = False,
+    profile: bool = False,
+):
+    """
+    Stream the response events for a prompt, ending with a ``timings`` event.
+
+    The timings event breaks the request down by stage, with token counts
+    and bytes moved; the same data is logged as one JSON line per request.
+    With ``profile``, the request's own steps run under cProfile and a
+    ``profile`` event naming the written artifact precedes the timings.
+    """
+    # Identifies this prompt to the shared LLM scheduler for fair queuing
+    request_id = uuid.uuid4().hex
+    # The request id doubles as the trace id of its spans and upstream calls
+    timings = RequestTimings(trace_id=request_id)
+    outcome = "ok"
+    profiler = RequestProfiler(request_id) if profile else None
+    responses = _generate_response(
+        request_id,
+        timings,
+        prompt,
+        project,
+        mode,
+        model,
+        match_strength,
+        llm_model_api_key,
+        llm_model_base_url,
+        codehost_api_key,
+        codehost_url,
+        ignore_files,
+        head_commit_hash,
+        llm_model_base_url_other,
+        llm_model_api_key_other,
+        hedge,
+    )
+    try:
+        while True:
+            # Each step may run in a different task; tag its upstream calls
+            current_trace_id.set(request_id)
+            try:
+                step = responses.__anext__()
+                event = await (profiler.run(step) if profiler is not None else step)
+            except StopAsyncIteration:
+                break
+            if isinstance(event, dict) and "error" in event:
+                outcome = "error"
+            yield event
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        await responses.aclose()
+        record_span(
+            request_id, "generate_response", "request", wall_time_since(timings.started),
+            timings.elapsed(), project=project, mode=mode, model=model, outcome=outcome,
+        )
+        # Skip serializing the breakdown when INFO records are dropped
+        if logger.isEnabledFor(logging.INFO):
+            record = timings.as_event(outcome)
+            del record["event"]
+            logger.info("generate_response timings: %s", json.dumps({
+                "trace_id": request_id,
+                "project": project,
+                "mode": mode,
+                "model": model,
+                **record,
+            }))
+    if profiler is not None:
+        yield await asyncio.to_thread(profiler.as_event)
+    yield {**timings.as_event(outcome), "trace_id": request_id}
+
+
+async def _generate_response(
+    request_id: str,
+    timings: RequestTimings,
+    prompt: str,
+    project: str,
+    mode: str,
+    model: str,
+    match_strength: str,
+    llm_model_api_key: str,
+    llm_model_base_url: HttpUrl,
+    codehost_api_key: Optional[SecretStr],
+    codehost_url: HttpUrl,
+    ignore_files: List[str],
+    head_commit_hash: str,
+    llm_model_base_url_other: Optional[str] = None,
+    llm_model_api_key_other: Optional[str] = None,
+    hedge: bool = False,
 ):
     # The function treats answer-only mode the same as default mode
     # The answer-only handling is managed client-side in the Go code
 
     logger.debug("Begin generate_response service")
-    logger.debug(f"Input parameters: prompt ({len(prompt)} chars), project: {project}, mode: {mode}, model: {model}, match_strength: {match_strength}")
+    logger.debug("Input parameters: %s", log_fields(prompt_chars=len(prompt), project=project, mode=mode, model=model, match_strength=match_strength))
 
     if match_strength not in ["high", "mid", "low"]:
         yield {"error": "Invalid match strength selected. Choose either 'high', 'mid', or 'low'."}
         return
 
-    if not await check_token_limit(prompt, model, MAX_TOKENS):
+    prompt_token_count = await count_tokens(prompt, model)
+    timings.add("prompt_tokens", prompt_token_count)
+    prompt_token_limit = context_window(model) - reserved_output_tokens(model)
+    if prompt_token_count > prompt_token_limit:
         error_message = (
             f"Prompt token limit exceeded for the selected model. "
-            f"Limit: {max_tokens}, Count: {token_count}. "
+            f"Limit: {prompt_token_limit}, Count: {prompt_token_count}. "
             f"Please reduce the length of your prompt."
         )
         logger.error(error_message)
         yield {"error": error_message}
         return
 
-    base_url = "http://commit-file-retrieval:5070"
-    infer_file_url = f"{base_url}/infer-file/"
-    get_file_summary_url = f"{base_url}/get-file-summary/?project_name={project}"
-    test_pull_access_url = f"{base_url}/test-pull-access/"
+    base_url = settings.COMMIT_FILE_RETRIEVAL_URL
+    get_file_summary_url = f"{base_url}/get-file-summary/"
 
+    infer_task = None
+    edit_tasks = []
+    # Stage in progress, used to attribute cancelled work when the client goes away
+    stage = "pull_access"
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(1200, read=1200.0)) as client:
-            params = {
-                'project_name': project,
-                'codehost_api_key': codehost_api_key.get_secret_value() if codehost_api_key else None,
-                'codehost_url': codehost_url
-            }
-            logger.debug("Calling pull access check with params: %s", params)
-            pull_access_response = await client.post(test_pull_access_url, params=params)
-            pull_access_response.raise_for_status()
-            pull_access_data = pull_access_response.json()
-            logger.debug("Pull access response: %s", pull_access_data)
-            if not pull_access_data.get('pull_access', False):
-                raise HTTPException(status_code=403, detail="Pull access denied.")
-
-            # Safely determine which API key to use
-            llm_model_base_url_to_use = llm_model_base_url_other if llm_model_base_url_other else llm_model_base_url
-
-            llm_model_api_key_to_use = llm_model_api_key_other if llm_model_api_key_other else llm_model_api_key
-
-
-
-            logger.info(f"Using LLM model URL: {llm_model_base_url_to_use}")
-            logger.info(f"Using LLM model API key: {llm_model_api_key_to_use}")
+        client = get_http_client()
+
+        # Safely determine which API key to use
+        llm_model_base_url_to_use = llm_model_base_url_other if llm_model_base_url_other else llm_model_base_url
+
+        llm_model_api_key_to_use = llm_model_api_key_other if llm_model_api_key_other else llm_model_api_key
+
+        infer_params = None
+        if mode != SearchMode.pure_chat:
+            infer_params = build_infer_params(
+                prompt,
+                project,
+                mode,
+                model,
+                match_strength,
+                llm_model_api_key_to_use,
+                llm_model_base_url_to_use,
+                ignore_files,
+                head_commit_hash,
+            )
+
+        # In speculative mode infer-file runs alongside the pull-access check.
+        # Its result is only awaited once access is confirmed, and the task is
+        # cancelled if access is denied or anything fails before it is used.
+        if settings.SPECULATIVE_PULL_ACCESS and infer_params is not None:
+            infer_task = asyncio.create_task(infer_files(client, infer_params))
+
+        with timings.stage("pull_access"):
+            has_pull_access = await check_pull_access(client, project, codehost_url, codehost_api_key)
+        if not has_pull_access:
+            await cancel_tasks(infer_task)
+            raise HTTPException(status_code=403, detail="Pull access denied.")
+
+        logger.info("Using LLM model URL: %s", llm_model_base_url_to_use)
+
+        if mode == SearchMode.pure_chat:
+            combined_prompt = prompt
+            token_count = prompt_token_count
+            retrieved_file_paths = []
+            file_tokens = {}
+        else:
+            stage = "infer_file"
+            with timings.stage("infer_file"):
+                if infer_task is not None:
+                    list_file_search_response = await infer_task
+                else:
+                    list_file_search_response = await infer_files(client, infer_params)
 
-            llm_model = LlmModel(api_key=llm_model_api_key_to_use, base_url=str(llm_model_base_url_to_use), model=model)
+            # Rank every inferred path; the token budget, not a fixed file
+            # count, decides how many of them make it into the prompt.
+            max_candidates = settings.PACKING_MAX_CANDIDATES[match_strength]
+            candidates = rank_file_candidates(list_file_search_response, ignore_files, max_candidates)
+            logger.info("Ranked %d candidate files", len(candidates))
+            logger.debug("Candidate files: %s", summarize([candidate.path for candidate in candidates]))
 
-            if mode == SearchMode.pure_chat:
-                combined_prompt = prompt
-                retrieved_file_paths = []
-            else:
+            if not candidates:
+                yield {"machtiani": "no files found"}
+                return
 
-                infer_params = {
-                    "prompt": prompt,
+            stage = "retrieve_file_contents"
+            with timings.stage("retrieve_file_contents"):
+                file_contents = await retrieve_file_contents(
+                    client,
+                    project,
+                    head_commit_hash,
+                    [candidate.path for candidate in candidates],
+                    ignore_files,
+                )
+            timings.add("files_retrieved", len(file_contents))
+            timings.add("file_bytes", sum(len(content) for content in file_contents.values()))
+
+            timings.start("context_packing")
+            context_intro = "\n\nHere are the relevant files:\n"
+            token_count = prompt_token_count + await count_tokens(context_intro, model)
+            builder = PromptBuilder(f"{prompt}{context_intro}", context_budget(model, token_count))
+
+            async def fetch_summaries(paths: List[str]) -> Dict[str, str]:
+                return await fetch_file_summaries(client, get_file_summary_url, project, paths)
+
+            packed_files = await pack_context(
+                project,
+                model,
+                candidates,
+                file_contents,
+                builder,
+                fetch_summaries=fetch_summaries,
+            )
+            # Unpacked file bodies are no longer needed once the builder holds the chosen ones
+            del file_contents
+            retrieved_file_paths = [packed.path for packed in packed_files]
+            file_tokens = {packed.path: packed.tokens for packed in packed_files}
+            token_count += builder.used_tokens
+            combined_prompt = builder.build()
+            timings.stop("context_packing")
+            timings.add("files_packed", len(packed_files))
+
+        logger.info("model: %s, token count: %d, context window: %d", model, token_count, context_window(model))
+        timings.add("context_tokens", token_count)
+        timings.add("context_bytes", len(combined_prompt))
+
+        # Yield retrieved_file_paths if any
+        if retrieved_file_paths:
+            yield {"retrieved_file_paths": retrieved_file_paths}
+
+        # Accumulate tokens from OpenAI response
+        stage = "llm_stream"
+        response_tokens = []
+        # Only default mode needs the full answer text, for the file edits
+        collect_response = mode == SearchMode.default
+
+        def open_stream(base_url: str, api_key: str):
+            return stream_llm_tokens(request_id, model, api_key, base_url, combined_prompt, token_count)
+
+        # The provider the request goes to without hedging, as for the edits below
+        primary = (str(llm_model_base_url_to_use), llm_model_api_key_to_use)
+        if hedge and settings.LLM_HEDGING_ENABLED and llm_model_base_url_other:
+            # The other url overrides the base one; hedging races it against the base url
+            alternate = (str(llm_model_base_url), llm_model_api_key)
+            token_stream = hedged_stream(
+                lambda: open_stream(*primary),
+                lambda: open_stream(*alternate),
+                settings.LLM_HEDGE_DELAY_MS / 1000.0,
+                {PRIMARY: provider_name(primary[0]), ALTERNATE: provider_name(alternate[0])},
+            )
+        else:
+            token_stream = open_stream(*primary)
+
+        timings.start("llm_first_token")
+        timings.start("llm_stream")
+        output_chunks = output_bytes = 0
+        try:
+            async for token_json in token_stream:
+                if not output_chunks:
+                    timings.stop("llm_first_token")
+                output_chunks += 1
+                output_bytes += len(token_json)
+                if collect_response:
+                    response_tokens.append(loads(token_json).get("token", ""))
+                # Forward the provider's encoded token frame without re-encoding
+                yield EncodedEvent(token_json)
+        finally:
+            await token_stream.aclose()
+            timings.stop("llm_stream")
+            timings.add("output_chunks", output_chunks)
+            timings.add("output_bytes", output_bytes)
+
+        final_response_text = ''.join(response_tokens)
+        # The prompt is not needed for the edit fan-out, which can run for minutes
+        del combined_prompt, response_tokens
+
+
+        # Call file-edit for each retrieved file path, log response
+
+        if mode == SearchMode.default:
+            # A disconnect at the yield below abandons the edit stage, not the finished LLM stream
+            stage = "file_edit"
+            # Notify the client that we're about to call file-edit and new-files in parallel
+            yield {
+                "event": "file_edit_start",
+                "message": "Waiting on file-edit/new-files requests…",
+                "file_count": len(retrieved_file_paths),
+                "retrieved_file_paths": retrieved_file_paths,
+            }
+            file_edit_url = f"{base_url}/file-edit/"
+            llm_base_url = str(llm_model_base_url_to_use)
+            # Edits read the instructions and the file and write the file back
+            instruction_tokens = await count_tokens(final_response_text, model)
+            timings.add("output_tokens", instruction_tokens)
+            # Map each task to its file path; None marks the new-files task
+            task_paths = {}
+            for file_path in retrieved_file_paths:
+                payload = {
                     "project": project,
-                    "mode": mode,
-                    # model will be used for file localization inference, as infer uses a local hosted embedding model.
-                    "model": model,
-                    "match_strength": match_strength,
+                    "file_path": file_path,
+                    "instructions": final_response_text,
                     "llm_model_api_key": llm_model_api_key_to_use,
                     "llm_model_base_url": str(llm_model_base_url_to_use),
-                    "embeddings_model_api_key": llm_model_api_key_to_use, # We will change it to refer to embedding_model_api_key
-                    "embeddings_model": "all-MiniLM-L6-v2",
-                    "ignore_files": ignore_files,
-                    "head": head_commit_hash,
+                    "model": model,
+                    "ignore_files": ignore_files or []
                 }
-
-                logger.debug("Calling infer-file with params: %s", infer_params)
-                response = await client.post(infer_file_url, json=infer_params)
-                response.raise_for_status()
-                list_file_search_response = [FileSearchResponse(**item) for item in response.json()]
-                logger.debug("Response from infer-file: %s", list_file_search_response)
-
-
-                # Separate file paths by type
-                commit_paths, file_paths, localization_paths = separate_file_paths_by_type(list_file_search_response)
-
-                # Adjust number of files based on match_strength
-                num_commit_files = 3
-                num_file_files = 0
-                num_localization_files = 3
-                if match_strength == "mid":
-                    num_commit_files = 5
-                    num_file_files = 0
-                    num_localization_files = 5
-                elif match_strength == "low":
-                    num_commit_files = 10
-                    num_file_files = 0
-                    num_localization_files = 10
-
-                # Get top n commit paths
-                scores = adjusted_file_scores(list_file_search_response)  # Dict[str, float]
-                if not scores:                          # no commit hits at all
-                    logger.critical(f"adjusted scoring of file paths failed")
-                    top_commit_paths = commit_paths[:1] #fall back to old scoring if fails.
-                else:
-                    top_commit_paths = [
-                        FilePathEntry(path=p)               # return proper object, not bare str
-                        for p, _ in top_n_files(scores, num_commit_files)
-                    ]
-                logger.info(f"Top {len(top_commit_paths)} commit paths before dedup: {top_commit_paths}")
-
-                logger.debug(f"file scores for commits:\n\n {scores}")
-
-                # Get top n file paths
-                top_file_paths = file_paths[:num_file_files]
-                logger.info(f"Top {len(top_file_paths)} file paths before removing duplicates: {top_file_paths}\n")
-
-                # Get top n localization paths
-                top_localization_paths = localization_paths[:num_localization_files]
-                logger.info(f"Top {len(top_localization_paths)} localization paths before removing duplicates: {top_localization_paths}\n")
-
-                list_file_path_entry = top_commit_paths.copy()
-                list_file_path_entry.extend(top_file_paths)
-                list_file_path_entry.extend(top_localization_paths)
-                logger.info(f"list of file paths before removing duplicates: {list_file_path_entry}")
-
-                if list_file_path_entry:
-                    # dedupe & filter
-                    list_file_path_entry = await remove_duplicate_file_paths(list_file_path_entry)
-                    list_file_path_entry = [
-                        entry for entry in list_file_path_entry
-                        if entry.path not in ignore_files
-                    ]
-                    # prefer localization, else fall back to everything
-                    payload_entries = top_localization_paths or list_file_path_entry
-                    file_paths_payload = [entry.dict() for entry in payload_entries]
-                else:
-                    file_paths_payload = []
-
-
-                logger.info(f"Payload for retrieve-file-contents: {file_paths_payload}")
-
-                if not file_paths_payload:
-                    yield {"machtiani": "no files found"}
-                    return
-
-                content_response = await client.post(
-                    f"{base_url}/retrieve-file-contents/",
-                    json={
-                        "project_name": project,
-                        "file_paths": file_paths_payload,
-                        "ignore_files": ignore_files
+                task = asyncio.create_task(llm_scheduler.request(
+                    request_id,
+                    llm_base_url,
+                    instruction_tokens + 2 * file_tokens.get(file_path, 0),
+                    lambda payload=payload: client.post(
+                        file_edit_url, json=payload, timeout=stage_timeout("file_edit")
+                    ),
+                ))
+                task_paths[task] = file_path
+
+            # Create new-files task (just one)
+            new_files_url = f"{base_url}/new-files/"
+            new_files_payload = {
+                "project": project,
+                "instructions": final_response_text,
+                "llm_model_api_key": llm_model_api_key_to_use,
+                "llm_model_base_url": str(llm_model_base_url_to_use),
+                "model": model,
+                "ignore_files": ignore_files or []
+            }
+            new_files_task = asyncio.create_task(llm_scheduler.request(
+                request_id,
+                llm_base_url,
+                2 * instruction_tokens,
+                lambda: client.post(
+                    new_files_url, json=new_files_payload, timeout=stage_timeout("new_files")
+                ),
+            ))
+            task_paths[new_files_task] = None
+            edit_tasks = list(task_paths)
+            timings.start("file_edit")
+
+            # Emit every result as its own event in completion order, so one
+            # slow file does not hold back the others.
+            summary = {"updated": 0, "failed": 0, "skipped": 0, "new_files": 0}
+            pending = set(edit_tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    file_path = task_paths[task]
+                    if file_path is None:
+                        new_files = await new_files_result(task)
+                        if new_files:
+                            summary["new_files"] = len(new_files.get("new_content", {}))
+                            yield {"new_files": new_files}
+                        continue
+
+                    update = await file_edit_result(file_path, task)
+                    if update is None:
+                        summary["skipped"] += 1
+                        continue
+                    summary["failed" if update["errors"] else "updated"] += 1
+                    timings.add("edit_bytes", len(update["updated_content"]))
+                    yield {
+                        "event": "file_edit_result",
+                        "updated_file_contents": {file_path: update},
                     }
-                )
-
-                content_response.raise_for_status()
-
-                file_content_response = FileContentResponse(**content_response.json())
-                retrieved_file_paths = file_content_response.retrieved_file_paths
-
-                # Convert FilePathEntry objects to string paths and filter out duplicates
-                top_commit_paths_to_add = [entry.path for entry in top_commit_paths if entry.path not in retrieved_file_paths]
-
-                if top_commit_paths_to_add:
-                    logger.info(f"Top commit paths added: {top_commit_paths_to_add}")
-
-                # Prepend the unique commit paths to the retrieved_file_paths list
-                retrieved_file_paths = top_commit_paths_to_add + retrieved_file_paths
-
-
-                seen = set()
-                deduped_paths = []
-                for path in retrieved_file_paths:
-                    if path not in seen:
-                        deduped_paths.append(path)
-                        seen.add(path)
-                retrieved_file_paths = deduped_paths
-
-                combined_prompt = f"{prompt}\n\nHere are the relevant files:\n"
-                for path, content in file_content_response.contents.items():
-                    combined_prompt += f"\n--- {path} ---\n{content}\n"
-
-            if not await check_token_limit(combined_prompt, model, MAX_TOKENS):
-                error_message = (
-                    f"Token limit exceeded for the selected model. "
-                    f"Limit: {max_tokens}, Count: {token_count}. "
-                    f"Please reduce the length of your prompt or the number of retrieved contents."
-                )
-                logger.error(error_message)
-                yield {"error": error_message}
-                return
-
-            # Yield retrieved_file_paths if any
-            if retrieved_file_paths:
-                yield {"retrieved_file_paths": retrieved_file_paths}
-
-            # Accumulate tokens from OpenAI response
-            response_tokens = []
-            async for token_json in llm_model.send_prompt_streaming(combined_prompt):
-                token_data = json.loads(token_json)
-                token = token_data.get("token", "")
-                response_tokens.append(token)
-                yield token_data  # Stream tokens as before
 
-            final_response_text = ''.join(response_tokens)
-
-
-            # Call file-edit for each retrieved file path, log response
+            timings.stop("file_edit")
+            logger.info("[file-edit] Finished: %s", summary)
+            yield {
+                "event": "file_edit_complete",
+                "file_count": len(retrieved_file_paths),
+                **summary,
+            }
 
-            if mode == SearchMode.default:
-                # Notify the client that we're about to call file-edit and new-files in parallel
-                yield {
-                    "event": "file_edit_start",
-                    "message": "Waiting on file-edit/new-files requests…",
-                    "file_count": len(retrieved_file_paths),
-                    "retrieved_file_paths": retrieved_file_paths,
-                }
-                file_edit_url = f"{base_url}/file-edit/"
-                updated_contents = {}
-                async with httpx.AsyncClient(timeout=600) as edit_client:
-                    # Create file-edit tasks for each file
-                    file_edit_tasks = []
-                    for file_path in retrieved_file_paths:
-                        payload = {
-                            "project": project,
-                            "file_path": file_path,
-                            "instructions": final_response_text,
-                            "llm_model_api_key": llm_model_api_key_to_use,
-                            "llm_model_base_url": str(llm_model_base_url_to_use),
-                            "model": model,
-                            "ignore_files": ignore_files or []
-                        }
-                        file_edit_tasks.append(edit_client.post(file_edit_url, json=payload))
-
-                    # Create new-files task (just one)
-                    new_files_url = f"{base_url}/new-files/"
-                    new_files_payload = {
-                        "project": project,
-                        "instructions": final_response_text,
-                        "llm_model_api_key": llm_model_api_key_to_use,
-                        "llm_model_base_url": str(llm_model_base_url_to_use),
-                        "model": model,
-                        "ignore_files": ignore_files or []
-                    }
-                    new_files_task = edit_client.post(new_files_url, json=new_files_payload)
-
-                    # Combine all tasks
-                    all_tasks = file_edit_tasks + [new_files_task]
-
-                    # Run all concurrently
-                    responses = await asyncio.gather(*all_tasks, return_exceptions=True)
-
-                    # The first N are for file edits, the last is for new-files
-                    for i, resp in enumerate(responses):
-                        try:
-                            if isinstance(resp, Exception):
-                                raise resp
-
-                            resp.raise_for_status()
-                            resp_json = resp.json()
-
-                            # File edit responses
-                            if i < len(file_edit_tasks):
-                                file_path = retrieved_file_paths[i]
-                                errors = resp_json.get("errors", [])
-                                if errors:
-                                    logger.warning(f"[file-edit] Skipping update for {file_path} due to errors: {errors}")
-                                    continue
-                                updated_contents[file_path] = {
-                                    "updated_content": resp_json.get("updated_content", ""),
-                                    "errors": errors,
-                                }
-                            # New-files response (last task)
-                            else:
-                                logger.info(f"[new-files] Response status: {resp.status_code}")
-                                if resp_json and isinstance(resp_json, dict):
-                                    errors = resp_json.get("errors", [])
-                                    if errors:
-                                        logger.warning(f"[new-files] Errors in response: {errors}")
-                                    new_content = resp_json.get("new_content", {})
-                                    logger.info(f"[new-files] Received {len(new_content)} new file suggestions")
-                                    if new_content and not any(errors):
-                                        logger.debug(f"[new-files] New file paths: {list(new_content.keys())}")
-                                        yield {"new_files": resp_json}
-                                    else:
-                                        logger.info("[new-files] No valid new files to suggest or errors present")
-                                else:
-                                    logger.warning("[new-files] Empty response from new-files endpoint")
-
-                        except Exception as e:
-                            if i < len(file_edit_tasks):
-                                file_path = retrieved_file_paths[i]
-                                logger.error(f"[file-edit] Error editing {file_path}: {e}")
-                                updated_contents[file_path] = {
-                                    "updated_content": f"[Error updating file: {e}]",
-                                    "errors": [str(e)],
-                                }
-                            else:
-                                logger.exception(f"[new-files] Unexpected error calling endpoint")
-                                # Just log error; don't yield to client
-
-                    # Yield updated file contents if any
-                    if updated_contents:
-                        logger.info(f"updated_file_contents: {updated_contents}")
-                        yield {"updated_file_contents": updated_contents}
-
-    except httpx.RequestError as exc:
-        logger.error(f"Request error: {exc}")
-        yield {"error": f"Error connecting to commit-file-retrieval service: {exc}"}
-    except httpx.HTTPStatusError as exc:
-        logger.error(f"HTTP status error: {exc.response.json()}")
-        yield {"error": f"Error response from commit-file-retrieval service: {exc.response.json()}"}
+    except httpx.HTTPError as exc:
+        yield upstream_error_event(exc)
     except Exception as e:
         logger.exception("Unexpected error occurred")
         yield {"error": f"An unexpected error occurred: {str(e)}"}
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client disconnected: count each stage being abandoned once,
+        # the finally block below cancels any tasks still running.
+        logger.info("generate_response cancelled during %s", stage)
+        CANCELLED_WORK.inc(stage=stage)
+        if stage != "infer_file" and infer_task is not None and not infer_task.done():
+            # The speculative infer-file call was still running alongside pull access
+            CANCELLED_WORK.inc(stage="infer_file")
+        raise
+    finally:
+        await cancel_tasks(infer_task, *edit_tasks)
+
+
+async def cached_generate_response(
+    prompt: str,
+    project: str,
+    mode: str,
+    model: str,
+    match_strength: str,
+    llm_model_api_key: str,
+    llm_model_base_url: HttpUrl,
+    codehost_api_key: Optional[SecretStr],
+    codehost_url: HttpUrl,
+    ignore_files: List[str],
+    head_commit_hash: str,
+    llm_model_base_url_other: Optional[str] = None,
+    llm_model_api_key_other: Optional[str] = None,
+    hedge: bool = False,
+):
+    """
+    generate_response with the full-response cache in front of it.
+
+    A hit replays the recorded events (retrieved paths, token frames and
+    edit results) after a ``cache_hit`` event; pull access is still checked
+    before anything is replayed. A miss streams live and records the events,
+    storing them only if the stream finished without an error.
+    """
+    key = response_cache_key(prompt, project, head_commit_hash, model, mode, match_strength, ignore_files)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        try:
+            has_pull_access = await check_pull_access(get_http_client(), project, codehost_url, codehost_api_key)
+        except httpx.HTTPError as exc:
+            yield upstream_error_event(exc)
+            return
+        if has_pull_access:
+            logger.info("Response cache hit for project %s at %s", project, head_commit_hash)
+            yield {"event": "cache_hit"}
+            for event in cached:
+                yield event
+            return
+
+    responses = generate_response(
+        prompt,
+        project,
+        mode,
+        model,
+        match_strength,
+        llm_model_api_key,
+        llm_model_base_url,
+        codehost_api_key,
+        codehost_url,
+        ignore_files,
+        head_commit_hash,
+        llm_model_base_url_other,
+        llm_model_api_key_other,
+        hedge,
+    )
+    recorded = []
+    failed = False
+    try:
+        async for event in responses:
+            if isinstance(event, dict):
+                if "error" in event:
+                    failed = True
+                elif event.get("event") == "timings":
+                    # Timings describe this run, not the replays
+                    yield event
+                    continue
+            recorded.append(event)
+            yield event
+    finally:
+        await responses.aclose()
+
+    # Only reached when the stream ran to completion
+    if not failed:
+        await response_cache.set(key, recorded)
@@ -0,0 +1,123 @@
+import logging
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+import httpx
+
+from app import settings
+from app.cache import TTLCache
+from app.http_client import stage_timeout
+from app.log_format import log_fields, summarize
+from app.metrics import Counter
+from app.single_flight import SingleFlight
+from app.streaming import loads_offloaded
+from app.utils import FileSearchResponse
+
+logger = logging.getLogger(__name__)
+
+INFER_FILE_CACHE_REQUESTS = Counter(
+    "machtiani_infer_file_cache_requests_total",
+    "Infer-file result cache lookups by result: exact, similar or miss.",
+    ("result",),
+)
+
+# Recent infer-file results per scope, where a scope is everything but the
+# prompt: (project, head, mode, match_strength, model, ignore_files). Each
+# scope holds up to INFER_FILE_CACHE_PER_SCOPE (normalized prompt, words,
+# results) entries, newest last.
+_infer_file_cache = TTLCache(
+    maxsize=settings.INFER_FILE_CACHE_SIZE,
+    ttl=settings.INFER_FILE_CACHE_TTL,
+)
+
+# Concurrent searches for the same scope and normalized prompt share one upstream call
+_infer_file_flights = SingleFlight("infer_file")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_prompt(prompt: str) -> Tuple[str, ...]:
+    """Lower-cased words of the prompt, ignoring punctuation and whitespace."""
+    return tuple(_WORD_RE.findall(prompt.lower()))
+
+
+def _scope(infer_params: dict) -> tuple:
+    return (
+        infer_params["project"],
+        infer_params["head"],
+        infer_params["mode"],
+        infer_params["match_strength"],
+        infer_params["model"],
+        tuple(sorted(infer_params.get("ignore_files") or [])),
+    )
+
+
+def _lookup(entries: list, words: Tuple[str, ...]) -> Tuple[Optional[list], str]:
+    for cached_words, results in reversed(entries):
+        if cached_words == words:
+            return results, "exact"
+
+    threshold = settings.INFER_FILE_SIMILARITY_THRESHOLD
+    if threshold <= 0:
+        return None, "miss"
+    for cached_words, results in reversed(entries):
+        matcher = SequenceMatcher(None, cached_words, words, autojunk=False)
+        # The quick ratios are cheap upper bounds; skip the full diff when they already fail
+        if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold \
+                and matcher.ratio() >= threshold:
+            return results, "similar"
+    return None, "miss"
+
+
+async def infer_files(
+    client: httpx.AsyncClient,
+    infer_params: dict,
+) -> List[FileSearchResponse]:
+    """
+    Rank files for the prompt with commit-file-retrieval's /infer-file/.
+
+    Results are memoized per project, head commit, mode and match strength.
+    Exact repeats of a prompt (after normalization) are served from memory,
+    and so are near-identical prompts once INFER_FILE_SIMILARITY_THRESHOLD
+    is set above 0.
+    """
+    scope = _scope(infer_params)
+    words = normalize_prompt(infer_params["prompt"])
+    entries = _infer_file_cache.get(scope)
+    if entries is not None:
+        results, result = _lookup(entries, words)
+        INFER_FILE_CACHE_REQUESTS.inc(result=result)
+        if results is not None:
+            logger.debug("Infer-file cache %s hit for project %s", result, infer_params["project"])
+            return results
+    else:
+        INFER_FILE_CACHE_REQUESTS.inc(result="miss")
+
+    return await _infer_file_flights.do(
+        (scope, words), lambda: _fetch_infer_files(client, infer_params, scope, words)
+    )
+
+
+async def _fetch_infer_files(
+    client: httpx.AsyncClient,
+    infer_params: dict,
+    scope: tuple,
+    words: Tuple[str, ...],
+) -> List[FileSearchResponse]:
+    logger.debug("Calling infer-file with params: %s", log_fields(**{key: value for key, value in infer_params.items() if "api_key" not in key}))
+    response = await client.post(
+        f"{settings.COMMIT_FILE_RETRIEVAL_URL}/infer-file/",
+        json=infer_params,
+        timeout=stage_timeout("infer_file"),
+    )
+    response.raise_for_status()
+    list_file_search_response = [FileSearchResponse(**item) for item in await loads_offloaded(response.content)]
+    logger.debug("Response from infer-file: %s", summarize(list_file_search_response))
+
+    # Re-read the scope: other requests may have added entries while this one waited
+    entries = [entry for entry in (_infer_file_cache.get(scope) or []) if entry[0] != words]
+    del entries[:max(0, len(entries) - settings.INFER_FILE_CACHE_PER_SCOPE + 1)]
+    entries.append((words, list_file_search_response))
+    _infer_file_cache.set(scope, entries)
+    return list_file_search_response
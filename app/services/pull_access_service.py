@@ -0,0 +1,85 @@
+import logging
+from typing import Optional
+
+import httpx
+from pydantic import SecretStr, HttpUrl
+
+from app import settings
+from app.cache import TTLCache, hash_secret
+from app.http_client import stage_timeout
+from app.metrics import Counter
+from app.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+PULL_ACCESS_CACHE_REQUESTS = Counter(
+    "machtiani_pull_access_cache_requests_total",
+    "Pull-access decision cache lookups by result (hit or miss).",
+    ("result",),
+)
+
+# Pull-access decisions keyed by (project, codehost_url, sha256(codehost_api_key)).
+_pull_access_cache = TTLCache(
+    maxsize=settings.PULL_ACCESS_CACHE_SIZE,
+    ttl=settings.PULL_ACCESS_CACHE_TTL,
+)
+
+# Concurrent checks for the same key share one upstream call
+_pull_access_flights = SingleFlight("test_pull_access")
+
+
+def _cache_key(project: str, codehost_url: HttpUrl, codehost_api_key: Optional[str]) -> tuple:
+    return (project, str(codehost_url), hash_secret(codehost_api_key))
+
+
+async def check_pull_access(
+    client: httpx.AsyncClient,
+    project: str,
+    codehost_url: HttpUrl,
+    codehost_api_key: Optional[SecretStr],
+) -> bool:
+    """
+    Ask commit-file-retrieval whether the credential can pull the project,
+    serving recent decisions from the in-gateway TTL cache.
+    """
+    api_key = codehost_api_key.get_secret_value() if codehost_api_key else None
+    key = _cache_key(project, codehost_url, api_key)
+
+    cached = _pull_access_cache.get(key)
+    PULL_ACCESS_CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        logger.debug("Pull access cache hit for project %s: %s", project, cached)
+        return cached
+
+    return await _pull_access_flights.do(
+        key, lambda: _fetch_pull_access(client, key, project, codehost_url, api_key)
+    )
+
+
+async def _fetch_pull_access(
+    client: httpx.AsyncClient,
+    key: tuple,
+    project: str,
+    codehost_url: HttpUrl,
+    api_key: Optional[str],
+) -> bool:
+    params = {
+        'project_name': project,
+        'codehost_api_key': api_key,
+        'codehost_url': codehost_url
+    }
+    logger.debug("Calling pull access check for project %s", project)
+    response = await client.post(
+        f"{settings.COMMIT_FILE_RETRIEVAL_URL}/test-pull-access/",
+        params=params,
+        timeout=stage_timeout("pull_access"),
+    )
+    response.raise_for_status()
+    pull_access_data = response.json()
+    logger.debug("Pull access response: %s", pull_access_data)
+
+    pull_access = bool(pull_access_data.get('pull_access', False))
+    ttl = settings.PULL_ACCESS_CACHE_TTL if pull_access else settings.PULL_ACCESS_CACHE_NEGATIVE_TTL
+    _pull_access_cache.set(key, pull_access, ttl=ttl)
+    return pull_access
+
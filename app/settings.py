@@ -0,0 +1,181 @@
+import json
+import os
+
+# Gateway settings, read once from the environment at import time.
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Base URL of the commit-file-retrieval service
+COMMIT_FILE_RETRIEVAL_URL = os.environ.get(
+    "COMMIT_FILE_RETRIEVAL_URL", "http://commit-file-retrieval:5070"
+)
+
+# Shared outbound HTTP client. HTTP/2 is only negotiated over TLS (https://)
+# upstreams and needs the optional h2 package, so it is off by default.
+HTTP2_ENABLED = _env_bool("HTTP2_ENABLED", False)
+HTTP_MAX_CONNECTIONS = _env_int("HTTP_MAX_CONNECTIONS", 100)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = _env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+HTTP_KEEPALIVE_EXPIRY = _env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+HTTP_CONNECT_TIMEOUT = _env_float("HTTP_CONNECT_TIMEOUT", 10.0)
+HTTP_WRITE_TIMEOUT = _env_float("HTTP_WRITE_TIMEOUT", 60.0)
+HTTP_POOL_TIMEOUT = _env_float("HTTP_POOL_TIMEOUT", 30.0)
+HTTP_READ_TIMEOUT = _env_float("HTTP_READ_TIMEOUT", 1200.0)
+
+# Per-stage read timeouts (seconds) for calls to commit-file-retrieval
+HTTP_STAGE_READ_TIMEOUTS = {
+    "pull_access": _env_float("HTTP_TIMEOUT_PULL_ACCESS", 60.0),
+    "infer_file": _env_float("HTTP_TIMEOUT_INFER_FILE", 1200.0),
+    "retrieve_file_contents": _env_float("HTTP_TIMEOUT_RETRIEVE_FILE_CONTENTS", 300.0),
+    "file_edit": _env_float("HTTP_TIMEOUT_FILE_EDIT", 600.0),
+    "new_files": _env_float("HTTP_TIMEOUT_NEW_FILES", 600.0),
+}
+
+# Pull-access decision cache; denials expire quickly so newly granted access shows up fast
+PULL_ACCESS_CACHE_SIZE = _env_int("PULL_ACCESS_CACHE_SIZE", 1024)
+PULL_ACCESS_CACHE_TTL = _env_float("PULL_ACCESS_CACHE_TTL", 300.0)
+PULL_ACCESS_CACHE_NEGATIVE_TTL = _env_float("PULL_ACCESS_CACHE_NEGATIVE_TTL", 5.0)
+
+# Start infer-file alongside the pull-access check instead of after it
+SPECULATIVE_PULL_ACCESS = _env_bool("SPECULATIVE_PULL_ACCESS", False)
+
+# Token counting: "exact" uses tiktoken for known OpenAI models and only
+# estimates other models with the local tokenizer; "estimate" uses the cheap
+# chars/4 estimate for all. Estimated models keep TOKEN_ESTIMATE_MARGIN of
+# their window free when packing. Texts longer than TOKENIZE_OFFLOAD_CHARS
+# are tokenized on the blocking pool instead of the event loop.
+TOKENIZER_MODE = os.environ.get("TOKENIZER_MODE", "exact").lower()
+TOKENIZER_LOCAL_PATH = os.environ.get("TOKENIZER_LOCAL_PATH", "/data/all-MiniLM-L6-v2")
+TOKEN_INDEX_SIZE = _env_int("TOKEN_INDEX_SIZE", 50000)
+TOKEN_ESTIMATE_MARGIN = _env_float("TOKEN_ESTIMATE_MARGIN", 0.15)
+TOKENIZE_OFFLOAD_CHARS = _env_int("TOKENIZE_OFFLOAD_CHARS", 64 * 1024)
+
+# Context packing: file context is packed into the model's context window
+# minus the reserved output allowance. MODEL_CONTEXT_TOKENS overrides the
+# per-model window when set. PACKING_MAX_CONTEXT_TOKENS caps the packed
+# prompt whatever the window (0 disables the cap), so large-window models
+# do not multiply the cost of a prompt.
+MODEL_CONTEXT_TOKENS = _env_int("MODEL_CONTEXT_TOKENS", 0)
+DEFAULT_CONTEXT_TOKENS = _env_int("DEFAULT_CONTEXT_TOKENS", 128000)
+RESERVED_OUTPUT_TOKENS = _env_int("RESERVED_OUTPUT_TOKENS", 8192)
+PACKING_MAX_CONTEXT_TOKENS = _env_int("PACKING_MAX_CONTEXT_TOKENS", 128000)
+# Share of the ranking given to infer-file's "file" paths next to commit and
+# localization paths; 0 leaves them out.
+PACKING_FILE_PATH_WEIGHT = _env_float("PACKING_FILE_PATH_WEIGHT", 0.0)
+PACKING_MAX_CANDIDATES = {
+    "high": _env_int("PACKING_MAX_CANDIDATES_HIGH", 6),
+    "mid": _env_int("PACKING_MAX_CANDIDATES_MID", 10),
+    "low": _env_int("PACKING_MAX_CANDIDATES_LOW", 20),
+}
+
+# Shared scheduler for LLM-backed work (the main stream up to its first token,
+# the file-edit fan-out and filename generation).
+# Rate limits of 0 disable that bucket. LLM_PROVIDER_RATE_LIMITS overrides them
+# per provider host, e.g. {"openrouter.ai": {"rps": 5, "tpm": 400000}}.
+LLM_MAX_CONCURRENCY = _env_int("LLM_MAX_CONCURRENCY", 16)
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 3)
+LLM_BACKOFF_BASE = _env_float("LLM_BACKOFF_BASE", 1.0)
+LLM_BACKOFF_MAX = _env_float("LLM_BACKOFF_MAX", 30.0)
+LLM_RATE_LIMIT_RPS = _env_float("LLM_RATE_LIMIT_RPS", 0.0)
+LLM_RATE_LIMIT_TPM = _env_float("LLM_RATE_LIMIT_TPM", 0.0)
+LLM_PROVIDER_RATE_LIMITS = json.loads(os.environ.get("LLM_PROVIDER_RATE_LIMITS", "{}"))
+
+# Upper bounds for client-negotiated token frame coalescing
+STREAM_COALESCE_MAX_MS = _env_int("STREAM_COALESCE_MAX_MS", 250)
+STREAM_COALESCE_MAX_BYTES = _env_int("STREAM_COALESCE_MAX_BYTES", 65536)
+
+# Warm LLM clients reused across requests
+LLM_CLIENT_CACHE_SIZE = _env_int("LLM_CLIENT_CACHE_SIZE", 32)
+LLM_CLIENT_IDLE_TTL = _env_float("LLM_CLIENT_IDLE_TTL", 600.0)
+
+# Hedged LLM requests: when a request asks for hedging and has an "other"
+# LLM base url, the alternate provider is started if the primary has not
+# produced a first token within the delay.
+LLM_HEDGING_ENABLED = _env_bool("LLM_HEDGING_ENABLED", True)
+LLM_HEDGE_DELAY_MS = _env_int("LLM_HEDGE_DELAY_MS", 2000)
+
+# Opt-in full-response cache for repeated prompts at the same head commit.
+# RESPONSE_CACHE_ENABLED sets the default for requests that do not send
+# use_cache. RESPONSE_CACHE_DIR adds an on-disk tier when set.
+RESPONSE_CACHE_ENABLED = _env_bool("RESPONSE_CACHE_ENABLED", False)
+# Memory tier budget: entries hold whole responses, edited files included
+RESPONSE_CACHE_MAX_BYTES = _env_int("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR", "")
+RESPONSE_CACHE_TTL = _env_float("RESPONSE_CACHE_TTL", 86400.0)
+
+# Gateway-side cache of file bodies keyed by (project, head commit, path).
+# Bounded by total bytes; the default keeps it well inside the container's
+# 2g mem_limit alongside in-flight prompts. The head is the one the client
+# sends, while commit-file-retrieval serves its current checkout, so
+# entries also expire after FILE_CONTENT_CACHE_TTL seconds.
+FILE_CONTENT_CACHE_MAX_BYTES = _env_int("FILE_CONTENT_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+FILE_CONTENT_CACHE_TTL = _env_float("FILE_CONTENT_CACHE_TTL", 300.0)
+
+# Memoized infer-file results per (project, head commit, mode, match strength).
+# Exact repeats of a normalized prompt are always served from the cache; a
+# similarity threshold above 0 (0-1, word-level) also serves near-duplicates.
+INFER_FILE_CACHE_SIZE = _env_int("INFER_FILE_CACHE_SIZE", 256)
+INFER_FILE_CACHE_TTL = _env_float("INFER_FILE_CACHE_TTL", 3600.0)
+INFER_FILE_CACHE_PER_SCOPE = _env_int("INFER_FILE_CACHE_PER_SCOPE", 8)
+INFER_FILE_SIMILARITY_THRESHOLD = _env_float("INFER_FILE_SIMILARITY_THRESHOLD", 0.0)
+
+# /generate-response/batch: prompts per request, prompts answered at once,
+# and events buffered ahead of a slow reader
+BATCH_MAX_PROMPTS = _env_int("BATCH_MAX_PROMPTS", 100)
+BATCH_MAX_PARALLEL = _env_int("BATCH_MAX_PARALLEL", 4)
+BATCH_QUEUE_SIZE = _env_int("BATCH_QUEUE_SIZE", 1024)
+
+# Asynchronous jobs (/jobs/generate-response): a sqlite3 store under the
+# mounted data directory, a worker pool, and how long results are kept after a
+# job finishes.
+# Events are written to the store in batches of JOB_FLUSH_EVENTS.
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "/data/jobs.sqlite3")
+JOB_WORKERS = _env_int("JOB_WORKERS", 4)
+JOB_QUEUE_SIZE = _env_int("JOB_QUEUE_SIZE", 256)
+JOB_RESULT_TTL = _env_float("JOB_RESULT_TTL", 86400.0)
+JOB_FLUSH_EVENTS = _env_int("JOB_FLUSH_EVENTS", 64)
+
+# Resumable streams ("resumable": true): per-stream and total buffer caps in
+# bytes, and how long a detached stream keeps running before it is cancelled
+RESUME_BUFFER_STREAM_BYTES = _env_int("RESUME_BUFFER_STREAM_BYTES", 4 * 1024 * 1024)
+RESUME_BUFFER_MAX_BYTES = _env_int("RESUME_BUFFER_MAX_BYTES", 64 * 1024 * 1024)
+RESUME_GRACE_SECONDS = _env_float("RESUME_GRACE_SECONDS", 60.0)
+
+# Trace spans (stages, upstream calls, whole requests) as JSON lines in a
+# rotating file; summarize them with scripts/trace_summary.py
+TRACING_ENABLED = _env_bool("TRACING_ENABLED", False)
+TRACE_FILE = os.environ.get("TRACE_FILE", "/data/traces/gateway.jsonl")
+TRACE_FILE_MAX_BYTES = _env_int("TRACE_FILE_MAX_BYTES", 10 * 1024 * 1024)
+TRACE_FILE_BACKUPS = _env_int("TRACE_FILE_BACKUPS", 5)
+
+# Longest text a log line prints for one payload (prompt, frame, file) before cutting it
+LOG_PAYLOAD_MAX_CHARS = _env_int("LOG_PAYLOAD_MAX_CHARS", 200)
+
+# On-demand profiling of single requests, asked for with a header or a body flag
+PROFILING_ENABLED = _env_bool("PROFILING_ENABLED", False)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/data/profiles")
+PROFILE_TOP_FUNCTIONS = _env_int("PROFILE_TOP_FUNCTIONS", 15)
+
+# Blocking work (git, disk, large JSON bodies) runs on a bounded thread pool;
+# bodies over JSON_OFFLOAD_BYTES are parsed there instead of on the event loop
+BLOCKING_POOL_SIZE = _env_int("BLOCKING_POOL_SIZE", 8)
+JSON_OFFLOAD_BYTES = _env_int("JSON_OFFLOAD_BYTES", 1024 * 1024)
+
+# Event-loop lag sampling; debug mode also logs the task and stack of a stall
+LOOP_MONITOR_INTERVAL = _env_float("LOOP_MONITOR_INTERVAL", 0.5)
+LOOP_STALL_THRESHOLD_MS = _env_float("LOOP_STALL_THRESHOLD_MS", 100.0)
+LOOP_MONITOR_DEBUG = _env_bool("LOOP_MONITOR_DEBUG", False)
+LOOP_STALL_STACK_DEPTH = _env_int("LOOP_STALL_STACK_DEPTH", 20)
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.metrics import Counter
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "machtiani_single_flight_calls_total",
+    "Upstream calls through the single-flight layer, by call and whether they joined one in flight.",
+    ("call", "result"),
+)
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it
+    runs await the same task and get the same result or exception. A
+    waiter that is cancelled only stops waiting: the shared task keeps
+    running for the others, and is cancelled only once nobody waits for it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # key -> [task, waiters]
+        self._calls: Dict[Hashable, list] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            SINGLE_FLIGHT_CALLS.inc(call=self.name, result="leader")
+            task = asyncio.ensure_future(fn())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+        else:
+            SINGLE_FLIGHT_CALLS.inc(call=self.name, result="shared")
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not task.done():
+                # Every waiter is gone; later callers start afresh
+                self._forget(key, call)
+                task.cancel()
+
+    def _forget(self, key: Hashable, call: list) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Optional, Union
+
+from app import settings
+from app.utils import cancel_tasks
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson ships with langsmith, but stay optional
+    orjson = None
+
+
+class EncodedEvent(str):
+    """A stream event that is already JSON encoded and is forwarded as is."""
+
+    __slots__ = ()
+
+
+def dumps(event: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(event)
+    return json.dumps(event).encode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+async def loads_offloaded(data: Union[str, bytes]) -> Any:
+    """``loads``, on the blocking pool when ``data`` is too large to parse on the event loop."""
+    if len(data) > settings.JSON_OFFLOAD_BYTES:
+        return await asyncio.to_thread(loads, data)
+    return loads(data)
+
+
+def prefix_fields(fields: str, line: str) -> str:
+    """
+    Splice encoded ``fields`` (such as ``"event_id":3``) into the front of
+    the JSON object ``line`` without decoding it; ``{}`` is handled too.
+    """
+    rest = line[1:]
+    if rest.lstrip().startswith("}"):
+        return "{" + fields + rest
+    return "{" + fields + "," + rest
+
+
+def encode_event(event: Any) -> bytes:
+    """One NDJSON line for ``event``, without re-encoding pre-encoded events."""
+    if isinstance(event, EncodedEvent):
+        return event.encode("utf-8") + b"\n"
+    return dumps(event) + b"\n"
+
+
+def stored_event(line: str) -> Any:
+    """
+    Rebuild a stream event from a stored NDJSON line.
+
+    Token lines stay pre-encoded so replays coalesce them like live tokens;
+    gateway events become dicts again so they still flush their frame.
+    """
+    event = loads(line)
+    if isinstance(event, dict) and event.keys() == {"token"}:
+        return EncodedEvent(line)
+    return event
+
+
+def event_line(event: Any) -> str:
+    """The NDJSON line for ``event`` as text, without the trailing newline."""
+    if isinstance(event, EncodedEvent):
+        return str(event)
+    return dumps(event).decode("utf-8")
+
+
+async def ndjson_frames(
+    events: AsyncIterator[Any],
+    coalesce_ms: int = 0,
+    coalesce_bytes: int = 0,
+) -> AsyncIterator[bytes]:
+    """
+    Encode events as NDJSON, optionally coalescing token lines into frames.
+
+    Without coalescing every event is written on its own. With coalescing,
+    pre-encoded token lines are buffered until ``coalesce_bytes`` is reached
+    or ``coalesce_ms`` has passed since the first buffered line, so a
+    response needs far fewer socket writes. Gateway events flush the buffer
+    immediately. Both limits are capped by the server settings.
+
+    One reader task per stream fills the buffer and checks the window on
+    each event; a single timer per frame only matters when the upstream
+    goes quiet with lines still buffered.
+    """
+    if not coalesce_ms and not coalesce_bytes:
+        async for event in events:
+            yield encode_event(event)
+        return
+
+    window = min(coalesce_ms or settings.STREAM_COALESCE_MAX_MS, settings.STREAM_COALESCE_MAX_MS) / 1000.0
+    max_bytes = min(coalesce_bytes or settings.STREAM_COALESCE_MAX_BYTES, settings.STREAM_COALESCE_MAX_BYTES)
+
+    loop = asyncio.get_running_loop()
+    buffer = bytearray()
+    # Set when a frame should be written, and once the reader has finished
+    ready = asyncio.Event()
+    # Set after each write, so a full buffer waits for the writer
+    written = asyncio.Event()
+    deadline: Optional[float] = None
+    timer: Optional[asyncio.TimerHandle] = None
+    finished = False
+    error: Optional[Exception] = None
+
+    async def read() -> None:
+        nonlocal deadline, timer, finished, error
+        try:
+            async for event in events:
+                buffer.extend(encode_event(event))
+                if deadline is None:
+                    deadline = loop.time() + window
+                    timer = loop.call_at(deadline, ready.set)
+                if len(buffer) >= max_bytes or not isinstance(event, EncodedEvent):
+                    written.clear()
+                    ready.set()
+                    await written.wait()
+                elif loop.time() >= deadline:
+                    ready.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            ready.set()
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            # Lines read while this frame is written go into the next one
+            reader_done = finished
+            if timer is not None:
+                timer.cancel()
+            deadline = timer = None
+            if buffer:
+                frame = bytes(buffer)
+                buffer.clear()
+                yield frame
+            written.set()
+            if reader_done:
+                break
+        if error is not None:
+            raise error
+    finally:
+        if timer is not None:
+            timer.cancel()
+        await cancel_tasks(reader)
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
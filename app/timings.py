@@ -0,0 +1,58 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from app.tracing import record_span, wall_time_since
+
+
+class RequestTimings:
+    """
+    Monotonic per-stage timings and counters for one request.
+
+    Stages can be timed with the ``stage`` context manager, or with
+    ``start``/``stop`` around code that yields to the client, where a
+    context manager would be left open across the yield. With a
+    ``trace_id``, every finished stage is also written as a trace span.
+    """
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.started = time.monotonic()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._open: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def start(self, name: str) -> None:
+        self._open[name] = time.monotonic()
+
+    def stop(self, name: str) -> None:
+        started = self._open.pop(name, None)
+        if started is not None:
+            duration = time.monotonic() - started
+            self.stages[name] = self.stages.get(name, 0.0) + duration
+            record_span(self.trace_id, name, "stage", wall_time_since(started), duration)
+
+    def add(self, name: str, amount: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def as_event(self, outcome: Optional[str] = None) -> dict:
+        event = {
+            "event": "timings",
+            "total_ms": round(self.elapsed() * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "counts": dict(self.counts),
+        }
+        if outcome is not None:
+            event["outcome"] = outcome
+        return event
@@ -0,0 +1,228 @@
+import abc
+import asyncio
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+from app import settings
+from app.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# tiktoken encodings for model families whose tokenizer is known.
+# Matched as prefixes after stripping any "provider/" routing prefix.
+KNOWN_MODEL_ENCODINGS = (
+    ("gpt-4o", "o200k_base"),
+    ("gpt-4.1", "o200k_base"),
+    ("gpt-4.5", "o200k_base"),
+    ("o1", "o200k_base"),
+    ("o3", "o200k_base"),
+    ("o4", "o200k_base"),
+    ("gpt-4", "cl100k_base"),
+    ("gpt-3.5", "cl100k_base"),
+)
+
+FALLBACK_ENCODING = "cl100k_base"
+
+# Characters that may follow a model family in a model name, as in
+# "gpt-4o-mini", "claude-3.7-sonnet:thinking" or "gpt-4o@2024-08-06"
+MODEL_NAME_SEPARATORS = "-:@_"
+
+
+class Tokenizer(abc.ABC):
+    """Counts tokens in text. Subclasses wrap a concrete tokenizer."""
+
+    name = "tokenizer"
+
+    @abc.abstractmethod
+    def count(self, text: str) -> int:
+        """Number of tokens in ``text``."""
+
+
+class EstimateTokenizer(Tokenizer):
+    """Cheap character based estimate, about 4 characters per token."""
+
+    name = "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(text) // 4 + 1
+
+
+class TiktokenTokenizer(Tokenizer):
+    def __init__(self, encoding_name: str):
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken:{encoding_name}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        # encode_ordinary treats special token text as plain text and skips the special token check
+        return len(self._encoding.encode_ordinary(text))
+
+
+class HuggingFaceTokenizer(Tokenizer):
+    def __init__(self, path: str):
+        from transformers import AutoTokenizer
+
+        self._tokenizer = AutoTokenizer.from_pretrained(path)
+        self.name = f"hf:{os.path.basename(os.path.normpath(path))}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+
+def match_model_family(model: Optional[str], table: Tuple[Tuple[str, Any], ...]) -> Optional[Any]:
+    """
+    Value of the first ``(family, value)`` entry naming ``model``'s family.
+
+    A "provider/" routing prefix is ignored. The family must be the whole
+    model name or be followed by a separator, so "gpt-4" does not claim
+    "gpt-4.5" and "o1" does not claim "o1x".
+    """
+    if not model:
+        return None
+    name = model.rsplit("/", 1)[-1].lower()
+    for family, value in table:
+        if name == family or (name.startswith(family) and name[len(family)] in MODEL_NAME_SEPARATORS):
+            return value
+    return None
+
+
+def known_model_encoding(model: Optional[str]) -> Optional[str]:
+    return match_model_family(model, KNOWN_MODEL_ENCODINGS)
+
+
+@lru_cache(maxsize=None)
+def _load_tiktoken(encoding_name: str) -> Optional[Tokenizer]:
+    try:
+        return TiktokenTokenizer(encoding_name)
+    except Exception as e:
+        logger.warning("Could not load tiktoken encoding %s: %s", encoding_name, e)
+        return None
+
+
+@lru_cache(maxsize=None)
+def _load_local_tokenizer(path: str) -> Optional[Tokenizer]:
+    if not path or not os.path.isdir(path):
+        return None
+    try:
+        return HuggingFaceTokenizer(path)
+    except Exception as e:
+        logger.warning("Could not load local tokenizer from %s: %s", path, e)
+        return None
+
+
+@lru_cache(maxsize=256)
+def get_tokenizer(model: Optional[str] = None, mode: Optional[str] = None) -> Tokenizer:
+    """
+    Resolve the tokenizer used to count tokens for ``model``.
+
+    In ``estimate`` mode the character estimate is always used. In ``exact``
+    mode known OpenAI model families are counted exactly with their tiktoken
+    encoding. Every other model (Claude, Gemini, open-weight models) is only
+    estimated, with the local tokenizer at ``TOKENIZER_LOCAL_PATH`` (the
+    MiniLM WordPiece vocabulary by default), then ``cl100k_base``; see
+    ``counts_exactly``. The character estimate is the last resort if nothing
+    loads.
+
+    Loading may read from disk or download an encoding, so the gateway
+    calls ``preload_tokenizers`` at startup to do it off the event loop.
+    """
+    mode = mode or settings.TOKENIZER_MODE
+    if mode == "estimate":
+        return EstimateTokenizer()
+
+    encoding = known_model_encoding(model)
+    if encoding:
+        tokenizer = _load_tiktoken(encoding)
+        if tokenizer is not None:
+            return tokenizer
+
+    tokenizer = _load_local_tokenizer(settings.TOKENIZER_LOCAL_PATH)
+    if tokenizer is not None:
+        return tokenizer
+
+    tokenizer = _load_tiktoken(FALLBACK_ENCODING)
+    if tokenizer is not None:
+        return tokenizer
+
+    logger.warning("No tokenizer available for model %s, falling back to estimate", model)
+    return EstimateTokenizer()
+
+
+def counts_exactly(model: Optional[str]) -> bool:
+    """Whether ``model``'s tokens are counted with its own tokenizer rather than estimated."""
+    encoding = known_model_encoding(model)
+    return encoding is not None and get_tokenizer(model).name == f"tiktoken:{encoding}"
+
+
+async def count_offloaded(tokenizer: Tokenizer, text: str) -> int:
+    """``tokenizer.count``, on the blocking pool when ``text`` is too large to tokenize on the event loop."""
+    if len(text) > settings.TOKENIZE_OFFLOAD_CHARS:
+        return await asyncio.to_thread(tokenizer.count, text)
+    return tokenizer.count(text)
+
+
+def load_tokenizers() -> None:
+    """Load every tokenizer ``get_tokenizer`` can resolve to, so requests never do."""
+    if settings.TOKENIZER_MODE == "estimate":
+        return
+    for encoding in {encoding for _, encoding in KNOWN_MODEL_ENCODINGS} | {FALLBACK_ENCODING}:
+        _load_tiktoken(encoding)
+    _load_local_tokenizer(settings.TOKENIZER_LOCAL_PATH)
+
+
+async def preload_tokenizers() -> None:
+    """
+    Run ``load_tokenizers`` on the blocking pool.
+
+    tiktoken downloads an encoding the first time it is used unless it is
+    already in ``TIKTOKEN_CACHE_DIR``; a failed load is logged here, at
+    startup, and that encoding is then skipped for the life of the process.
+    """
+    await asyncio.to_thread(load_tokenizers)
+
+
+def blob_oid(content: str) -> str:
+    """Git blob object id of ``content``, identical to ``git hash-object``."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class TokenIndex:
+    """
+    Memoized token counts of file contents.
+
+    Entries are keyed by (tokenizer, project, path, blob oid), so an unchanged
+    file is tokenized once no matter how many prompts include it.
+    """
+
+    def __init__(self, maxsize: int):
+        self._counts = LRUCache(maxsize)
+
+    async def count(self, tokenizer: Tokenizer, project: str, path: str, content: str) -> int:
+        key = (tokenizer.name, project, path, blob_oid(content))
+        token_count = self._counts.get(key)
+        if token_count is None:
+            token_count = await count_offloaded(tokenizer, content)
+            self._counts.set(key, token_count)
+        return token_count
+
+    @property
+    def hits(self) -> int:
+        return self._counts.hits
+
+    @property
+    def misses(self) -> int:
+        return self._counts.misses
+
+
+token_index = TokenIndex(settings.TOKEN_INDEX_SIZE)
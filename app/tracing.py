@@ -0,0 +1,93 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from app import settings
+
+logger = logging.getLogger(__name__)
+
+# Sent on every outbound call so the retrieval service can log the same id
+TRACE_HEADER = "X-Machtiani-Trace-Id"
+
+# Trace of the request whose code is running. Set again each time a request's
+# stream resumes, since its steps may run in different tasks.
+current_trace_id: ContextVar[Optional[str]] = ContextVar("current_trace_id", default=None)
+
+_span_logger: Optional[logging.Logger] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_tracing() -> None:
+    """Start the span writer if tracing is enabled; spans are written off the event loop."""
+    global _span_logger, _listener
+    if not settings.TRACING_ENABLED or _listener is not None:
+        return
+    if os.path.dirname(settings.TRACE_FILE):
+        os.makedirs(os.path.dirname(settings.TRACE_FILE), exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        settings.TRACE_FILE,
+        maxBytes=settings.TRACE_FILE_MAX_BYTES,
+        backupCount=settings.TRACE_FILE_BACKUPS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, file_handler)
+    _listener.start()
+
+    span_logger = logging.getLogger("machtiani.trace")
+    span_logger.setLevel(logging.INFO)
+    span_logger.propagate = False
+    span_logger.addHandler(logging.handlers.QueueHandler(records))
+    _span_logger = span_logger
+    logger.info("Writing trace spans to %s", settings.TRACE_FILE)
+
+
+def stop_tracing() -> None:
+    global _span_logger, _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    if _span_logger is not None:
+        _span_logger.handlers.clear()
+    _span_logger = None
+    _listener = None
+
+
+def record_span(
+    trace_id: Optional[str],
+    name: str,
+    kind: str,
+    start: float,
+    duration: float,
+    **attributes,
+) -> None:
+    """
+    Write one finished span as a JSON line.
+
+    ``start`` is wall-clock epoch seconds and ``duration`` is measured with
+    the monotonic clock. Does nothing when tracing is off or there is no trace.
+    """
+    if _span_logger is None or trace_id is None:
+        return
+    span = {
+        "trace_id": trace_id,
+        "name": name,
+        "kind": kind,
+        "start": round(start, 6),
+        "duration_ms": round(duration * 1000, 3),
+    }
+    if attributes:
+        span["attributes"] = attributes
+    _span_logger.info(json.dumps(span))
+
+
+def wall_time_since(monotonic_start: float) -> float:
+    """Epoch time of an earlier ``time.monotonic()`` reading."""
+    return time.time() - (time.monotonic() - monotonic_start)
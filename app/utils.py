@@ -1,11 +1,11 @@
 import sys
 import os
 import asyncio
-import json
 import heapq
 import logging
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 from collections import defaultdict
+from app.tokenizer import count_offloaded, get_tokenizer
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +41,7 @@ try:
         )
     logger.info("Imports successful.")
 except ModuleNotFoundError as e:
-    logger.error(f"ModuleNotFoundError: {e}")
+    logger.error("ModuleNotFoundError: %s", e)
     logger.error("Failed to import the module. Please check the paths and directory structure.")
 
 async def aggregate_file_paths(responses: List[FileSearchResponse]) -> List[FilePathEntry]:
@@ -110,23 +110,18 @@ def top_n_files(scores: Dict[str, float], n: int) -> List[Tuple[str, float]]:
     # heapq.nlargest is O(k log n) and avoids sorting the entire dict
     return heapq.nlargest(n, scores.items(), key=lambda t: t[1])
 
-async def count_tokens(text: str) -> int:
-    """Estimate the number of tokens in a text string."""
+async def cancel_tasks(*tasks: Optional[asyncio.Task]) -> None:
+    """Cancel the given tasks and wait for them to finish, ignoring ``None``."""
+    pending = [task for task in tasks if task is not None and not task.done()]
+    for task in pending:
+        task.cancel()
+    # Gather with return_exceptions so cancelled or failed tasks are retrieved
+    await asyncio.gather(*(task for task in tasks if task is not None), return_exceptions=True)
+
+async def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count the tokens in a text string with the tokenizer resolved for ``model``."""
     if not text:
         return 0
 
-    # Simplified method: count characters and divide by average token size
-    # This is a very rough approximation and will not be as accurate as a proper tokenizer
-    # Average English token is about 4-5 characters
-    return len(text) // 4 + 1
-
-
-async def check_token_limit(prompt: str, model: str, max_tokens: int) -> bool:
-    token_count = await count_tokens(prompt)
-
-    logger.info(f"model: {model}, token count: {token_count}, max limit: {max_tokens}")
-
-    if token_count > max_tokens:
-        return False  # Return False if the token count exceeds the limit
+    return await count_offloaded(get_tokenizer(model), text)
 
-    return True  # Return True if within limit
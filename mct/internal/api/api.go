@@ -361,6 +361,7 @@ type GenerateResponseResult struct {
 	HeadCommitHash        string                       `json:"head_commit_hash"`
 	spinner               *SpinnerController
 	NewFiles              *NewFilesData `json:"new_files,omitempty"`
+	Timings               map[string]interface{} `json:"timings,omitempty"`
 }
 
 func init() {
@@ -401,6 +402,9 @@ func GenerateResponse(prompt, project, mode, model, matchStrength string, force
 		"ignore_files":             ignoreFiles,
 		"head_commit_hash":         headCommitHash,
 		"llm_model_base_url_other": config.Environment.ModelBaseURLOther,
+		// let the gateway batch tokens into fewer writes; the decoder reads
+		// several JSON objects per chunk just fine
+		"stream_coalesce_ms": 20,
 	}
 
 	// Log the payload being sent
@@ -493,6 +497,7 @@ func GenerateResponse(prompt, project, mode, model, matchStrength string, force
 	}
 
 	var newFilesResult *NewFilesData
+	var timings map[string]interface{}
 
 	// Only create and start spinner if not in answer-only mode
 	if !answerOnlyMode {
@@ -517,6 +522,26 @@ func GenerateResponse(prompt, project, mode, model, matchStrength string, force
 			}
 			continue
 		}
+
+		// file edits stream in one event per file as each finishes,
+		// followed by a summary once all of them are done
+		if ev, ok := chunk["event"].(string); ok && ev == "file_edit_result" {
+			if updated, ok := chunk["updated_file_contents"].(map[string]interface{}); ok && !answerOnlyMode {
+				spinner.Stop()
+				for path := range updated {
+					fmt.Printf("  ✓ %s\n", path)
+				}
+				spinner.Start()
+			}
+		}
+		if ev, ok := chunk["event"].(string); ok && ev == "file_edit_complete" {
+			continue
+		}
+		// per-stage timings arrive last; shown under --verbose
+		if ev, ok := chunk["event"].(string); ok && ev == "timings" {
+			timings = chunk
+			continue
+		}
 		// ────
 
 		// Handle error messages
@@ -731,6 +756,7 @@ func GenerateResponse(prompt, project, mode, model, matchStrength string, force
 		HeadCommitHash:        headCommitHash,
 		spinner:               spinner, // Will be nil for answer-only mode
 		NewFiles:              newFilesResult,
+		Timings:               timings,
 	}
 
 	// Write patch files for updated files - REMOVED TO FIX DUPLICATE PATCH ISSUE
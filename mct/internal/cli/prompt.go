@@ -11,6 +11,7 @@ import (
 	//"os/exec" // No longer needed here for git apply
 	"path"
 	"path/filepath"
+	"sort"
 	"strings"
 	"time" // Added for generateFilename timeout
 	"errors" // Added for generateFilename error handling
@@ -100,6 +101,10 @@ func handlePrompt(args []string, config *utils.Config, remoteURL *string, apiKey
 		log.Fatalf("Error making API call: %v", err)
 	}
 
+	if *verboseFlag && !isAnswerOnlyMode {
+		printTimings(result.Timings)
+	}
+
 
 
 	// Only process patches in default mode
@@ -357,6 +362,28 @@ func readMarkdownFile(path string) string {
 	return string(content)
 }
 
+// printTimings prints the server's per-stage timing breakdown
+func printTimings(timings map[string]interface{}) {
+	if timings == nil {
+		return
+	}
+	fmt.Printf("\nTimings (total %v ms)\n", timings["total_ms"])
+	for _, group := range []string{"stages_ms", "counts"} {
+		values, ok := timings[group].(map[string]interface{})
+		if !ok {
+			continue
+		}
+		names := make([]string, 0, len(values))
+		for name := range values {
+			names = append(names, name)
+		}
+		sort.Strings(names)
+		for _, name := range names {
+			fmt.Printf("  %-24s %v\n", name, values[name])
+		}
+	}
+}
+
 // printVerboseInfo - unchanged
 
 func printVerboseInfo(markdown, model, matchStrength, mode, prompt string) {
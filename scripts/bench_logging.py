@@ -0,0 +1,64 @@
+"""
+Benchmark the per-token logging cost of the /generate-response stream loop.
+
+Compares the old eager f-string debug line with the level-gated, capped one,
+with the logger at CRITICAL and at DEBUG (records go to /dev/null).
+Run from the project root:
+
+    python scripts/bench_logging.py --tokens 200000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.log_format import summarize  # noqa: E402
+
+logger = logging.getLogger("bench_logging")
+
+
+def make_frames(tokens: int) -> list:
+    return [b'{"token": " handler"}\n' for _ in range(tokens)]
+
+
+def eager_loop(frames: list) -> None:
+    for frame in frames:
+        logger.debug(f"Streaming response chunk: {frame}")
+
+
+def gated_loop(frames: list) -> None:
+    log_frames = logger.isEnabledFor(logging.DEBUG)
+    for frame in frames:
+        if log_frames:
+            logger.debug("Streaming response frame: %s", summarize(frame))
+
+
+def measure(name: str, fn, frames: list) -> None:
+    start = time.perf_counter()
+    fn(frames)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>16}: {elapsed * 1e9 / len(frames):9.1f} ns/token, {elapsed * 1000:8.2f} ms total")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=200000)
+    args = parser.parse_args()
+
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    frames = make_frames(args.tokens)
+    for level in ("CRITICAL", "DEBUG"):
+        logger.setLevel(level)
+        measure(f"eager {level}", eager_loop, frames)
+        measure(f"gated {level}", gated_loop, frames)
+
+
+if __name__ == "__main__":
+    main()
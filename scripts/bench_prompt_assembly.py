@@ -0,0 +1,63 @@
+"""
+Benchmark peak memory and time of prompt assembly for large contexts.
+
+Compares the old repeated ``+=`` concatenation with ``PromptBuilder``.
+Run from the project root:
+
+    python scripts/bench_prompt_assembly.py --files 12 --file-kb 400
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.context_packing import PromptBuilder  # noqa: E402
+
+
+def make_contents(files: int, file_kb: int) -> dict:
+    line = "def handler(request):  # some representative source line\n"
+    body = line * (file_kb * 1024 // len(line))
+    return {f"src/module_{i}.py": f"# file {i}\n{body}" for i in range(files)}
+
+
+def concat_prompt(prompt: str, contents: dict) -> str:
+    combined_prompt = f"{prompt}\n\nHere are the relevant files:\n"
+    for path, content in contents.items():
+        combined_prompt += f"\n--- {path} ---\n{content}\n"
+    return combined_prompt
+
+
+def builder_prompt(prompt: str, contents: dict) -> str:
+    builder = PromptBuilder(f"{prompt}\n\nHere are the relevant files:\n", budget=sys.maxsize)
+    for rank, (path, content) in enumerate(contents.items()):
+        builder.try_add(rank, path, content, tokens=0)
+    return builder.build()
+
+
+def measure(name: str, fn, prompt: str, contents: dict) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(prompt, contents)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {len(result) / 2**20:7.1f} MiB prompt, peak {peak / 2**20:7.1f} MiB, {elapsed * 1000:8.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--file-kb", type=int, default=400)
+    args = parser.parse_args()
+
+    prompt = "What does the request handler do?"
+    contents = make_contents(args.files, args.file_kb)
+    measure("concat", concat_prompt, prompt, contents)
+    measure("builder", builder_prompt, prompt, contents)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Summarize gateway trace spans written with TRACING_ENABLED=true.
+
+Shows the critical path of recent traces, or of one trace with --trace:
+its top-level stages in order, with the spans nested inside each. Then
+lists the slowest spans in the time window. Run from the project root:
+
+    python scripts/trace_summary.py data/traces/gateway.jsonl --since 60
+    python scripts/trace_summary.py data/traces/gateway.jsonl --trace <trace id>
+"""
+import argparse
+import glob
+import json
+import time
+from collections import defaultdict
+
+
+def read_spans(path: str, since: float) -> list:
+    """Spans from the trace file and its rotated backups that started after ``since``."""
+    spans = []
+    for file_path in sorted(glob.glob(f"{path}*")):
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                if span.get("start", 0) >= since:
+                    span["end"] = span["start"] + span["duration_ms"] / 1000
+                    spans.append(span)
+    return spans
+
+
+def contains(outer: dict, inner: dict) -> bool:
+    return outer is not inner and outer["start"] <= inner["start"] and inner["end"] <= outer["end"] + 1e-6
+
+
+def print_critical_path(trace_id: str, spans: list) -> None:
+    root = next((span for span in spans if span["kind"] == "request"), None)
+    stages = sorted((span for span in spans if span["kind"] != "request"), key=lambda span: (span["start"], -span["end"]))
+    top_level = [span for span in stages if not any(contains(other, span) for other in stages)]
+
+    total_ms = root["duration_ms"] if root else sum(span["duration_ms"] for span in top_level)
+    attributes = root.get("attributes", {}) if root else {}
+    print(f"\ntrace {trace_id}  total {total_ms:.1f} ms  {attributes.get('mode', '')} {attributes.get('outcome', '')}")
+    for span in top_level:
+        share = 100 * span["duration_ms"] / total_ms if total_ms else 0
+        print(f"  {span['name']:<28} {span['duration_ms']:>10.1f} ms  {share:5.1f}%")
+        children = sorted((child for child in stages if contains(span, child)), key=lambda child: child["start"])
+        for child in children:
+            status = child.get("attributes", {}).get("status", "")
+            print(f"    {child['name']:<26} {child['duration_ms']:>10.1f} ms  {status}")
+    accounted = sum(span["duration_ms"] for span in top_level)
+    if root and total_ms > accounted:
+        print(f"  {'(between stages)':<28} {total_ms - accounted:>10.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_file", help="Trace JSONL file; rotated backups next to it are read too")
+    parser.add_argument("--since", type=float, default=60, help="Window in minutes (default: 60)")
+    parser.add_argument("--trace", help="Only show this trace id")
+    parser.add_argument("--traces", type=int, default=5, help="Most recent traces to show (default: 5)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest spans to list (default: 10)")
+    args = parser.parse_args()
+
+    spans = read_spans(args.trace_file, time.time() - args.since * 60)
+    by_trace = defaultdict(list)
+    for span in spans:
+        by_trace[span["trace_id"]].append(span)
+
+    if args.trace:
+        trace_ids = [args.trace] if args.trace in by_trace else []
+    else:
+        trace_ids = sorted(by_trace, key=lambda trace_id: max(span["end"] for span in by_trace[trace_id]))[-args.traces:]
+    if not trace_ids:
+        print("No matching traces in the window.")
+        return
+    for trace_id in trace_ids:
+        print_critical_path(trace_id, by_trace[trace_id])
+
+    window = [span for span in spans if span["kind"] != "request" and (not args.trace or span["trace_id"] == args.trace)]
+    print(f"\nslowest spans in the last {args.since:g} minutes")
+    for span in sorted(window, key=lambda span: span["duration_ms"], reverse=True)[:args.top]:
+        print(f"  {span['duration_ms']:>10.1f} ms  {span['kind']:<8} {span['name']:<28} {span['trace_id']}")
+
+
+if __name__ == "__main__":
+    main()
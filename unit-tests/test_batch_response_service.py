@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services import batch_response_service
+from app.services.batch_response_service import generate_response_batch, tag_event
+from app.streaming import EncodedEvent
+
+PROMPTS = [("p1", "first prompt"), ("p2", "second prompt")]
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake pull access, prefetch and generation; records what the batch asked for."""
+    calls = {"pull_access": True, "prefetched": [], "generated": []}
+
+    async def check_pull_access(client, project, codehost_url, codehost_api_key):
+        if isinstance(calls["pull_access"], Exception):
+            raise calls["pull_access"]
+        return calls["pull_access"]
+
+    async def prefetch_batch_context(prompts, *args):
+        calls["prefetched"].append([prompt_id for prompt_id, _ in prompts])
+
+    async def generate_response(prompt, *args):
+        calls["generated"].append(prompt)
+        await asyncio.sleep(0)
+        if prompt == "failing prompt":
+            raise RuntimeError("generation failed")
+        yield EncodedEvent(json.dumps({"token": prompt}))
+        yield {"machtiani": "done"}
+
+    monkeypatch.setattr(batch_response_service, "get_http_client", lambda: None)
+    monkeypatch.setattr(batch_response_service, "check_pull_access", check_pull_access)
+    monkeypatch.setattr(batch_response_service, "prefetch_batch_context", prefetch_batch_context)
+    monkeypatch.setattr(batch_response_service, "generate_response", generate_response)
+    return calls
+
+
+def run_batch(prompts, mode="commit"):
+    async def main():
+        events = generate_response_batch(
+            prompts, "project", mode, "gpt-4o", "mid", "llm-key", "https://api.example.com",
+            None, "https://github.com/example/project", [], "head",
+        )
+        return [json.loads(event) if isinstance(event, EncodedEvent) else event async for event in events]
+
+    return asyncio.run(main())
+
+
+def test_tag_event_adds_the_prompt_id():
+    assert tag_event({"token": "a"}, "p1") == {"prompt_id": "p1", "token": "a"}
+    tagged = tag_event(EncodedEvent('{"token":"a"}'), 'id "quoted"')
+    assert isinstance(tagged, EncodedEvent)
+    assert json.loads(tagged) == {"prompt_id": 'id "quoted"', "token": "a"}
+    assert json.loads(tag_event(EncodedEvent("{}"), "p1")) == {"prompt_id": "p1"}
+
+
+def test_batch_streams_every_prompt_tagged_and_completed(upstream):
+    events = run_batch(PROMPTS)
+
+    assert upstream["prefetched"] == [["p1", "p2"]]
+    assert sorted(upstream["generated"]) == ["first prompt", "second prompt"]
+    for prompt_id, prompt in PROMPTS:
+        own = [event for event in events if event.get("prompt_id") == prompt_id]
+        assert own == [
+            {"prompt_id": prompt_id, "token": prompt},
+            {"prompt_id": prompt_id, "machtiani": "done"},
+            {"event": "prompt_complete", "prompt_id": prompt_id, "failed": False},
+        ]
+    assert events[-1] == {"event": "batch_complete", "prompt_count": 2, "failed": 0}
+
+
+def test_failing_prompt_does_not_stop_the_batch(upstream):
+    events = run_batch([("p1", "first prompt"), ("p2", "failing prompt")])
+
+    errors = [event for event in events if "error" in event]
+    assert [event["prompt_id"] for event in errors] == ["p2"]
+    assert "generation failed" in errors[0]["error"]
+    assert {"event": "prompt_complete", "prompt_id": "p1", "failed": False} in events
+    assert {"event": "prompt_complete", "prompt_id": "p2", "failed": True} in events
+    assert events[-1] == {"event": "batch_complete", "prompt_count": 2, "failed": 1}
+
+
+def test_denied_pull_access_fails_every_prompt(upstream):
+    upstream["pull_access"] = False
+    events = run_batch(PROMPTS)
+
+    assert upstream["generated"] == []
+    assert events == [
+        {"prompt_id": "p1", "error": "Pull access denied."},
+        {"event": "prompt_complete", "prompt_id": "p1", "failed": True},
+        {"prompt_id": "p2", "error": "Pull access denied."},
+        {"event": "prompt_complete", "prompt_id": "p2", "failed": True},
+        {"event": "batch_complete", "prompt_count": 2, "failed": 2},
+    ]
+
+
+def test_failed_pull_access_check_leaves_it_to_each_prompt(upstream):
+    upstream["pull_access"] = httpx.ConnectError("code host unreachable")
+    events = run_batch(PROMPTS)
+
+    assert upstream["prefetched"] == []
+    assert sorted(upstream["generated"]) == ["first prompt", "second prompt"]
+    assert events[-1] == {"event": "batch_complete", "prompt_count": 2, "failed": 0}
+
+
+def test_pure_chat_skips_the_prefetch(upstream):
+    events = run_batch(PROMPTS, mode="pure-chat")
+
+    assert upstream["prefetched"] == []
+    assert events[-1]["event"] == "batch_complete"
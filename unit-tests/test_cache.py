@@ -0,0 +1,75 @@
+import time
+
+from app.cache import ByteLRUCache
+
+
+def test_byte_lru_cache_evicts_least_recently_used_by_size():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.set("c", "cccc")
+
+    assert "b" not in cache
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    assert cache.bytes == 8
+
+
+def test_byte_lru_cache_evicts_as_many_entries_as_needed():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    for key in "abcde":
+        cache.set(key, "xx")
+    cache.set("big", "y" * 9)
+    assert list(cache._data) == ["big"]
+    assert cache.bytes == 9
+
+
+def test_byte_lru_cache_skips_values_larger_than_the_budget():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "aaaa")
+    cache.set("huge", "h" * 11)
+    assert "huge" not in cache
+    assert cache.get("a") == "aaaa"
+    assert cache.bytes == 4
+
+
+def test_byte_lru_cache_replacing_a_key_updates_its_size():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "aaaa")
+    cache.set("a", "aa")
+    assert cache.bytes == 2
+    # An oversized replacement drops the old value rather than keeping it stale
+    cache.set("a", "a" * 11)
+    assert "a" not in cache
+    assert cache.bytes == 0
+
+
+def test_byte_lru_cache_pop_and_clear_release_bytes():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbb")
+    assert cache.pop("a") == "aaaa"
+    assert cache.pop("a", "gone") == "gone"
+    assert cache.bytes == 3
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_byte_lru_cache_counts_hits_and_misses():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "a")
+    cache.get("a")
+    cache.get("b")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_byte_lru_cache_expires_entries_after_the_ttl():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len, ttl=0.01)
+    cache.set("a", "aaaa")
+    assert cache.get("a") == "aaaa"
+    time.sleep(0.02)
+    assert "a" not in cache
+    assert cache.get("a") is None
+    assert cache.bytes == 0
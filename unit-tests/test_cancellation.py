@@ -0,0 +1,84 @@
+import asyncio
+
+from pydantic import SecretStr
+
+from app import settings
+from app.metrics import CANCELLED_WORK
+from app.services import generate_response_service
+from app.utils import cancel_tasks
+
+
+def test_cancel_tasks_cancels_pending_tasks_and_ignores_none():
+    async def main():
+        pending = asyncio.create_task(asyncio.sleep(10))
+        done = asyncio.create_task(asyncio.sleep(0, result="done"))
+        await asyncio.sleep(0.01)
+        await cancel_tasks(pending, None, done)
+        return pending.cancelled(), done.result()
+
+    assert asyncio.run(main()) == (True, "done")
+
+
+def test_cancel_tasks_retrieves_a_failed_task_without_raising():
+    async def fail():
+        raise RuntimeError("upstream failed")
+
+    async def main():
+        failed = asyncio.create_task(fail())
+        await asyncio.sleep(0)
+        await cancel_tasks(failed)
+        return failed.done()
+
+    assert asyncio.run(main())
+
+
+def test_disconnect_during_pull_access_cancels_the_speculative_infer(monkeypatch):
+    calls = {"infer_cancelled": False}
+
+    async def infer_files(client, params):
+        calls["infer_started"].set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            calls["infer_cancelled"] = True
+            raise
+
+    async def check_pull_access(client, project, codehost_url, codehost_api_key):
+        calls["pull_access_started"].set()
+        await asyncio.sleep(10)
+
+    async def count_tokens(text, model):
+        return 10
+
+    monkeypatch.setattr(settings, "SPECULATIVE_PULL_ACCESS", True)
+    monkeypatch.setattr(generate_response_service, "get_http_client", lambda: None)
+    monkeypatch.setattr(generate_response_service, "infer_files", infer_files)
+    monkeypatch.setattr(generate_response_service, "check_pull_access", check_pull_access)
+    monkeypatch.setattr(generate_response_service, "count_tokens", count_tokens)
+    before = {stage: CANCELLED_WORK.value(stage=stage) for stage in ("pull_access", "infer_file")}
+
+    async def consume():
+        events = generate_response_service.generate_response(
+            "prompt", "project", "commit", "gpt-4o", "mid", "llm-key", "https://api.example.com",
+            SecretStr("token"), "https://github.com/example/project", [], "head",
+        )
+        try:
+            async for _ in events:
+                pass
+        finally:
+            await events.aclose()
+
+    async def main():
+        calls["infer_started"] = asyncio.Event()
+        calls["pull_access_started"] = asyncio.Event()
+        consumer = asyncio.create_task(consume())
+        await calls["infer_started"].wait()
+        await calls["pull_access_started"].wait()
+        # The client goes away while both calls are in flight
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+
+    asyncio.run(main())
+    assert calls["infer_cancelled"]
+    assert CANCELLED_WORK.value(stage="pull_access") == before["pull_access"] + 1
+    assert CANCELLED_WORK.value(stage="infer_file") == before["infer_file"] + 1
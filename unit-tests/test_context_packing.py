@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import context_packing, settings
+from app.context_packing import (
+    FileCandidate,
+    PromptBuilder,
+    context_budget,
+    context_window,
+    file_header,
+    pack_context,
+    rank_file_candidates,
+)
+from app.tokenizer import TokenIndex, Tokenizer
+
+
+class WordTokenizer(Tokenizer):
+    """One token per whitespace separated word, so budgets are easy to reason about."""
+
+    name = "words"
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(context_packing, "get_tokenizer", lambda model: WordTokenizer())
+    monkeypatch.setattr(context_packing, "token_index", TokenIndex(100))
+    monkeypatch.setattr(settings, "TOKEN_ESTIMATE_MARGIN", 0.0)
+
+
+def response(path_type, paths, similarity=0.0):
+    return SimpleNamespace(
+        path_type=path_type,
+        similarity=similarity,
+        file_paths=[SimpleNamespace(path=path) for path in paths],
+    )
+
+
+def words(count: int) -> str:
+    return " ".join(["word"] * count)
+
+
+def header_tokens(path: str) -> int:
+    return WordTokenizer().count(file_header(path))
+
+
+def test_context_window_matches_model_families(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CONTEXT_TOKENS", 0)
+    assert context_window("gpt-4o-mini") == 128000
+    assert context_window("openrouter/openai/gpt-4") == 8192
+    assert context_window("gpt-4-0613") == 8192
+    assert context_window("gpt-4.1") == 1047576
+    assert context_window("gpt-4.5-preview") == 128000
+    assert context_window("o1-mini") == 128000
+    assert context_window("o1-preview-2024-09-12") == 128000
+    assert context_window("o1") == 200000
+    assert context_window("anthropic/claude-3.7-sonnet:thinking") == 200000
+    assert context_window("some-local-model") == settings.DEFAULT_CONTEXT_TOKENS
+    assert context_window(None) == settings.DEFAULT_CONTEXT_TOKENS
+
+    monkeypatch.setattr(settings, "MODEL_CONTEXT_TOKENS", 4000)
+    assert context_window("gpt-4o") == 4000
+
+
+def test_context_window_needs_a_separator_after_the_family(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CONTEXT_TOKENS", 0)
+    # Unknown models sharing a family's leading characters are not claimed by it
+    assert context_window("gpt-4x") == settings.DEFAULT_CONTEXT_TOKENS
+    assert context_window("o10") == settings.DEFAULT_CONTEXT_TOKENS
+    assert context_window("claudette") == settings.DEFAULT_CONTEXT_TOKENS
+
+
+def test_context_budget_reserves_output_and_never_goes_negative(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CONTEXT_TOKENS", 0)
+    monkeypatch.setattr(settings, "RESERVED_OUTPUT_TOKENS", 8192)
+    monkeypatch.setattr(settings, "PACKING_MAX_CONTEXT_TOKENS", 0)
+    # gpt-4 has 8192 tokens, so only a quarter of them is reserved
+    assert context_budget("gpt-4", 1000) == 8192 - 2048 - 1000
+    assert context_budget("gpt-4o", 1000) == 128000 - 8192 - 1000
+    assert context_budget("gpt-4", 100000) == 0
+    assert context_budget("gpt-4.1", 1000) == 1047576 - 8192 - 1000
+
+
+def test_context_budget_is_capped_for_large_windows(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CONTEXT_TOKENS", 0)
+    monkeypatch.setattr(settings, "RESERVED_OUTPUT_TOKENS", 8192)
+    monkeypatch.setattr(settings, "PACKING_MAX_CONTEXT_TOKENS", 128000)
+    assert context_budget("gpt-4.1", 1000) == 128000 - 8192 - 1000
+    assert context_budget("gemini-2.0-flash-001", 1000) == 128000 - 8192 - 1000
+    assert context_budget("gpt-4", 1000) == 8192 - 2048 - 1000
+
+
+def test_context_budget_keeps_a_margin_for_estimated_models(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CONTEXT_TOKENS", 0)
+    monkeypatch.setattr(settings, "RESERVED_OUTPUT_TOKENS", 8192)
+    monkeypatch.setattr(settings, "PACKING_MAX_CONTEXT_TOKENS", 0)
+    monkeypatch.setattr(settings, "TOKEN_ESTIMATE_MARGIN", 0.1)
+    monkeypatch.setattr(context_packing, "counts_exactly", lambda model: model.startswith("gpt"))
+    assert context_budget("gpt-4o", 1000) == 128000 - 8192 - 1000
+    assert context_budget("claude-3.7-sonnet", 1000) == 200000 - 20000 - 8192 - 1000
+
+
+def test_rank_file_candidates_normalizes_and_merges_path_types():
+    responses = [
+        response("commit", ["a.py", "b.py"], similarity=0.9),
+        response("commit", ["b.py"], similarity=0.3),
+        response("localization", ["b.py", "c.py"]),
+        response("localization", ["ignored.py"]),
+    ]
+    ranked = rank_file_candidates(responses, ["ignored.py"], max_candidates=10)
+
+    scores = {candidate.path: candidate.score for candidate in ranked}
+    assert [candidate.path for candidate in ranked] == ["b.py", "a.py", "c.py"]
+    assert scores["a.py"] == pytest.approx(0.9 / 2.1)
+    assert scores["b.py"] == pytest.approx(1.2 / 2.1 + 1.0 / (1.5 + 1.0 / 3))
+    assert scores["c.py"] == pytest.approx(0.5 / (1.5 + 1.0 / 3))
+    assert rank_file_candidates(responses, [], max_candidates=1) == [ranked[0]]
+
+
+def test_rank_file_candidates_leaves_out_file_paths_by_default(monkeypatch):
+    responses = [
+        response("commit", ["a.py"], similarity=0.5),
+        response("file", ["only-file.py", "a.py"]),
+    ]
+    monkeypatch.setattr(settings, "PACKING_FILE_PATH_WEIGHT", 0.0)
+    ranked = rank_file_candidates(responses, [], max_candidates=10)
+    assert [(candidate.path, candidate.score) for candidate in ranked] == [("a.py", pytest.approx(1.0))]
+
+    monkeypatch.setattr(settings, "PACKING_FILE_PATH_WEIGHT", 0.5)
+    scores = {candidate.path: candidate.score for candidate in rank_file_candidates(responses, [], 10)}
+    assert scores == {"a.py": pytest.approx(1.0 + 0.5 * 0.5 / 1.5), "only-file.py": pytest.approx(0.5 / 1.5)}
+
+
+def test_prompt_builder_joins_files_in_rank_order_within_budget():
+    builder = PromptBuilder("head", budget=10)
+    assert builder.try_add(2, "b.py", "second", 4)
+    assert builder.try_add(1, "a.py", "first", 4)
+    assert not builder.try_add(3, "c.py", "third", 3)
+    assert builder.remaining == 2
+    assert builder.build() == "head" + file_header("a.py") + "first\n" + file_header("b.py") + "second\n"
+
+
+def test_pack_context_skips_oversized_files_for_smaller_ones():
+    candidates = [FileCandidate("big.py", 0.9), FileCandidate("small.py", 0.5), FileCandidate("missing.py", 0.4)]
+    contents = {"big.py": words(100), "small.py": words(10)}
+    budget = header_tokens("small.py") + 10 + 5
+    builder = PromptBuilder("", budget)
+
+    packed = asyncio.run(pack_context("project", "gpt-4o", candidates, contents, builder))
+
+    assert [entry.path for entry in packed] == ["small.py"]
+    assert packed[0].tokens == header_tokens("small.py") + 10
+    assert builder.used_tokens == packed[0].tokens
+
+
+def test_pack_context_uses_summaries_for_files_that_overflow():
+    candidates = [FileCandidate("a.py", 0.9), FileCandidate("big.py", 0.8), FileCandidate("c.py", 0.1)]
+    contents = {"a.py": words(10), "big.py": words(500), "c.py": words(10)}
+    requested = []
+
+    async def fetch_summaries(paths):
+        requested.extend(paths)
+        return {"big.py": words(5)}
+
+    budget = header_tokens("a.py") * 3 + 10 + 10 + 5
+    builder = PromptBuilder("", budget)
+    packed = asyncio.run(pack_context("project", None, candidates, contents, builder, fetch_summaries))
+
+    assert requested == ["big.py"]
+    assert [(entry.path, entry.summarized) for entry in packed] == [("a.py", False), ("big.py", True), ("c.py", False)]
+    prompt = builder.build()
+    assert prompt.index("a.py") < prompt.index("big.py") < prompt.index("c.py")
+
+
+def test_pack_context_carries_on_when_summaries_fail():
+    candidates = [FileCandidate("big.py", 0.9), FileCandidate("small.py", 0.5)]
+    contents = {"big.py": words(500), "small.py": words(3)}
+
+    async def fetch_summaries(paths):
+        raise RuntimeError("summaries unavailable")
+
+    builder = PromptBuilder("", 100)
+    packed = asyncio.run(pack_context("project", None, candidates, contents, builder, fetch_summaries))
+    assert [entry.path for entry in packed] == ["small.py"]
+
+
+def test_pack_context_memoizes_file_counts():
+    index = context_packing.token_index
+    candidates = [FileCandidate("a.py", 1.0)]
+    contents = {"a.py": words(10)}
+    for _ in range(2):
+        asyncio.run(pack_context("project", None, candidates, contents, PromptBuilder("", 100)))
+    assert (index.misses, index.hits) == (1, 1)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.cache import ByteLRUCache
+from app.services import file_content_service
+from app.single_flight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(file_content_service, "_file_content_cache", ByteLRUCache(max_bytes=1000))
+    monkeypatch.setattr(file_content_service, "_file_content_flights", SingleFlight("test"))
+
+
+def retrieval_client(requests: list, checkout: dict = None) -> httpx.AsyncClient:
+    """
+    A client whose /retrieve-file-contents/ returns ``content of <path>`` for
+    each path, prefixed by ``checkout["version"]`` when given.
+    """
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        paths = [entry["path"] for entry in body["file_paths"]]
+        requests.append(paths)
+        await asyncio.sleep(0.01)
+        prefix = f"{checkout['version']} " if checkout else ""
+        return httpx.Response(200, json={
+            "contents": {path: f"{prefix}content of {path}" for path in paths},
+            "retrieved_file_paths": paths,
+        })
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_only_uncached_paths_are_fetched():
+    async def main():
+        requests = []
+        async with retrieval_client(requests) as client:
+            first = await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py", "b.py"], [])
+            second = await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py", "c.py"], [])
+        return requests, first, second
+
+    requests, first, second = asyncio.run(main())
+    assert requests == [["a.py", "b.py"], ["c.py"]]
+    assert first == {"a.py": "content of a.py", "b.py": "content of b.py"}
+    assert second == {"a.py": "content of a.py", "c.py": "content of c.py"}
+
+
+def test_cache_is_scoped_by_head_commit():
+    async def main():
+        requests = []
+        async with retrieval_client(requests) as client:
+            await file_content_service.retrieve_file_contents(client, "project", "old", ["a.py"], [])
+            await file_content_service.retrieve_file_contents(client, "project", "new", ["a.py"], [])
+        return requests
+
+    assert asyncio.run(main()) == [["a.py"], ["a.py"]]
+
+
+def test_contents_changed_under_the_same_head_are_refetched_after_the_ttl(monkeypatch):
+    # The prompt ran before a sync: the server still had the old checkout
+    monkeypatch.setattr(file_content_service, "_file_content_cache", ByteLRUCache(max_bytes=1000, ttl=0.05))
+    checkout = {"version": "old"}
+
+    async def main():
+        requests = []
+        async with retrieval_client(requests, checkout) as client:
+            before = await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py"], [])
+            checkout["version"] = "new"
+            cached = await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py"], [])
+            await asyncio.sleep(0.06)
+            after = await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py"], [])
+        return requests, before, cached, after
+
+    requests, before, cached, after = asyncio.run(main())
+    assert before == cached == {"a.py": "old content of a.py"}
+    assert after == {"a.py": "new content of a.py"}
+    assert len(requests) == 2
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def main():
+        requests = []
+        async with retrieval_client(requests) as client:
+            results = await asyncio.gather(*(
+                file_content_service.retrieve_file_contents(client, "project", "head", ["a.py"], [])
+                for _ in range(3)
+            ))
+        return requests, results
+
+    requests, results = asyncio.run(main())
+    assert requests == [["a.py"]]
+    assert results == [{"a.py": "content of a.py"}] * 3
+
+
+def test_cache_stats_report_bytes_and_hit_ratio():
+    async def main():
+        async with retrieval_client([]) as client:
+            await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py"], [])
+            await file_content_service.retrieve_file_contents(client, "project", "head", ["a.py"], [])
+        return file_content_service.file_content_cache_stats()
+
+    stats = asyncio.run(main())
+    assert stats["entries"] == 1
+    assert stats["bytes"] > 0
+    assert stats["hit_ratio"] == 0.5
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+from app.llm_clients import LlmClientCache
+from app.scheduler import LlmScheduler
+from app.services import generate_filename_service
+from app.services.generate_filename_service import generate_filename
+
+
+class FakeLlmModel:
+    def __init__(self, model, api_key, base_url):
+        self.base_url = base_url
+
+    async def send_prompt_streaming(self, prompt):
+        for token in ("<filename>", "fix_parser", ".py", "</filename>"):
+            yield json.dumps({"token": token})
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = LlmScheduler(
+        max_concurrency=1, max_retries=0, backoff_base=0.001, backoff_max=0.01,
+        default_rps=0, default_tpm=0, provider_limits={},
+    )
+    monkeypatch.setattr(generate_filename_service, "llm_scheduler", scheduler)
+    monkeypatch.setattr(generate_filename_service, "llm_clients", LlmClientCache(FakeLlmModel, maxsize=4, idle_ttl=60))
+    return scheduler
+
+
+def test_filename_is_extracted_without_extensions(scheduler):
+    filename = asyncio.run(generate_filename("context", "gpt-4o", "key", "https://api.example.com/v1"))
+    assert filename == "fix_parser"
+
+
+def test_filename_generation_waits_for_a_scheduler_slot(scheduler):
+    async def main():
+        await scheduler.slots.acquire("busy")
+        call = asyncio.ensure_future(generate_filename("context", "gpt-4o", "key", "https://api.example.com/v1"))
+        await asyncio.sleep(0.01)
+        waiting = not call.done()
+        scheduler.slots.release()
+        return waiting, await call, scheduler.slots.active
+
+    waiting, filename, active = asyncio.run(main())
+    assert waiting
+    assert filename == "fix_parser"
+    assert active == 0
+
+
+def test_filename_generation_uses_the_other_provider_limits(scheduler):
+    async def main():
+        await generate_filename(
+            "context", "gpt-4o", "key", "https://api.example.com/v1",
+            llm_model_base_url_other="https://other.example.com/v1", llm_model_api_key_other="other-key",
+        )
+        return set(scheduler._providers)
+
+    assert asyncio.run(main()) == {"other.example.com"}
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app.llm_clients import LlmClientCache
+from app.scheduler import LlmScheduler
+from app.services import generate_response_service
+from app.services.generate_response_service import stream_llm_tokens
+
+
+class FakeLlmModel:
+    """Streams ``tokens``; the test decides when each token is produced."""
+
+    tokens = ['{"token": "a"}', '{"token": "b"}', '{"token": "c"}']
+
+    def __init__(self, model, api_key, base_url):
+        self.closed_streams = 0
+
+    async def send_prompt_streaming(self, prompt):
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(0)
+                yield token
+        finally:
+            self.closed_streams += 1
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = LlmScheduler(
+        max_concurrency=1, max_retries=0, backoff_base=0.001, backoff_max=0.01,
+        default_rps=0, default_tpm=0, provider_limits={},
+    )
+    monkeypatch.setattr(generate_response_service, "llm_scheduler", scheduler)
+    monkeypatch.setattr(generate_response_service, "llm_clients", LlmClientCache(FakeLlmModel, maxsize=4, idle_ttl=60))
+    return scheduler
+
+
+def tokens_of(request_id="request"):
+    return stream_llm_tokens(request_id, "gpt-4o", "key", "https://api.example.com/v1", "prompt", 10)
+
+
+def test_stream_yields_every_token(scheduler):
+    async def main():
+        return [token async for token in tokens_of()]
+
+    assert asyncio.run(main()) == FakeLlmModel.tokens
+    assert scheduler.slots.active == 0
+
+
+def test_slot_is_released_at_the_first_token(scheduler):
+    async def main():
+        stream = tokens_of()
+        first = await stream.__anext__()
+        # The reader has not read on, yet another call can take the only slot
+        held_after_first_token = scheduler.slots.active
+        async with scheduler.slot("other", "https://api.example.com/v1"):
+            other_ran = True
+        rest = [token async for token in stream]
+        return first, held_after_first_token, other_ran, rest
+
+    first, held, other_ran, rest = asyncio.run(main())
+    assert first == FakeLlmModel.tokens[0]
+    assert held == 0
+    assert other_ran
+    assert rest == FakeLlmModel.tokens[1:]
+
+
+def test_stream_waits_for_a_slot_before_opening(scheduler):
+    async def main():
+        await scheduler.slots.acquire("busy")
+        stream = tokens_of()
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.01)
+        waiting = not first.done()
+        scheduler.slots.release()
+        token = await first
+        await stream.aclose()
+        return waiting, token, scheduler.slots.active
+
+    waiting, token, active = asyncio.run(main())
+    assert waiting
+    assert token == FakeLlmModel.tokens[0]
+    assert active == 0
+
+
+def test_closing_the_stream_early_closes_the_provider_stream(scheduler):
+    async def main():
+        stream = tokens_of()
+        await stream.__anext__()
+        await stream.aclose()
+        (client, _, leases), = generate_response_service.llm_clients._clients.values()
+        return client.closed_streams, leases
+
+    closed, leases = asyncio.run(main())
+    assert closed == 1
+    assert leases == 0
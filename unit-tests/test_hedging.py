@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app.hedging import hedged_stream
+
+PROVIDERS = {"primary": "primary.example.com", "alternate": "alternate.example.com"}
+
+
+class FakeStream:
+    """An LLM token stream that waits ``first_delay`` before its first token."""
+
+    def __init__(self, tokens, first_delay=0.0, error=None):
+        self.tokens = tokens
+        self.first_delay = first_delay
+        self.error = error
+        self.opened = False
+        self.closed = False
+
+    def open(self):
+        self.opened = True
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            await asyncio.sleep(self.first_delay)
+            if self.error is not None:
+                raise self.error
+            for token in self.tokens:
+                yield token
+                await asyncio.sleep(0)
+        finally:
+            self.closed = True
+
+
+async def collect(primary, alternate, delay):
+    return [token async for token in hedged_stream(primary.open, alternate.open, delay, PROVIDERS)]
+
+
+def test_fast_primary_is_never_hedged():
+    primary = FakeStream(["a", "b", "c"])
+    alternate = FakeStream(["x"])
+    assert asyncio.run(collect(primary, alternate, 0.5)) == ["a", "b", "c"]
+    assert primary.closed
+    assert not alternate.opened
+
+
+def test_slow_primary_loses_to_alternate_and_is_closed():
+    primary = FakeStream(["a", "b"], first_delay=1.0)
+    alternate = FakeStream(["x", "y"])
+    assert asyncio.run(collect(primary, alternate, 0.01)) == ["x", "y"]
+    assert alternate.closed
+    assert primary.closed
+
+
+def test_primary_still_wins_when_it_answers_first_after_hedging():
+    primary = FakeStream(["a", "b"], first_delay=0.02)
+    alternate = FakeStream(["x"], first_delay=1.0)
+    assert asyncio.run(collect(primary, alternate, 0.01)) == ["a", "b"]
+    assert alternate.opened
+    assert alternate.closed
+
+
+def test_primary_failure_hedges_immediately():
+    primary = FakeStream(["a"], error=RuntimeError("primary down"))
+    alternate = FakeStream(["x", "y"])
+    assert asyncio.run(collect(primary, alternate, 10)) == ["x", "y"]
+
+
+def test_both_failing_raises_the_primary_error():
+    primary = FakeStream(["a"], error=RuntimeError("primary down"))
+    alternate = FakeStream(["x"], error=RuntimeError("alternate down"))
+    with pytest.raises(RuntimeError, match="primary down"):
+        asyncio.run(collect(primary, alternate, 10))
+    assert primary.closed
+    assert alternate.closed
+
+
+def test_empty_winner_ends_the_stream():
+    primary = FakeStream([])
+    alternate = FakeStream(["x"])
+    assert asyncio.run(collect(primary, alternate, 0.5)) == []
+    assert not alternate.opened
+
+
+def test_closing_the_hedged_stream_closes_the_winner():
+    primary = FakeStream(["a", "b", "c"])
+    alternate = FakeStream(["x"])
+
+    async def main():
+        stream = hedged_stream(primary.open, alternate.open, 0.5, PROVIDERS)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(main()) == "a"
+    assert primary.closed
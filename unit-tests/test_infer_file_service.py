@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import settings
+from app.cache import TTLCache
+from app.services import infer_file_service
+from app.services.infer_file_service import infer_files, normalize_prompt
+from app.single_flight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(infer_file_service, "_infer_file_cache", TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(infer_file_service, "_infer_file_flights", SingleFlight("test"))
+    monkeypatch.setattr(settings, "INFER_FILE_CACHE_PER_SCOPE", 4)
+    monkeypatch.setattr(settings, "INFER_FILE_SIMILARITY_THRESHOLD", 0.0)
+
+
+def infer_params(prompt: str, **overrides) -> dict:
+    params = {
+        "prompt": prompt,
+        "project": "project",
+        "head": "head",
+        "mode": "commit",
+        "match_strength": "mid",
+        "model": "gpt-4o",
+        "ignore_files": [],
+    }
+    params.update(overrides)
+    return params
+
+
+def retrieval_client(prompts: list) -> httpx.AsyncClient:
+    """A client whose /infer-file/ returns one commit result naming the prompt it was asked."""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["prompt"]
+        prompts.append(prompt)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=[{
+            "oid": "abc123",
+            "similarity": 0.8,
+            "file_paths": [{"path": f"{len(prompts)}.py"}],
+            "embedding_model": "text-embedding-3-large",
+            "mode": "commit",
+            "path_type": "commit",
+        }])
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def paths_for(client, *params_list):
+    return [
+        [entry.path for response in await infer_files(client, params) for entry in response.file_paths]
+        for params in params_list
+    ]
+
+
+def test_normalize_prompt_ignores_case_punctuation_and_spacing():
+    assert normalize_prompt("Where is  the CLI parser?") == ("where", "is", "the", "cli", "parser")
+    assert normalize_prompt("where is the cli parser") == normalize_prompt("Where is  the CLI parser?")
+
+
+def test_exact_repeat_is_served_from_the_cache():
+    async def main():
+        prompts = []
+        async with retrieval_client(prompts) as client:
+            paths = await paths_for(client, infer_params("Where is the parser?"), infer_params("where is the PARSER"))
+        return prompts, paths
+
+    prompts, paths = asyncio.run(main())
+    assert prompts == ["Where is the parser?"]
+    assert paths == [["1.py"], ["1.py"]]
+
+
+def test_results_are_scoped_by_head_commit():
+    async def main():
+        prompts = []
+        async with retrieval_client(prompts) as client:
+            await paths_for(client, infer_params("parser"), infer_params("parser", head="other"))
+        return prompts
+
+    assert asyncio.run(main()) == ["parser", "parser"]
+
+
+async def similar_prompt_paths():
+    async with retrieval_client([]) as client:
+        return await paths_for(
+            client,
+            infer_params("where is the command line parser defined"),
+            infer_params("where is the command line parser declared"),
+            infer_params("how are tokens counted"),
+        )
+
+
+def test_similar_prompts_reuse_results_above_the_threshold(monkeypatch):
+    monkeypatch.setattr(settings, "INFER_FILE_SIMILARITY_THRESHOLD", 0.8)
+    assert asyncio.run(similar_prompt_paths()) == [["1.py"], ["1.py"], ["2.py"]]
+
+
+def test_similar_prompts_are_not_reused_without_a_threshold():
+    assert asyncio.run(similar_prompt_paths()) == [["1.py"], ["2.py"], ["3.py"]]
+
+
+def test_each_scope_keeps_only_its_newest_prompts():
+    async def main():
+        prompts = []
+        async with retrieval_client(prompts) as client:
+            await paths_for(client, *(infer_params(f"prompt {index}") for index in range(6)))
+            await paths_for(client, infer_params("prompt 5"), infer_params("prompt 0"))
+        return prompts
+
+    prompts = asyncio.run(main())
+    assert prompts == [f"prompt {index}" for index in range(6)] + ["prompt 0"]
+
+
+def test_concurrent_identical_prompts_share_one_call():
+    async def main():
+        prompts = []
+        async with retrieval_client(prompts) as client:
+            results = await asyncio.gather(*(infer_files(client, infer_params("parser")) for _ in range(3)))
+        return prompts, results
+
+    prompts, results = asyncio.run(main())
+    assert prompts == ["parser"]
+    assert results[0] is results[1] is results[2]
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+
+from app.cache import hash_secret
+from app.jobs import (
+    CANCELLED,
+    FAILED,
+    INTERRUPTED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    JobManager,
+    JobQueueFull,
+    JobStore,
+)
+
+FINAL = (SUCCEEDED, FAILED, CANCELLED, INTERRUPTED)
+OWNER = hash_secret("llm-key")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs" / "jobs.db"))
+    store.open()
+    yield store
+    store.close()
+
+
+def manager_for(path: str, **kwargs) -> JobManager:
+    options = dict(workers=1, queue_size=4, ttl=60, flush_events=2)
+    options.update(kwargs)
+    return JobManager(JobStore(path), **options)
+
+
+def events_of(*events):
+    async def run():
+        for event in events:
+            await asyncio.sleep(0)
+            yield event
+    return run
+
+
+async def wait_until_final(manager: JobManager, job_id: str) -> dict:
+    for _ in range(200):
+        job = await manager.status(job_id, OWNER)
+        if job["status"] in FINAL:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+async def collect(events):
+    return [item async for item in events]
+
+
+def test_store_tracks_status_and_events(store):
+    store.create("job", OWNER, {"prompt": "hi"}, ttl=60)
+    assert store.get("job", OWNER)["status"] == QUEUED
+    assert store.request("job", OWNER) == {"prompt": "hi"}
+
+    store.set_status("job", RUNNING, ttl=60)
+    store.append_events("job", 1, ["one\n", "two\n"])
+    store.append_events("job", 3, ["three\n"])
+    job = store.get("job", OWNER)
+    assert job["status"] == RUNNING
+    assert job["event_count"] == 3
+    assert store.events("job", 1) == [(2, "two\n"), (3, "three\n")]
+
+    store.set_status("job", FAILED, ttl=60, error="boom")
+    assert store.get("job", OWNER)["error"] == "boom"
+
+
+def test_store_hides_and_purges_expired_jobs(store):
+    store.create("old", OWNER, {}, ttl=-1)
+    store.append_events("old", 1, ["event\n"])
+    store.create("new", OWNER, {}, ttl=60)
+    assert store.get("old", OWNER) is None
+    assert store.request("old", OWNER) is None
+    assert store.purge_expired() == 1
+    assert store.events("old", 0) == []
+    assert store.get("new", OWNER) is not None
+
+
+def test_store_only_shows_a_job_to_its_owner(store):
+    store.create("job", OWNER, {"prompt": "hi"}, ttl=60)
+    other = hash_secret("someone-else")
+    assert store.get("job", other) is None
+    assert store.request("job", other) is None
+    assert store.get("job", "") is None
+
+
+def test_store_keeps_a_finished_job_for_the_ttl_after_it_finished(store):
+    # Queued long enough that a TTL counted from creation would have run out
+    store.create("job", OWNER, {}, ttl=0.01)
+    time.sleep(0.02)
+    store.set_status("job", SUCCEEDED, ttl=60)
+    job = store.get("job", OWNER)
+    assert job is not None
+    assert job["expires_at"] >= job["updated_at"] + 60
+
+
+def test_store_adds_the_owner_column_to_an_older_database(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL,"
+        " error TEXT, event_count INTEGER NOT NULL DEFAULT 0,"
+        " created_at REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs VALUES ('old', 'succeeded', '{}', NULL, 0, 0, 0, ?)", (time.time() + 60,))
+    conn.commit()
+    conn.close()
+
+    store = JobStore(path)
+    store.open()
+    try:
+        # Nobody owns a job stored before owners were recorded
+        assert store.get("old", OWNER) is None
+        store.create("new", OWNER, {}, ttl=60)
+        assert store.get("new", OWNER) is not None
+    finally:
+        store.close()
+
+
+def test_store_interrupts_unfinished_jobs_and_requeues_them(store):
+    for job_id, status in (("queued", QUEUED), ("running", RUNNING), ("done", SUCCEEDED)):
+        store.create(job_id, OWNER, {}, ttl=60)
+        store.set_status(job_id, status, ttl=60)
+    store.append_events("running", 1, ["partial\n"])
+
+    assert store.interrupt_unfinished(ttl=60) == 2
+    assert store.get("queued", OWNER)["status"] == INTERRUPTED
+    assert store.get("done", OWNER)["status"] == SUCCEEDED
+
+    assert store.requeue_interrupted("running", ttl=60)
+    job = store.get("running", OWNER)
+    assert job["status"] == QUEUED
+    assert job["error"] is None
+    assert job["event_count"] == 0
+    assert store.events("running", 0) == []
+    # Only interrupted jobs are requeued
+    assert not store.requeue_interrupted("running", ttl=60)
+    assert not store.requeue_interrupted("done", ttl=60)
+
+
+def test_manager_runs_a_job_and_keeps_its_events(tmp_path):
+    async def main():
+        manager = manager_for(str(tmp_path / "jobs.db"))
+        await manager.start()
+        try:
+            job_id = await manager.submit(OWNER, {"prompt": "hi"}, events_of({"token": "a"}, {"token": "b"}, {"token": "c"}))
+            job = await wait_until_final(manager, job_id)
+            events = [item async for item in manager.events(job_id)]
+            return job, events
+        finally:
+            await manager.stop()
+
+    job, events = asyncio.run(main())
+    assert job["status"] == SUCCEEDED
+    assert job["event_count"] == 3
+    assert [json.loads(line)["token"] for _, line in events] == ["a", "b", "c"]
+    assert [seq for seq, _ in events] == [1, 2, 3]
+
+
+def test_manager_marks_a_job_with_an_error_event_failed(tmp_path):
+    async def main():
+        manager = manager_for(str(tmp_path / "jobs.db"))
+        await manager.start()
+        try:
+            job_id = await manager.submit(OWNER, {}, events_of({"token": "a"}, {"error": "upstream failed"}))
+            return await wait_until_final(manager, job_id)
+        finally:
+            await manager.stop()
+
+    job = asyncio.run(main())
+    assert job["status"] == FAILED
+    assert job["error"] == "upstream failed"
+
+
+def test_manager_cancels_a_running_job(tmp_path):
+    async def main():
+        manager = manager_for(str(tmp_path / "jobs.db"))
+        await manager.start()
+        started = asyncio.Event()
+
+        async def run():
+            yield {"token": "a"}
+            started.set()
+            await asyncio.sleep(10)
+            yield {"token": "never"}
+
+        try:
+            job_id = await manager.submit(OWNER, {}, run)
+            await started.wait()
+            assert await manager.cancel(job_id)
+            return await wait_until_final(manager, job_id)
+        finally:
+            await manager.stop()
+
+    job = asyncio.run(main())
+    assert job["status"] == CANCELLED
+    assert job["event_count"] == 1
+
+
+def test_manager_follows_live_events(tmp_path):
+    async def main():
+        manager = manager_for(str(tmp_path / "jobs.db"), flush_events=100)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def run():
+            yield {"token": "a"}
+            await release.wait()
+            yield {"token": "b"}
+
+        try:
+            job_id = await manager.submit(OWNER, {}, run)
+            reader = asyncio.create_task(collect(manager.events(job_id, follow=True)))
+            await asyncio.sleep(0.05)
+            release.set()
+            return await asyncio.wait_for(reader, 1)
+        finally:
+            await manager.stop()
+
+    events = asyncio.run(main())
+    assert [json.loads(line)["token"] for _, line in events] == ["a", "b"]
+
+
+def test_manager_rejects_jobs_when_the_queue_is_full(tmp_path):
+    async def main():
+        manager = manager_for(str(tmp_path / "jobs.db"), queue_size=1)
+        # Not started: nothing takes jobs off the queue
+        await asyncio.to_thread(manager.store.open)
+        try:
+            await manager.submit(OWNER, {}, events_of())
+            with pytest.raises(JobQueueFull):
+                await manager.submit(OWNER, {}, events_of())
+        finally:
+            manager.store.close()
+
+    asyncio.run(main())
+
+
+def test_manager_stays_unavailable_without_a_store(tmp_path):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+
+    async def main():
+        manager = manager_for(str(blocker / "jobs.db"))
+        await manager.start()
+        available = manager.available
+        await manager.stop()
+        return available
+
+    assert asyncio.run(main()) is False
+
+
+def test_restart_interrupts_a_running_job_and_resume_runs_it_again(tmp_path):
+    path = str(tmp_path / "jobs.db")
+
+    async def first_run():
+        manager = manager_for(path)
+        await manager.start()
+        started = asyncio.Event()
+
+        async def run():
+            yield {"token": "a"}
+            yield {"token": "b"}
+            started.set()
+            await asyncio.sleep(10)
+
+        job_id = await manager.submit(OWNER, {"prompt": "hi"}, run)
+        await started.wait()
+        await manager.stop()
+        return job_id
+
+    async def second_run(job_id):
+        manager = manager_for(path)
+        await manager.start()
+        try:
+            interrupted = await manager.status(job_id, OWNER)
+            request = await manager.request(job_id, OWNER)
+            resumed = await manager.resume(job_id, events_of({"token": "x"}))
+            job = await wait_until_final(manager, job_id)
+            events = [item async for item in manager.events(job_id)]
+            again = await manager.resume(job_id, events_of())
+            return interrupted, request, resumed, job, events, again
+        finally:
+            await manager.stop()
+
+    job_id = asyncio.run(first_run())
+    interrupted, request, resumed, job, events, again = asyncio.run(second_run(job_id))
+    assert interrupted["status"] == INTERRUPTED
+    assert request == {"prompt": "hi"}
+    assert resumed
+    assert job["status"] == SUCCEEDED
+    assert [json.loads(line)["token"] for _, line in events] == ["x"]
+    assert not again
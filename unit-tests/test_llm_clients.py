@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from app.cache import hash_secret
+from app.llm_clients import LlmClientCache
+
+
+class FakeLlmModel:
+    def __init__(self, model, api_key, base_url):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+
+
+def cache_of(maxsize=4, idle_ttl=60):
+    return LlmClientCache(FakeLlmModel, maxsize=maxsize, idle_ttl=idle_ttl)
+
+
+def test_lease_reuses_a_client_per_url_model_and_key():
+    cache = cache_of()
+
+    async def lease(model="gpt-4o", api_key="key", base_url="https://api.example.com/v1"):
+        async with cache.lease(model, api_key, base_url) as client:
+            return client
+
+    async def main():
+        first = await lease()
+        return first, await lease(), await lease(api_key="other"), await lease(model="gpt-4.1")
+
+    first, again, other_key, other_model = asyncio.run(main())
+    assert again is first
+    assert other_key is not first and other_key.api_key == "other"
+    assert other_model is not first
+    assert len(cache) == 3
+    # The cache key holds a digest of the api key, never the key itself
+    assert {key[2] for key in cache._clients} == {hash_secret("key"), hash_secret("other")}
+
+
+def test_overflow_never_drops_a_client_in_use():
+    cache = cache_of(maxsize=1)
+
+    async def main():
+        async with cache.lease("gpt-4o", "key", "https://a.example.com") as busy:
+            async with cache.lease("gpt-4o", "key", "https://b.example.com"):
+                # Over the limit, but both clients are in use
+                both_kept = len(cache)
+            # The newer client went idle and made way for the one in use
+            async with cache.lease("gpt-4o", "key", "https://a.example.com") as again:
+                reused = again is busy
+        return both_kept, reused, len(cache)
+
+    both_kept, reused, size = asyncio.run(main())
+    assert both_kept == 2
+    assert reused
+    assert size == 1
+
+
+def test_idle_clients_are_dropped_after_the_ttl(monkeypatch):
+    cache = cache_of(idle_ttl=60)
+
+    async def main():
+        async with cache.lease("gpt-4o", "key", "https://api.example.com/v1") as first:
+            # In use for longer than the ttl: not idle, so it is kept
+            now = time.monotonic()
+            monkeypatch.setattr("app.llm_clients.time.monotonic", lambda: now + 120)
+            cache.evict_idle()
+            in_use_kept = len(cache) == 1
+        monkeypatch.setattr("app.llm_clients.time.monotonic", lambda: now + 240)
+        async with cache.lease("gpt-4o", "key", "https://api.example.com/v1") as second:
+            return in_use_kept, second is first
+
+    in_use_kept, reused = asyncio.run(main())
+    assert in_use_kept
+    assert not reused
+
+
+def test_disabled_cache_creates_a_client_per_lease():
+    cache = cache_of(maxsize=0)
+
+    async def main():
+        async with cache.lease("gpt-4o", "key", "https://api.example.com/v1") as first:
+            pass
+        async with cache.lease("gpt-4o", "key", "https://api.example.com/v1") as second:
+            return first, second
+
+    first, second = asyncio.run(main())
+    assert first is not second
+    assert len(cache) == 0
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from app import settings
+from app.cache import TTLCache
+from app.services import generate_response_service, pull_access_service
+from app.services.pull_access_service import check_pull_access
+from app.single_flight import SingleFlight
+
+CODEHOST_URL = "https://github.com/example/project"
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """A fresh decision cache and a fake /test-pull-access/ recording each call."""
+    calls = {"pull_access": True, "keys": []}
+
+    def handler(request):
+        calls["keys"].append(request.url.params.get("codehost_api_key"))
+        return httpx.Response(200, json={"pull_access": calls["pull_access"]})
+
+    monkeypatch.setattr(pull_access_service, "_pull_access_cache", TTLCache(maxsize=16, ttl=300))
+    monkeypatch.setattr(pull_access_service, "_pull_access_flights", SingleFlight("test_pull_access"))
+    monkeypatch.setattr(settings, "PULL_ACCESS_CACHE_TTL", 300.0)
+    monkeypatch.setattr(settings, "PULL_ACCESS_CACHE_NEGATIVE_TTL", 5.0)
+    calls["client"] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return calls
+
+
+def check(upstream, api_key="token", project="project"):
+    return check_pull_access(upstream["client"], project, CODEHOST_URL, SecretStr(api_key))
+
+
+def test_an_allowed_decision_is_served_from_the_cache(upstream):
+    async def main():
+        return [await check(upstream) for _ in range(3)]
+
+    assert asyncio.run(main()) == [True, True, True]
+    assert upstream["keys"] == ["token"]
+
+
+def test_a_denied_decision_expires_after_the_negative_ttl(upstream, monkeypatch):
+    upstream["pull_access"] = False
+
+    async def main():
+        denied = await check(upstream)
+        cached = await check(upstream)
+        # The credential gains access: the denial is only trusted briefly
+        upstream["pull_access"] = True
+        now = time.monotonic()
+        monkeypatch.setattr("app.cache.time.monotonic", lambda: now + 6)
+        return denied, cached, await check(upstream)
+
+    assert asyncio.run(main()) == (False, False, True)
+    assert upstream["keys"] == ["token", "token"]
+
+
+def test_different_keys_do_not_share_a_decision(upstream):
+    async def main():
+        allowed = await check(upstream, api_key="allowed")
+        upstream["pull_access"] = False
+        return allowed, await check(upstream, api_key="other"), await check(upstream, api_key="allowed")
+
+    assert asyncio.run(main()) == (True, False, True)
+    assert upstream["keys"] == ["allowed", "other"]
+
+
+def test_concurrent_checks_share_one_upstream_call(upstream):
+    async def main():
+        return await asyncio.gather(*(check(upstream) for _ in range(5)))
+
+    assert asyncio.run(main()) == [True] * 5
+    assert upstream["keys"] == ["token"]
+
+
+def test_speculative_infer_is_cancelled_when_access_is_denied(monkeypatch):
+    infer = {"started": None, "cancelled": False}
+
+    async def infer_files(client, params):
+        infer["started"].set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            infer["cancelled"] = True
+            raise
+
+    async def check_pull_access(client, project, codehost_url, codehost_api_key):
+        await infer["started"].wait()
+        return False
+
+    async def count_tokens(text, model):
+        return 10
+
+    monkeypatch.setattr(settings, "SPECULATIVE_PULL_ACCESS", True)
+    monkeypatch.setattr(generate_response_service, "get_http_client", lambda: None)
+    monkeypatch.setattr(generate_response_service, "infer_files", infer_files)
+    monkeypatch.setattr(generate_response_service, "check_pull_access", check_pull_access)
+    monkeypatch.setattr(generate_response_service, "count_tokens", count_tokens)
+
+    async def main():
+        infer["started"] = asyncio.Event()
+        events = generate_response_service.generate_response(
+            "prompt", "project", "commit", "gpt-4o", "mid", "llm-key", "https://api.example.com",
+            SecretStr("token"), CODEHOST_URL, [], "head",
+        )
+        return [event async for event in events]
+
+    events = asyncio.run(main())
+    assert infer["cancelled"]
+    assert any("error" in event for event in events if isinstance(event, dict))
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import time
+
+from app.response_cache import ResponseCache, events_size, response_cache_key
+from app.streaming import EncodedEvent
+
+EVENTS = [
+    EncodedEvent('{"token":"Hello"}'),
+    EncodedEvent('{"token":" world"}'),
+    {"event": "file_edit", "path": "a.py", "content": "print()"},
+    {"machtiani": "done"},
+]
+
+
+def test_key_ignores_the_order_of_ignore_files():
+    first = response_cache_key("prompt", "project", "head", "gpt-4o", "commit", "mid", ["b", "a"])
+    second = response_cache_key("prompt", "project", "head", "gpt-4o", "commit", "mid", ["a", "b"])
+    assert first == second
+    assert first != response_cache_key("prompt", "project", "other", "gpt-4o", "commit", "mid", ["a", "b"])
+
+
+def test_memory_tier_is_bounded_by_encoded_size():
+    async def main():
+        cache = ResponseCache(max_bytes=events_size(EVENTS) * 2, directory=None, ttl=60)
+        for key in ("a", "b", "c"):
+            await cache.set(key, EVENTS)
+        return cache, await cache.get("a"), await cache.get("c")
+
+    cache, evicted, kept = asyncio.run(main())
+    assert evicted is None
+    assert kept == EVENTS
+    assert cache.memory.bytes == events_size(EVENTS) * 2
+
+
+def test_oversized_response_is_not_kept_in_memory():
+    async def main():
+        cache = ResponseCache(max_bytes=events_size(EVENTS) - 1, directory=None, ttl=60)
+        await cache.set("a", EVENTS)
+        return await cache.get("a")
+
+    assert asyncio.run(main()) is None
+
+
+def test_disk_tier_replays_the_same_events(tmp_path):
+    directory = str(tmp_path / "responses")
+
+    async def main():
+        await ResponseCache(max_bytes=0, directory=directory, ttl=60).set("key", EVENTS)
+        # A new cache, as after a restart, only has the disk tier
+        cache = ResponseCache(max_bytes=10000, directory=directory, ttl=60)
+        events = await cache.get("key")
+        return events, "key" in cache.memory
+
+    events, promoted = asyncio.run(main())
+    assert events == EVENTS
+    assert all(isinstance(event, EncodedEvent) for event in events[:2])
+    assert isinstance(events[2], dict)
+    assert promoted
+
+
+def test_disk_entries_expire_after_the_ttl(tmp_path):
+    directory = str(tmp_path / "responses")
+
+    async def main():
+        cache = ResponseCache(max_bytes=0, directory=directory, ttl=60)
+        await cache.set("key", EVENTS)
+        path = os.path.join(directory, "key.ndjson")
+        stale = time.time() - 120
+        os.utime(path, (stale, stale))
+        return await cache.get("key"), os.path.exists(path)
+
+    events, exists = asyncio.run(main())
+    assert events is None
+    assert not exists
+
+
+def test_memory_entries_expire_after_the_ttl(monkeypatch):
+    async def main():
+        cache = ResponseCache(max_bytes=10000, directory=None, ttl=60)
+        await cache.set("key", EVENTS)
+        now = time.monotonic()
+        monkeypatch.setattr("app.cache.time.monotonic", lambda: now + 61)
+        return await cache.get("key")
+
+    assert asyncio.run(main()) is None
+
+
+def test_promoted_disk_entry_keeps_the_time_it_has_left(tmp_path, monkeypatch):
+    directory = str(tmp_path / "responses")
+
+    async def main():
+        await ResponseCache(max_bytes=0, directory=directory, ttl=60).set("key", EVENTS)
+        path = os.path.join(directory, "key.ndjson")
+        written = time.time() - 50
+        os.utime(path, (written, written))
+        cache = ResponseCache(max_bytes=10000, directory=directory, ttl=60)
+        assert await cache.get("key") == EVENTS
+        os.remove(path)
+        now = time.monotonic()
+        monkeypatch.setattr("app.cache.time.monotonic", lambda: now + 15)
+        return await cache.get("key")
+
+    assert asyncio.run(main()) is None
+
+
+def test_directory_is_created_on_first_write(tmp_path):
+    directory = str(tmp_path / "responses")
+    cache = ResponseCache(max_bytes=0, directory=directory, ttl=60)
+    assert not os.path.exists(directory)
+
+    asyncio.run(cache.set("key", EVENTS))
+    assert os.listdir(directory) == ["key.ndjson"]
+
+
+def test_unusable_directory_disables_the_disk_tier(tmp_path, caplog):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ResponseCache(max_bytes=10000, directory=str(blocker / "responses"), ttl=60)
+
+    async def main():
+        await cache.set("key", EVENTS)
+        return await cache.get("key")
+
+    assert asyncio.run(main()) == EVENTS
+    assert cache.directory is None
+    assert "disabling the disk tier" in caplog.text
+
+
+def test_concurrent_writers_do_not_share_a_temporary_file(tmp_path):
+    directory = str(tmp_path / "responses")
+    other = [EncodedEvent('{"token":"Other"}'), {"machtiani": "done"}]
+
+    async def main():
+        cache = ResponseCache(max_bytes=0, directory=directory, ttl=60)
+        await asyncio.gather(*(cache.set("key", events) for events in [EVENTS, other] * 10))
+        return await ResponseCache(max_bytes=0, directory=directory, ttl=60).get("key")
+
+    assert asyncio.run(main()) in (EVENTS, other)
+    assert os.listdir(directory) == ["key.ndjson"]
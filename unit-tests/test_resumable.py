@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+from app.resumable import ResumableStreams, tag_event_id
+from app.streaming import EncodedEvent
+
+
+def events_of(*events, wait: asyncio.Event = None):
+    async def run():
+        for event in events:
+            yield event
+        if wait is not None:
+            await wait.wait()
+    return run()
+
+
+async def read(stream, after=0, limit=None):
+    events = []
+    async for event in stream.attach(after):
+        events.append(event)
+        if limit is not None and len(events) == limit:
+            break
+    return events
+
+
+def test_tag_event_id_numbers_dicts_and_encoded_frames():
+    assert tag_event_id({"token": "a"}, 3) == {"event_id": 3, "token": "a"}
+    tagged = tag_event_id(EncodedEvent('{"token":"a"}'), 4)
+    assert isinstance(tagged, EncodedEvent)
+    assert json.loads(tagged) == {"event_id": 4, "token": "a"}
+    assert json.loads(tag_event_id(EncodedEvent("{}"), 5)) == {"event_id": 5}
+
+
+def test_reader_gets_buffered_events_after_its_last_id():
+    async def main():
+        streams = ResumableStreams(max_bytes=10000, stream_bytes=10000, grace=10)
+        stream = streams.start(events_of({"token": "a"}, {"token": "b"}, {"token": "c"}))
+        await stream.task
+        events = await read(stream, after=1)
+        await streams.close()
+        return events
+
+    assert asyncio.run(main()) == [{"event_id": 2, "token": "b"}, {"event_id": 3, "token": "c"}]
+
+
+def test_reader_follows_the_live_tail():
+    async def main():
+        streams = ResumableStreams(max_bytes=10000, stream_bytes=10000, grace=10)
+        queue = asyncio.Queue()
+
+        async def run():
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+
+        stream = streams.start(run())
+        reader = asyncio.create_task(read(stream))
+        for token in ("a", "b"):
+            await queue.put({"token": token})
+            await asyncio.sleep(0)
+        await queue.put(None)
+        events = await asyncio.wait_for(reader, 1)
+        await streams.close()
+        return events
+
+    assert [event["token"] for event in asyncio.run(main())] == ["a", "b"]
+
+
+def test_stream_cap_drops_oldest_events_and_reports_the_gap():
+    async def main():
+        streams = ResumableStreams(max_bytes=10000, stream_bytes=50, grace=10)
+        stream = streams.start(events_of(*({"token": str(index)} for index in range(10))))
+        await stream.task
+        events = await read(stream)
+        await streams.close()
+        return stream, events
+
+    stream, events = asyncio.run(main())
+    assert stream.bytes <= 50
+    gap = events[0]
+    assert gap["event"] == "resume_gap"
+    assert gap["missing_from"] == 1
+    assert gap["missing_to"] == stream.first_id - 1
+    assert [event["event_id"] for event in events[1:]] == list(range(stream.first_id, 11))
+
+
+def test_memory_cap_trims_the_oldest_stream_first():
+    async def main():
+        streams = ResumableStreams(max_bytes=110, stream_bytes=10000, grace=10)
+        release = asyncio.Event()
+        old = streams.start(events_of(*({"token": str(index)} for index in range(5)), wait=release))
+        await asyncio.sleep(0)
+        new = streams.start(events_of(*({"token": str(index)} for index in range(3)), wait=release))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(old.task, new.task)
+        result = (old.first_id, new.first_id, streams.bytes, old.bytes + new.bytes)
+        await streams.close()
+        return result
+
+    old_first, new_first, total, summed = asyncio.run(main())
+    assert total <= 110
+    assert total == summed
+    assert old_first > 1
+    assert new_first == 1
+
+
+def test_producer_error_becomes_an_error_event():
+    async def main():
+        streams = ResumableStreams(max_bytes=10000, stream_bytes=10000, grace=10)
+
+        async def run():
+            yield {"token": "a"}
+            raise RuntimeError("upstream failed")
+
+        stream = streams.start(run())
+        await stream.task
+        events = await read(stream)
+        await streams.close()
+        return events
+
+    events = asyncio.run(main())
+    assert events[0] == {"event_id": 1, "token": "a"}
+    assert events[1]["event_id"] == 2
+    assert "upstream failed" in events[1]["error"]
+
+
+def test_unread_stream_is_cancelled_after_the_grace_period():
+    async def main():
+        streams = ResumableStreams(max_bytes=10000, stream_bytes=10000, grace=0.02)
+        stream = streams.start(events_of({"token": "a"}, wait=asyncio.Event()))
+        assert await read(stream, limit=1) == [{"event_id": 1, "token": "a"}]
+        await asyncio.sleep(0.05)
+        await asyncio.gather(stream.task, return_exceptions=True)
+        return streams.get(stream.id), stream.task.cancelled(), streams.bytes
+
+    registered, cancelled, total = asyncio.run(main())
+    assert registered is None
+    assert cancelled
+    assert total == 0
+
+
+def test_reattaching_within_the_grace_period_keeps_the_stream():
+    async def main():
+        streams = ResumableStreams(max_bytes=10000, stream_bytes=10000, grace=0.05)
+        release = asyncio.Event()
+        stream = streams.start(events_of({"token": "a"}, {"token": "b"}, wait=release))
+        await read(stream, limit=1)
+        await asyncio.sleep(0.01)
+        reader = asyncio.create_task(read(stream, after=1))
+        await asyncio.sleep(0.1)
+        release.set()
+        events = await asyncio.wait_for(reader, 1)
+        registered = streams.get(stream.id)
+        await streams.close()
+        return registered is stream, events
+
+    kept, events = asyncio.run(main())
+    assert kept
+    assert events == [{"event_id": 2, "token": "b"}]
@@ -0,0 +1,161 @@
+import asyncio
+import email.utils
+import time
+
+import httpx
+
+from app.scheduler import FairLimiter, LlmScheduler, TokenBucket, retry_after_seconds
+
+
+def response(status_code: int, retry_after: str = None) -> httpx.Response:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return httpx.Response(status_code, headers=headers)
+
+
+def test_fair_limiter_hands_out_slots_round_robin():
+    async def main():
+        limiter = FairLimiter(1)
+        order = []
+
+        async def call(owner, index):
+            await limiter.acquire(owner)
+            order.append((owner, index))
+            await asyncio.sleep(0)
+            limiter.release()
+
+        await limiter.acquire("holder")
+        tasks = [asyncio.create_task(call("a", index)) for index in range(3)]
+        tasks.append(asyncio.create_task(call("b", 0)))
+        tasks.append(asyncio.create_task(call("c", 0)))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter.active
+
+    order, active = asyncio.run(main())
+    assert order == [("a", 0), ("b", 0), ("c", 0), ("a", 1), ("a", 2)]
+    assert active == 0
+
+
+def test_fair_limiter_cancelled_waiter_leaves_the_queue():
+    async def main():
+        limiter = FairLimiter(1)
+        await limiter.acquire("holder")
+        waiter = asyncio.create_task(limiter.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        queued = dict(limiter._waiters)
+        limiter.release()
+        return queued, limiter.active
+
+    queued, active = asyncio.run(main())
+    assert queued == {}
+    assert active == 0
+
+
+def test_fair_limiter_releases_slot_handed_over_before_cancellation():
+    async def main():
+        limiter = FairLimiter(1)
+        await limiter.acquire("holder")
+        waiter = asyncio.create_task(limiter.acquire("a"))
+        await asyncio.sleep(0)
+        # The slot goes to the waiter, which is cancelled before it resumes
+        limiter.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return waiter.cancelled(), limiter.active
+
+    cancelled, active = asyncio.run(main())
+    assert cancelled
+    assert active == 0
+
+
+def test_token_bucket_waits_for_refill():
+    async def main():
+        bucket = TokenBucket(rate=50.0, capacity=2)
+        start = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        burst = time.monotonic() - start
+        await bucket.acquire()
+        return burst, time.monotonic() - start
+
+    burst, total = asyncio.run(main())
+    assert burst < 0.01
+    assert total >= 0.015
+
+
+def test_token_bucket_without_rate_never_waits():
+    async def main():
+        bucket = TokenBucket(rate=0, capacity=0)
+        start = time.monotonic()
+        for _ in range(100):
+            await bucket.acquire(10)
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) < 0.01
+
+
+def test_retry_after_seconds_parses_numbers_and_dates():
+    assert retry_after_seconds(response(429, "2.5")) == 2.5
+    assert retry_after_seconds(response(429, "-3")) == 0.0
+    assert retry_after_seconds(response(429)) is None
+    assert retry_after_seconds(response(429, "soon")) is None
+
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= retry_after_seconds(response(429, retry_at)) <= 30
+    past = email.utils.formatdate(time.time() - 30, usegmt=True)
+    assert retry_after_seconds(response(429, past)) == 0.0
+
+
+def test_scheduler_retries_retryable_responses_and_pauses_provider():
+    async def main():
+        scheduler = LlmScheduler(
+            max_concurrency=2, max_retries=3, backoff_base=0.001, backoff_max=0.01,
+            default_rps=0, default_tpm=0, provider_limits={},
+        )
+        responses = [response(429, "0"), response(503), response(200)]
+
+        async def send():
+            return responses.pop(0)
+
+        result = await scheduler.request("owner", "https://api.example.com/v1", 0, send)
+        return result, responses, scheduler.slots.active
+
+    result, remaining, active = asyncio.run(main())
+    assert result.status_code == 200
+    assert remaining == []
+    assert active == 0
+
+
+def test_scheduler_gives_up_after_max_retries():
+    async def main():
+        scheduler = LlmScheduler(
+            max_concurrency=1, max_retries=1, backoff_base=0.001, backoff_max=0.01,
+            default_rps=0, default_tpm=0, provider_limits={},
+        )
+        calls = []
+
+        async def send():
+            calls.append(None)
+            return response(502)
+
+        result = await scheduler.request("owner", "https://api.example.com", 0, send)
+        return result, len(calls)
+
+    result, calls = asyncio.run(main())
+    assert result.status_code == 502
+    assert calls == 2
+
+
+def test_scheduler_keeps_one_limiter_per_provider_host():
+    scheduler = LlmScheduler(
+        max_concurrency=1, max_retries=0, backoff_base=1, backoff_max=1,
+        default_rps=1, default_tpm=600, provider_limits={"api.example.com": {"rps": 5}},
+    )
+    limiter = scheduler.provider("https://api.example.com/v1")
+    assert scheduler.provider("https://api.example.com/v2") is limiter
+    assert limiter.requests.rate == 5.0
+    assert limiter.tokens.rate == 10.0
+    assert scheduler.provider("https://other.example.com").requests.rate == 1.0
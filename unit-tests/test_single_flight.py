@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_task():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def fetch():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        return results, len(calls), len(flight)
+
+    results, calls, in_flight = asyncio.run(main())
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert in_flight == 0
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def fetch(value):
+            await asyncio.sleep(0)
+            return value
+
+        return await asyncio.gather(flight.do("a", lambda: fetch(1)), flight.do("b", lambda: fetch(2)))
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def fetch():
+            await asyncio.sleep(0)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_leader_leaves_the_task_running_for_other_waiters():
+    async def main():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch():
+            calls.append(None)
+            await release.wait()
+            return "result"
+
+        leader = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        release.set()
+        return leader.cancelled(), await follower, len(calls)
+
+    leader_cancelled, result, calls = asyncio.run(main())
+    assert leader_cancelled
+    assert result == "result"
+    assert calls == 1
+
+
+def test_shared_task_is_cancelled_when_the_last_waiter_leaves():
+    async def main():
+        flight = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return len(flight)
+
+    assert asyncio.run(main()) == 0
+
+
+def test_call_after_abandoned_flight_starts_afresh():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def fetch():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        first = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await flight.do("key", fetch)
+
+    assert asyncio.run(main()) == 2
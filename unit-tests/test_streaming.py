@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from app import settings
+from app.streaming import EncodedEvent, ndjson_frames
+
+TOKEN = EncodedEvent('{"token":"abc"}')
+TOKEN_BYTES = len(TOKEN) + 1
+
+
+@pytest.fixture(autouse=True)
+def coalesce_limits(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_COALESCE_MAX_MS", 1000)
+    monkeypatch.setattr(settings, "STREAM_COALESCE_MAX_BYTES", 65536)
+
+
+async def tokens(count: int, delay: float = 0.0, closed: list = None):
+    try:
+        for _ in range(count):
+            if delay:
+                await asyncio.sleep(delay)
+            yield TOKEN
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def frames_of(events, coalesce_ms=0, coalesce_bytes=0):
+    return [frame async for frame in ndjson_frames(events, coalesce_ms, coalesce_bytes)]
+
+
+def lines(frames):
+    return [json.loads(line) for frame in frames for line in frame.splitlines()]
+
+
+def test_without_coalescing_every_event_is_its_own_frame():
+    async def events():
+        yield TOKEN
+        yield {"event": "timings"}
+
+    frames = asyncio.run(frames_of(events()))
+    assert frames == [TOKEN.encode() + b"\n", b'{"event":"timings"}\n']
+
+
+def test_frames_flush_at_the_byte_limit():
+    frames = asyncio.run(frames_of(tokens(10), coalesce_ms=1000, coalesce_bytes=TOKEN_BYTES * 4))
+    assert [len(frame) // TOKEN_BYTES for frame in frames] == [4, 4, 2]
+    assert lines(frames) == [{"token": "abc"}] * 10
+
+
+def test_frames_flush_when_the_window_closes_on_an_idle_stream():
+    async def main():
+        async def events():
+            yield TOKEN
+            yield TOKEN
+            # Quiet for longer than the window with lines buffered
+            await asyncio.sleep(0.1)
+            yield TOKEN
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        timed = []
+        async for frame in ndjson_frames(events(), coalesce_ms=20):
+            timed.append((loop.time() - start, frame))
+        return timed
+
+    timed = asyncio.run(main())
+    assert [len(frame) // TOKEN_BYTES for _, frame in timed] == [2, 1]
+    assert timed[0][0] < 0.09
+
+
+def test_frames_flush_on_each_event_past_the_window():
+    frames = asyncio.run(frames_of(tokens(6, delay=0.015), coalesce_ms=20))
+    assert 2 <= len(frames) < 6
+    assert len(lines(frames)) == 6
+
+
+def test_gateway_events_flush_immediately():
+    async def events():
+        yield TOKEN
+        yield {"event": "file_edit_start"}
+        yield TOKEN
+
+    frames = asyncio.run(frames_of(events(), coalesce_ms=1000))
+    assert lines(frames[:1]) == [{"token": "abc"}, {"event": "file_edit_start"}]
+    assert lines(frames[1:]) == [{"token": "abc"}]
+
+
+def test_upstream_error_is_raised_after_buffered_lines():
+    async def events():
+        yield TOKEN
+        raise RuntimeError("upstream failed")
+
+    async def main():
+        frames = []
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            async for frame in ndjson_frames(events(), coalesce_ms=1000):
+                frames.append(frame)
+        return frames
+
+    assert lines(asyncio.run(main())) == [{"token": "abc"}]
+
+
+def test_disconnect_closes_the_upstream_events():
+    async def main():
+        closed = []
+        frames = ndjson_frames(tokens(1000, delay=0.001, closed=closed), coalesce_ms=1000, coalesce_bytes=TOKEN_BYTES * 2)
+        await frames.__anext__()
+        # The client went away: the response closes the frame generator
+        await frames.aclose()
+        await asyncio.sleep(0.01)
+        return closed, len(asyncio.all_tasks())
+
+    closed, tasks = asyncio.run(main())
+    assert closed == [True]
+    assert tasks == 1
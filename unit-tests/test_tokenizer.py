@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+import pytest
+
+from app import settings, tokenizer
+from app.tokenizer import (
+    EstimateTokenizer,
+    TokenIndex,
+    Tokenizer,
+    blob_oid,
+    count_offloaded,
+    counts_exactly,
+    get_tokenizer,
+    known_model_encoding,
+)
+
+
+class FakeTiktoken(Tokenizer):
+    def __init__(self, encoding_name: str):
+        self.name = f"tiktoken:{encoding_name}"
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+class CountingTokenizer(Tokenizer):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+        self.threads = set()
+
+    def count(self, text: str) -> int:
+        self.calls += 1
+        self.threads.add(threading.get_ident())
+        return len(text)
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizers(monkeypatch):
+    """Resolve tokenizers without downloading encodings or reading a local model."""
+    monkeypatch.setattr(settings, "TOKENIZER_MODE", "exact")
+    monkeypatch.setattr(tokenizer, "_load_tiktoken", FakeTiktoken)
+    monkeypatch.setattr(tokenizer, "_load_local_tokenizer", lambda path: None)
+    get_tokenizer.cache_clear()
+    yield
+    get_tokenizer.cache_clear()
+
+
+def test_known_model_encodings():
+    assert known_model_encoding("gpt-4o-mini") == "o200k_base"
+    assert known_model_encoding("openai/gpt-4.1") == "o200k_base"
+    assert known_model_encoding("gpt-4.5-preview") == "o200k_base"
+    assert known_model_encoding("o1-mini") == "o200k_base"
+    assert known_model_encoding("o4-mini") == "o200k_base"
+    assert known_model_encoding("gpt-4-turbo") == "cl100k_base"
+    assert known_model_encoding("gpt-3.5-turbo") == "cl100k_base"
+    assert known_model_encoding("anthropic/claude-3.7-sonnet") is None
+    assert known_model_encoding("gpt-4x") is None
+    assert known_model_encoding(None) is None
+
+
+def test_get_tokenizer_uses_the_model_encoding_or_a_fallback():
+    assert get_tokenizer("gpt-4o").name == "tiktoken:o200k_base"
+    assert get_tokenizer("gpt-4").name == "tiktoken:cl100k_base"
+    # Without a local tokenizer, other models are estimated with cl100k_base
+    assert get_tokenizer("claude-3.7-sonnet").name == "tiktoken:cl100k_base"
+    assert isinstance(get_tokenizer("gpt-4o", "estimate"), EstimateTokenizer)
+
+
+def test_get_tokenizer_falls_back_to_the_estimate_when_nothing_loads(monkeypatch):
+    monkeypatch.setattr(tokenizer, "_load_tiktoken", lambda encoding: None)
+    assert isinstance(get_tokenizer("gpt-4o"), EstimateTokenizer)
+
+
+def test_only_known_models_count_exactly(monkeypatch):
+    assert counts_exactly("gpt-4o")
+    assert not counts_exactly("claude-3.7-sonnet")
+    assert not counts_exactly("gemini-2.0-flash")
+
+    monkeypatch.setattr(settings, "TOKENIZER_MODE", "estimate")
+    get_tokenizer.cache_clear()
+    assert not counts_exactly("gpt-4o")
+
+
+def test_blob_oid_matches_git_hash_object():
+    # git hash-object of "hello\n"
+    assert blob_oid("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_token_index_reuses_counts_of_unchanged_files():
+    async def main():
+        counter = CountingTokenizer()
+        index = TokenIndex(100)
+        await index.count(counter, "project", "a.py", "print('a')")
+        await index.count(counter, "project", "a.py", "print('a')")
+        # Changed content has a new blob oid and is counted again
+        await index.count(counter, "project", "a.py", "print('b')")
+        # So is the same content under another path or project
+        await index.count(counter, "project", "b.py", "print('a')")
+        await index.count(counter, "other", "a.py", "print('a')")
+        return counter.calls, index.hits, index.misses
+
+    assert asyncio.run(main()) == (4, 1, 4)
+
+
+def test_token_index_keys_counts_by_tokenizer():
+    async def main():
+        first, second = CountingTokenizer(), EstimateTokenizer()
+        index = TokenIndex(100)
+        counts = [
+            await index.count(first, "project", "a.py", "x" * 40),
+            await index.count(second, "project", "a.py", "x" * 40),
+        ]
+        return counts, index.misses
+
+    assert asyncio.run(main()) == ([40, 11], 2)
+
+
+def test_large_texts_are_tokenized_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(settings, "TOKENIZE_OFFLOAD_CHARS", 100)
+
+    async def main():
+        counter = CountingTokenizer()
+        await count_offloaded(counter, "x" * 10)
+        small = set(counter.threads)
+        counter.threads.clear()
+        await count_offloaded(counter, "x" * 1000)
+        return small, counter.threads
+
+    small, large = asyncio.run(main())
+    assert small == {threading.get_ident()}
+    assert threading.get_ident() not in large